@@ -1,13 +1,158 @@
 import os
+import threading
+import time
+from contextlib import contextmanager
+
+from fastapi import HTTPException
 import psycopg2
-from psycopg2.extras import RealDictCursor
-
-def get_db_connection():
-    conn = psycopg2.connect(
-        host=os.getenv("PGHOST", "repo-db-1"),
-        port=os.getenv("PGPORT", "5432"),
-        dbname=os.getenv("PGDATABASE", "hslbussit"),
-        user=os.getenv("PGUSER", "postgres"),
-        password=os.getenv("PGPASSWORD", "your_db_password")
-    )
-    return conn
\ No newline at end of file
+from psycopg2 import extensions
+from psycopg2.pool import ThreadedConnectionPool
+
+DB_HOST = os.getenv("PGHOST", "db")
+DB_PORT = os.getenv("PGPORT", "5432")
+DB_NAME = os.getenv("PGDATABASE", "hslbussit")
+DB_USER = os.getenv("PGUSER", "postgres")
+DB_PASS = os.getenv("PGPASSWORD", "supersecurepassword")
+
+POOL_MIN = int(os.getenv("DB_POOL_MIN", "4"))
+POOL_MAX = int(os.getenv("DB_POOL_MAX", "10"))
+POOL_TIMEOUT = float(os.getenv("DB_POOL_TIMEOUT", "5"))
+
+
+class PoolTimeout(Exception):
+    pass
+
+
+class _LazyThreadedPool(ThreadedConnectionPool):
+    # psycopg2 keeps up to `minconn` idle connections but also opens them all
+    # in __init__; open them on demand instead so the API starts without a DB.
+    def __init__(self, minconn, maxconn, *args, **kwargs):
+        super().__init__(0, maxconn, *args, **kwargs)
+        self.minconn = minconn
+
+
+class ConnectionPool:
+    """
+    Thread-safe psycopg2 pool shared by all routes.
+
+    psycopg2's ThreadedConnectionPool raises immediately when every connection
+    is checked out; this wrapper makes callers wait up to `timeout` seconds for
+    a free connection instead, and keeps counters for the pool stats endpoint.
+    """
+
+    def __init__(self, minconn, maxconn, timeout, **connect_kwargs):
+        self.maxconn = maxconn
+        self.timeout = timeout
+        self._pool = _LazyThreadedPool(minconn, maxconn, **connect_kwargs)
+        self._slots = threading.BoundedSemaphore(maxconn)
+        self._lock = threading.Lock()
+
+        self.in_use = 0
+        self.acquired = 0
+        self.timeouts = 0
+        self.discarded = 0
+        self.wait_seconds_total = 0.0
+        self.wait_seconds_max = 0.0
+
+    def getconn(self):
+        started = time.monotonic()
+        if not self._slots.acquire(timeout=self.timeout):
+            with self._lock:
+                self.timeouts += 1
+            raise PoolTimeout(f"No database connection available within {self.timeout}s")
+        try:
+            conn = self._pool.getconn()
+            if conn.closed:
+                self._pool.putconn(conn, close=True)
+                conn = self._pool.getconn()
+        except Exception:
+            self._slots.release()
+            raise
+
+        waited = time.monotonic() - started
+        with self._lock:
+            self.in_use += 1
+            self.acquired += 1
+            self.wait_seconds_total += waited
+            self.wait_seconds_max = max(self.wait_seconds_max, waited)
+        return conn
+
+    def putconn(self, conn):
+        # The underlying pool rolls back open transactions and drops dead connections
+        close = bool(conn.closed) or conn.info.transaction_status == extensions.TRANSACTION_STATUS_UNKNOWN
+        try:
+            self._pool.putconn(conn, close=close)
+        finally:
+            with self._lock:
+                self.in_use -= 1
+                if close:
+                    self.discarded += 1
+            self._slots.release()
+
+    @contextmanager
+    def connection(self):
+        conn = self.getconn()
+        try:
+            yield conn
+        finally:
+            self.putconn(conn)
+
+    def stats(self):
+        with self._lock:
+            return {
+                "size": self.maxconn,
+                "in_use": self.in_use,
+                "idle": len(self._pool._pool),
+                "acquired": self.acquired,
+                "timeouts": self.timeouts,
+                "discarded": self.discarded,
+                "wait_seconds_avg": self.wait_seconds_total / self.acquired if self.acquired else 0.0,
+                "wait_seconds_max": self.wait_seconds_max,
+            }
+
+    def close(self):
+        self._pool.closeall()
+
+
+pool = None
+
+
+def init_pool():
+    global pool
+    if pool is None:
+        pool = ConnectionPool(
+            POOL_MIN, POOL_MAX, POOL_TIMEOUT,
+            host=DB_HOST, port=DB_PORT, dbname=DB_NAME,
+            user=DB_USER, password=DB_PASS,
+        )
+    return pool
+
+
+def close_pool():
+    global pool
+    if pool is not None:
+        pool.close()
+        pool = None
+
+
+@contextmanager
+def request_connection():
+    """
+    A pooled connection, or a 503 when none is available. get_db wraps it for
+    whole requests; routes that only need a connection on some paths (cache
+    misses, streams) use it directly.
+    """
+    try:
+        conn = pool.getconn()
+    except (PoolTimeout, psycopg2.OperationalError) as e:
+        raise HTTPException(status_code=503, detail=str(e))
+    try:
+        yield conn
+    finally:
+        pool.putconn(conn)
+
+
+def get_db():
+    """FastAPI dependency yielding a pooled connection for the duration of a request."""
+    with request_connection() as conn:
+        yield conn
@@ -0,0 +1,109 @@
+import select
+import logging
+import threading
+
+import psycopg2
+from psycopg2 import extensions
+
+from api import db
+
+logger = logging.getLogger(__name__)
+
+CHANNEL = "gtfs_feed_version"
+LATEST_SQL = "SELECT max(id) FROM gtfs_feed_version"
+
+
+class FeedVersionWatcher:
+    """
+    Tracks the id of the latest applied GTFS feed (gtfs_feed_version, written
+    by gtfs_static) so caches of static data can be keyed on it.
+
+    A dedicated connection LISTENs for the gtfs_static pg_notify and re-reads
+    the latest id every `poll_interval` seconds as a fallback, also after a
+    reconnect, so a notification missed while disconnected is still noticed.
+    Callbacks added with `subscribe()` run on the watcher thread.
+    """
+
+    def __init__(self, poll_interval=60.0):
+        self.poll_interval = poll_interval
+        self.current = None
+        self._callbacks = []
+        self._stop = threading.Event()
+        self._thread = None
+
+    def subscribe(self, callback):
+        """Call `callback(version)` whenever a new feed version is seen."""
+        self._callbacks.append(callback)
+
+    def start(self):
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="feed-version", daemon=True)
+        self._thread.start()
+
+    def stop(self, timeout=5.0):
+        self._stop.set()
+        if self._thread:
+            self._thread.join(timeout)
+            self._thread = None
+
+    def _connect(self):
+        conn = psycopg2.connect(
+            host=db.DB_HOST, port=db.DB_PORT, dbname=db.DB_NAME,
+            user=db.DB_USER, password=db.DB_PASS,
+        )
+        conn.set_isolation_level(extensions.ISOLATION_LEVEL_AUTOCOMMIT)
+        with conn.cursor() as cur:
+            cur.execute(f"LISTEN {CHANNEL}")
+        return conn
+
+    def _refresh(self, conn):
+        with conn.cursor() as cur:
+            try:
+                cur.execute(LATEST_SQL)
+                version = cur.fetchone()[0]
+            except psycopg2.errors.UndefinedTable:
+                version = None  # no GTFS import has run yet
+        self._set(version)
+
+    def _set(self, version):
+        if version is None or version == self.current:
+            return
+        previous, self.current = self.current, version
+        logger.info(f"GTFS feed version {previous} -> {version}")
+        for callback in self._callbacks:
+            try:
+                callback(version)
+            except Exception as e:
+                logger.error(f"Feed version callback failed: {e}")
+
+    def _run(self):
+        delay = 1.0
+        while not self._stop.is_set():
+            conn = None
+            try:
+                conn = self._connect()
+                self._refresh(conn)
+                delay = 1.0
+                waited = 0.0
+                while not self._stop.is_set():
+                    # Short select timeout so stop() is noticed promptly
+                    if select.select([conn], [], [], 1.0)[0]:
+                        conn.poll()
+                        if conn.notifies:
+                            conn.notifies.clear()
+                            self._refresh(conn)
+                    else:
+                        waited += 1.0
+                        if waited >= self.poll_interval:
+                            waited = 0.0
+                            self._refresh(conn)
+            except psycopg2.Error as e:
+                logger.error(f"Feed version watcher: {e}, reconnecting in {delay:.0f}s")
+                self._stop.wait(delay)
+                delay = min(delay * 2, 30.0)
+            finally:
+                if conn is not None:
+                    conn.close()
+
+
+watcher = FeedVersionWatcher()
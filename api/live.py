@@ -0,0 +1,330 @@
+import os
+import json
+import time
+import asyncio
+import logging
+from datetime import datetime
+
+from starlette.concurrency import run_in_threadpool
+
+from api import db, vehicle_store
+from api.spatial import GridIndex
+
+logger = logging.getLogger(__name__)
+
+WS_INTERVAL = float(os.getenv("WS_INTERVAL", "1.0"))
+WS_CLIENT_QUEUE = int(os.getenv("WS_CLIENT_QUEUE", "2"))
+WS_SEND_TIMEOUT = float(os.getenv("WS_SEND_TIMEOUT", "10"))
+WS_KEYFRAME_EVERY = int(os.getenv("WS_KEYFRAME_EVERY", "30"))
+DELTA_HISTORY = int(os.getenv("DELTA_HISTORY", "300"))
+DELTA_KEEPALIVE = float(os.getenv("DELTA_KEEPALIVE", "60"))
+
+# Served from the vehicle_latest view over the mqtt_hfp_vehicle_1m continuous
+# aggregate (see init_timescale.sql) instead of a window query over mqtt_hfp
+LATEST_VEHICLES_SQL = """
+SELECT
+  concat_ws('/', oper, veh) AS vehicle_id,
+  desi      AS label,
+  lat,
+  long      AS lon,
+  spd       AS speed,
+  tst       AS timestamp,
+  route,
+  oper      AS operator
+FROM vehicle_latest;
+"""
+
+
+def fetch_latest_vehicles(conn):
+    """Latest position of every vehicle seen in the last 10 minutes."""
+    cur = conn.cursor()
+    try:
+        cur.execute(LATEST_VEHICLES_SQL)
+        cols = [desc[0] for desc in cur.description]
+        return [dict(zip(cols, row)) for row in cur.fetchall()]
+    finally:
+        cur.close()
+
+
+def _json_default(value):
+    if isinstance(value, datetime):
+        return value.isoformat()
+    return str(value)
+
+
+def encode(payload):
+    return json.dumps(payload, default=_json_default, separators=(",", ":"))
+
+
+def _moved(prev, current):
+    # Timestamp-only refreshes of a parked bus are not worth a delta entry;
+    # they are picked up by the next keyframe.
+    return (
+        prev["lat"] != current["lat"]
+        or prev["lon"] != current["lon"]
+        or prev["speed"] != current["speed"]
+        or prev["label"] != current["label"]
+        # Filters select on these, so a change must show up in filtered deltas
+        or prev.get("route") != current.get("route")
+        or prev.get("operator") != current.get("operator")
+    )
+
+
+class DeltaTracker:
+    """
+    Keeps the last snapshot and, per vehicle, the sequence number at which it
+    last changed or dropped out, so a client that saw sequence N can be sent
+    only what changed after N.
+
+    Clients too far behind (more than `history` ticks) or with an unknown
+    sequence get a keyframe instead. Sequences start from the wall clock in
+    milliseconds, so a sequence from before an API restart is always too old
+    rather than silently valid against different state.
+
+    Each snapshot is also indexed in a GridIndex, and keyframes and deltas
+    can be narrowed to a VehicleFilter (see api/spatial.py).
+    """
+
+    def __init__(self, history=DELTA_HISTORY):
+        self.history = history
+        self.seq = int(time.time() * 1000)
+        self.vehicles = {}
+        self.previous = {}
+        self.index = GridIndex()
+        self._changed = {}
+        self._removed = {}
+
+    def apply(self, snapshot):
+        self.seq += 1
+        seq = self.seq
+        current = {}
+        for vehicle in snapshot:
+            vid = vehicle["vehicle_id"]
+            current[vid] = vehicle
+            prev = self.vehicles.get(vid)
+            if prev is None or _moved(prev, vehicle):
+                self._changed[vid] = seq
+            self._removed.pop(vid, None)
+
+        for vid in self.vehicles.keys() - current.keys():
+            self._removed[vid] = seq
+            self._changed.pop(vid, None)
+
+        horizon = seq - self.history
+        for vid in [vid for vid, removed_at in self._removed.items() if removed_at <= horizon]:
+            del self._removed[vid]
+        self.previous = self.vehicles
+        self.vehicles = current
+        self.index = GridIndex(current.values())
+        return seq
+
+    def keyframe(self, vehicle_filter=None):
+        return {"type": "keyframe", "seq": self.seq, "vehicles": self.index.query(vehicle_filter), "removed": []}
+
+    def delta(self, since, vehicle_filter=None):
+        if since is None or since > self.seq or since < self.seq - self.history:
+            return self.keyframe(vehicle_filter)
+        if vehicle_filter is not None:
+            return self._filtered_delta(since, vehicle_filter)
+        return {
+            "type": "delta",
+            "seq": self.seq,
+            "vehicles": [self.vehicles[vid] for vid, changed_at in self._changed.items() if changed_at > since],
+            "removed": [vid for vid, removed_at in self._removed.items() if removed_at > since],
+        }
+
+    def _filtered_delta(self, since, vehicle_filter):
+        """
+        A vehicle that moved out of the filter must be sent as removed, which
+        needs its state as of `since`. Only the previous snapshot is kept, so
+        for older sequences every vehicle that changed or dropped out after
+        `since` and does not match now is listed under "removed": a superset
+        the client resolves by ignoring ids it does not have. A vehicle that
+        did not change since then matches exactly as it did.
+        """
+        matches = vehicle_filter.matches
+        exact = since == self.seq - 1
+
+        def matched_before(vid):
+            return not exact or (vid in self.previous and matches(self.previous[vid]))
+
+        vehicles, removed = [], []
+        for vid, changed_at in self._changed.items():
+            if changed_at <= since:
+                continue
+            vehicle = self.vehicles[vid]
+            if matches(vehicle):
+                vehicles.append(vehicle)
+            elif matched_before(vid):
+                removed.append(vid)
+        for vid, removed_at in self._removed.items():
+            if removed_at > since and matched_before(vid):
+                removed.append(vid)
+        return {"type": "delta", "seq": self.seq, "vehicles": vehicles, "removed": removed}
+
+
+class StreamClient:
+    """
+    One connected WebSocket. Messages are queued by the broadcaster and sent
+    by this client's own task, so a slow browser only ever delays itself.
+
+    In "full" mode each message is a complete snapshot and the oldest pending
+    one is simply replaced when the queue is full. In "delta" mode a dropped
+    message would leave the client inconsistent, so the queue is cleared and
+    the client is flagged to receive a keyframe on the next tick.
+
+    With a `vehicle_filter` the client only receives the vehicles it matches.
+    """
+
+    def __init__(self, websocket, mode="full", maxsize=WS_CLIENT_QUEUE, vehicle_filter=None):
+        self.websocket = websocket
+        self.mode = mode
+        self.vehicle_filter = vehicle_filter
+        self.needs_keyframe = mode == "delta"
+        self.queue = asyncio.Queue(maxsize=maxsize)
+        self.dropped = 0
+
+    def offer(self, message):
+        if self.queue.full():
+            self.dropped += 1
+            if self.mode == "delta":
+                while not self.queue.empty():
+                    self.queue.get_nowait()
+                self.needs_keyframe = True
+                return
+            self.queue.get_nowait()
+        self.queue.put_nowait(message)
+
+    async def send_forever(self):
+        while True:
+            message = await self.queue.get()
+            await asyncio.wait_for(self.websocket.send_text(message), WS_SEND_TIMEOUT)
+
+
+class VehicleBroadcaster:
+    """
+    Computes the latest-position snapshot once per tick and fans the encoded
+    message out to every connected client, so database cost does not grow
+    with the number of open browsers. Ticks are skipped while nobody listens.
+    """
+
+    def __init__(self, interval=WS_INTERVAL, keyframe_every=WS_KEYFRAME_EVERY):
+        self.interval = interval
+        self.keyframe_every = keyframe_every
+        self.clients = set()
+        self.tracker = DeltaTracker()
+        self.last_message = None
+        self.ticks = 0
+        self._task = None
+        self._rest_until = 0.0
+
+    def start(self):
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    def register(self, websocket, mode="full", vehicle_filter=None):
+        client = StreamClient(websocket, mode, vehicle_filter=vehicle_filter)
+        if self.last_message is not None:
+            if mode == "delta":
+                client.offer(encode(self.tracker.keyframe(vehicle_filter)))
+                client.needs_keyframe = False
+            elif vehicle_filter is not None:
+                client.offer(encode(self.tracker.index.query(vehicle_filter)))
+            else:
+                client.offer(self.last_message)
+        self.clients.add(client)
+        return client
+
+    def unregister(self, client):
+        self.clients.discard(client)
+
+    async def snapshot(self):
+        if vehicle_store.subscriber is not None:
+            return vehicle_store.store.snapshot()
+
+        def query():
+            with db.pool.connection() as conn:
+                return fetch_latest_vehicles(conn)
+        return await run_in_threadpool(query)
+
+    async def tick(self):
+        vehicles = await self.snapshot()
+        self.tracker.apply(vehicles)
+        self.ticks += 1
+        self.last_message = encode(vehicles)
+
+        # Each message kind is encoded at most once per tick and filter, however many clients share it
+        keyframe_due = self.ticks % self.keyframe_every == 0
+        encoded = {("full", None): self.last_message}
+        for client in list(self.clients):
+            if client.mode == "full":
+                kind = "full"
+            elif keyframe_due or client.needs_keyframe:
+                kind = "keyframe"
+                client.needs_keyframe = False
+            else:
+                kind = "delta"
+            vehicle_filter = client.vehicle_filter
+            key = (kind, vehicle_filter.key if vehicle_filter is not None else None)
+            message = encoded.get(key)
+            if message is None:
+                message = encoded[key] = encode(self.message(kind, vehicle_filter))
+            client.offer(message)
+
+    def message(self, kind, vehicle_filter=None):
+        if kind == "full":
+            return self.tracker.index.query(vehicle_filter)
+        if kind == "keyframe":
+            return self.tracker.keyframe(vehicle_filter)
+        return self.tracker.delta(self.tracker.seq - 1, vehicle_filter)
+
+    async def _fresh(self):
+        """Bring the snapshot up to date for REST clients and keep the tick loop running while they poll."""
+        loop = asyncio.get_running_loop()
+        if not self._active(loop):
+            await self.tick()
+        self._rest_until = loop.time() + DELTA_KEEPALIVE
+
+    async def delta(self, since, vehicle_filter=None):
+        """Changes since `since` for REST clients; keeps the tick loop running while they poll."""
+        await self._fresh()
+        return self.tracker.delta(since, vehicle_filter)
+
+    async def vehicles(self, vehicle_filter):
+        """Vehicles matching `vehicle_filter`, answered from the grid index of the current tick."""
+        await self._fresh()
+        return self.tracker.index.query(vehicle_filter)
+
+    def _active(self, loop):
+        return bool(self.clients) or loop.time() < self._rest_until
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        next_tick = loop.time()
+        while True:
+            if self._active(loop):
+                try:
+                    await self.tick()
+                except Exception as e:
+                    logger.error(f"Vehicle broadcast failed: {e}")
+            else:
+                # Don't greet the next client with a snapshot from before the idle period
+                self.last_message = None
+            # Fixed rate: the query time is not added on top of the interval
+            next_tick += self.interval
+            delay = next_tick - loop.time()
+            if delay < 0:
+                next_tick = loop.time()
+                delay = 0
+            await asyncio.sleep(delay)
+
+
+broadcaster = VehicleBroadcaster()
@@ -1,5 +1,15 @@
-from fastapi import FastAPI
+from contextlib import asynccontextmanager
+
+from fastapi import FastAPI, Response
 from fastapi.middleware.cors import CORSMiddleware  # <--- ADD THIS
+from prometheus_client import CONTENT_TYPE_LATEST, REGISTRY, generate_latest
+
+from api import db, metrics, vehicle_store
+from api.feed_version import watcher as feed_version
+from api.live import broadcaster
+from api.static_cache import cache as static_cache
+from api.stop_index import stop_index
+from api.tiles import stop_tiles
 
 # Import routers from all route modules
 from api.routes import (
@@ -12,16 +22,36 @@ from api.routes import (
     feed_info,
     routes,
     stops,
+    tiles,
     transfers,
     trips,
     vehicle_positions,
     vehicles,
+    ws,
 )
 
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    db.init_pool()
+    feed_version.subscribe(stop_tiles.invalidate)
+    feed_version.subscribe(static_cache.clear)
+    feed_version.subscribe(stop_index.rebuild)
+    feed_version.start()
+    if vehicle_store.subscriber:
+        vehicle_store.subscriber.start()
+    broadcaster.start()
+    yield
+    await broadcaster.stop()
+    if vehicle_store.subscriber:
+        vehicle_store.subscriber.stop()
+    feed_version.stop()
+    db.close_pool()
+
 app = FastAPI(
     title="HSL Bus API",
     description="API for Helsinki Regional Transport data",
     version="0.1.0",
+    lifespan=lifespan,
 )
 
 # --- ADD THIS BLOCK ---
@@ -31,9 +61,14 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["Link"],  # next-page links of /trips, /stops and /calendar
 )
 # ----------------------
 
+# Per-route request latency for /metrics
+app.add_middleware(metrics.RequestTimer)
+REGISTRY.register(metrics.LiveCollector())
+
 # Include all routers
 app.include_router(agency.router)
 app.include_router(alerts.router)
@@ -44,10 +79,29 @@ app.include_router(fare_rules.router)
 app.include_router(feed_info.router)
 app.include_router(routes.router)
 app.include_router(stops.router)
+app.include_router(tiles.router)
 app.include_router(transfers.router)
 app.include_router(trips.router)
 app.include_router(vehicle_positions.router)
 app.include_router(vehicles.router)
+app.include_router(ws.router)
+
+@app.get("/health")
+def health():
+    return {
+        "status": "ok",
+        "db_pool": db.pool.stats(),
+        "vehicle_source": vehicle_store.VEHICLE_SOURCE,
+        "vehicle_store": {
+            "vehicles": len(vehicle_store.store),
+            "updates": vehicle_store.store.updates,
+            "evicted": vehicle_store.store.evicted,
+        },
+    }
+
+@app.get("/metrics", include_in_schema=False)
+def prometheus_metrics():
+    return Response(generate_latest(REGISTRY), media_type=CONTENT_TYPE_LATEST)
 
 if __name__ == "__main__":
     import uvicorn
@@ -0,0 +1,97 @@
+"""
+Prometheus metrics for the API, served at /metrics.
+
+Request latency is recorded per route template (`/trips/{trip_id}`, not the
+concrete path) so the label set stays bounded. Everything else is read from
+the existing counters (db.pool.stats(), the vehicle store, the broadcaster)
+at scrape time.
+"""
+import time
+from datetime import datetime, timezone
+
+from prometheus_client import Histogram
+from prometheus_client.core import CounterMetricFamily, GaugeMetricFamily
+
+from api import db, vehicle_store
+from api.live import broadcaster
+from api.static_cache import cache as static_cache
+
+REQUEST_SECONDS = Histogram(
+    "api_request_duration_seconds", "HTTP request latency until the response is sent",
+    ["method", "route", "status"],
+    buckets=(0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10),
+)
+
+POOL_GAUGES = ("size", "in_use", "idle", "wait_seconds_avg", "wait_seconds_max")
+POOL_COUNTERS = ("acquired", "timeouts", "discarded")
+
+
+class RequestTimer:
+    """ASGI middleware observing REQUEST_SECONDS for every HTTP request."""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        status = 500
+        started = time.perf_counter()
+
+        async def send_status(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_status)
+        finally:
+            # The router stores the matched route in the shared scope
+            route = scope.get("route")
+            REQUEST_SECONDS.labels(
+                scope["method"], route.path if route is not None else "unmatched", str(status)
+            ).observe(time.perf_counter() - started)
+
+
+class LiveCollector:
+    """Connection pool, vehicle store and live stream state at scrape time."""
+
+    def collect(self):
+        if db.pool is not None:
+            stats = db.pool.stats()
+            for key in POOL_GAUGES:
+                yield GaugeMetricFamily(f"api_db_pool_{key}", f"Connection pool {key}", value=stats[key])
+            for key in POOL_COUNTERS:
+                yield CounterMetricFamily(f"api_db_pool_{key}", f"Connection pool {key}", value=stats[key])
+
+        cached = static_cache.stats()
+        yield GaugeMetricFamily("api_static_cache_bytes", "Bytes of cached static GTFS responses", value=cached["bytes"])
+        yield CounterMetricFamily("api_static_cache_hits", "Static GTFS responses served from cache", value=cached["hits"])
+        yield CounterMetricFamily("api_static_cache_misses", "Static GTFS responses rendered from the database",
+                                  value=cached["misses"])
+
+        store = vehicle_store.store
+        yield GaugeMetricFamily("api_vehicle_store_vehicles", "Vehicles in the in-memory store", value=len(store))
+        yield CounterMetricFamily("api_vehicle_store_updates", "Position updates applied", value=store.updates)
+        yield CounterMetricFamily("api_vehicle_store_evicted", "Stale vehicles evicted", value=store.evicted)
+
+        clients = list(broadcaster.clients)
+        yield GaugeMetricFamily("api_ws_clients", "Connected WebSocket clients", value=len(clients))
+        yield GaugeMetricFamily(
+            "api_ws_dropped_messages", "Messages dropped for slow clients, summed over connected clients",
+            value=sum(client.dropped for client in clients),
+        )
+        yield CounterMetricFamily("api_broadcast_ticks", "Live snapshot ticks", value=broadcaster.ticks)
+
+        newest = max((v["timestamp"] for v in broadcaster.tracker.vehicles.values() if v["timestamp"]), default=None)
+        if newest is not None:
+            if isinstance(newest, datetime) and newest.tzinfo is None:
+                newest = newest.replace(tzinfo=timezone.utc)
+            yield GaugeMetricFamily(
+                "api_vehicle_data_lag_seconds",
+                "Age of the newest position in the last live snapshot (ingest-to-visible lag)",
+                value=(datetime.now(timezone.utc) - newest).total_seconds(),
+            )
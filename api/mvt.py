@@ -0,0 +1,124 @@
+"""
+Minimal Mapbox Vector Tile (spec 2.1) encoder for point layers.
+
+Stops and vehicles are points, so this writes the protobuf wire format of
+vector_tile.proto directly instead of pulling in PostGIS (ST_AsMVT) or a
+geometry library.
+"""
+import math
+import struct
+
+EXTENT = 4096
+MAX_LAT = 85.0511287798
+CONTENT_TYPE = "application/vnd.mapbox-vector-tile"
+
+_POINT = 1
+_MOVE_TO_ONE = (1 & 0x7) | (1 << 3)
+_DOUBLE = struct.Struct("<d")
+
+
+def _varint(value):
+    out = bytearray()
+    while value > 0x7F:
+        out.append((value & 0x7F) | 0x80)
+        value >>= 7
+    out.append(value)
+    return bytes(out)
+
+
+def _zigzag(value):
+    return (value << 1) ^ (value >> 63)
+
+
+def _key(field, wire_type):
+    return _varint((field << 3) | wire_type)
+
+
+def _bytes_field(field, payload):
+    return _key(field, 2) + _varint(len(payload)) + payload
+
+
+def _value(value):
+    """Layer.Value message for a property value."""
+    if isinstance(value, bool):
+        return _key(7, 0) + _varint(int(value))
+    if isinstance(value, int):
+        if value >= 0:
+            return _key(5, 0) + _varint(value)
+        return _key(6, 0) + _varint(_zigzag(value))
+    if isinstance(value, float):
+        return _key(3, 1) + _DOUBLE.pack(value)
+    return _bytes_field(1, str(value).encode())
+
+
+def tile_bounds(z, x, y, buffer=0.0):
+    """(min_lon, min_lat, max_lon, max_lat) of a Web Mercator tile, grown by `buffer` tile widths."""
+    n = 2 ** z
+
+    def lon(tx):
+        return tx / n * 360.0 - 180.0
+
+    def lat(ty):
+        ty = min(max(ty, 0), n)
+        return math.degrees(math.atan(math.sinh(math.pi * (1 - 2 * ty / n))))
+
+    return lon(x - buffer), lat(y + 1 + buffer), lon(x + 1 + buffer), lat(y - buffer)
+
+
+class PointLayer:
+    """
+    Collects point features for one layer of tile z/x/y. Points are projected
+    to tile coordinates on `add()`; `encode()` returns the Layer message.
+    """
+
+    def __init__(self, name, z, x, y, extent=EXTENT):
+        self.name = name
+        self.extent = extent
+        self._n = 2 ** z
+        self._x = x
+        self._y = y
+        self._keys = {}
+        self._values = {}
+        self._features = []
+
+    def add(self, lon, lat, properties, feature_id=None):
+        n = self._n
+        tx = (lon + 180.0) / 360.0 * n
+        sin_lat = math.sin(math.radians(min(max(lat, -MAX_LAT), MAX_LAT)))
+        ty = (0.5 - math.log((1 + sin_lat) / (1 - sin_lat)) / (4 * math.pi)) * n
+        px = int(round((tx - self._x) * self.extent))
+        py = int(round((ty - self._y) * self.extent))
+
+        tags = []
+        for key, value in properties.items():
+            if value is None:
+                continue
+            tags.append(self._keys.setdefault(key, len(self._keys)))
+            # bool and int compare equal (True == 1), so the type is part of the key
+            tags.append(self._values.setdefault((type(value), value), len(self._values)))
+
+        feature = b""
+        if feature_id is not None:
+            feature += _key(1, 0) + _varint(feature_id)
+        if tags:
+            feature += _bytes_field(2, b"".join(_varint(t) for t in tags))
+        feature += _key(3, 0) + _varint(_POINT)
+        geometry = _varint(_MOVE_TO_ONE) + _varint(_zigzag(px)) + _varint(_zigzag(py))
+        feature += _bytes_field(4, geometry)
+        self._features.append(feature)
+
+    def __len__(self):
+        return len(self._features)
+
+    def encode(self):
+        layer = [_key(15, 0) + _varint(2), _bytes_field(1, self.name.encode())]
+        layer.extend(_bytes_field(2, feature) for feature in self._features)
+        layer.extend(_bytes_field(3, key.encode()) for key in self._keys)
+        layer.extend(_bytes_field(4, _value(value)) for _, value in self._values)
+        layer.append(_key(5, 0) + _varint(self.extent))
+        return b"".join(layer)
+
+
+def encode_tile(*layers):
+    """Tile message holding the non-empty `layers`; b"" when all are empty."""
+    return b"".join(_bytes_field(3, layer.encode()) for layer in layers if len(layer))
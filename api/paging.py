@@ -0,0 +1,136 @@
+"""
+Keyset pagination and streamed responses for the large GTFS tables.
+
+    /trips?limit=1000                       first 1000 trips by trip_id
+    /trips?limit=1000&after=<last trip_id>  the next 1000 (see the Link header)
+    /trips?route_id=1550&stream=true        every match, streamed from a server-side cursor
+
+Pages are ordered by the table's key and continue with `key > after`, so
+every page is an index range scan however deep into the table it is. A
+response with a full page carries `Link: <...>; rel="next"`. With
+`stream=true` rows are written to the response in STREAM_BATCH_ROWS chunks
+as they come off a named (server-side) cursor, so memory stays flat for any
+result size. Without `limit` or `stream` the whole result is returned as one
+list, as before. Non-streamed responses go through the feed version cache
+(static_cache.py).
+"""
+import os
+import logging
+import itertools
+from typing import Optional
+
+import psycopg2
+from fastapi import HTTPException, Query, Request
+from fastapi.responses import StreamingResponse
+
+from api.db import request_connection
+from api.live import encode
+from api.static_cache import cache
+
+logger = logging.getLogger(__name__)
+
+PAGE_MAX_LIMIT = int(os.getenv("PAGE_MAX_LIMIT", "10000"))
+STREAM_BATCH_ROWS = int(os.getenv("STREAM_BATCH_ROWS", "2000"))
+
+
+class Page:
+    """Common query parameters of the paged endpoints, used as `page: Page = Depends()`."""
+
+    def __init__(
+        self,
+        after: Optional[str] = None,
+        limit: Optional[int] = Query(None, ge=1, le=PAGE_MAX_LIMIT),
+        stream: bool = False,
+    ):
+        self.after = after
+        self.limit = limit
+        self.stream = stream
+
+
+class TableQuery:
+    """
+    SELECT `columns` FROM `table`, paged on the unique `key` column. `filters`
+    maps query parameter names to SQL conditions with one %s placeholder.
+    """
+
+    def __init__(self, table, columns, key, filters=None):
+        self.table = table
+        self.columns = columns
+        self.key = key
+        self.filters = filters or {}
+
+    def sql(self, values, after=None, limit=None):
+        conditions, params = [], []
+        for name, value in values.items():
+            if value is not None:
+                conditions.append(self.filters[name])
+                params.append(value)
+        if after is not None:
+            conditions.append(f"{self.key} > %s")
+            params.append(after)
+        sql = f"SELECT {', '.join(self.columns)} FROM {self.table}"
+        if conditions:
+            sql += " WHERE " + " AND ".join(conditions)
+        if after is not None or limit is not None:
+            sql += f" ORDER BY {self.key}"
+        if limit is not None:
+            sql += " LIMIT %s"
+            params.append(limit)
+        return sql, params
+
+    def row(self, row):
+        # encode() writes dates as ISO strings, like the per-route conversions did
+        return dict(zip(self.columns, row))
+
+
+def _stream(query, sql, params):
+    # Everything that can fail with a proper status (no connection, a bad
+    # query) happens up to the first yield, which paged_response pulls before
+    # the headers are sent. The generator then owns the connection until it
+    # is exhausted or closed.
+    with request_connection() as conn:
+        with conn.cursor(name=f"stream_{query.table}") as cur:
+            cur.itersize = STREAM_BATCH_ROWS
+            try:
+                cur.execute(sql, params)
+                rows = cur.fetchmany(STREAM_BATCH_ROWS)
+            except psycopg2.Error as e:
+                raise HTTPException(status_code=500, detail=str(e))
+            yield ("[" + ",".join(encode(query.row(row)) for row in rows)).encode()
+            try:
+                while rows:
+                    rows = cur.fetchmany(STREAM_BATCH_ROWS)
+                    if rows:
+                        yield ("," + ",".join(encode(query.row(row)) for row in rows)).encode()
+            except psycopg2.Error as e:
+                # Headers are already sent; the client sees a truncated body
+                logger.error(f"Streaming {query.table} failed: {e}")
+                raise
+            yield b"]"
+
+
+def paged_response(request: Request, query, values, page):
+    """Response for one paged endpoint: a page, a streamed result or the full list."""
+    sql, params = query.sql(values, page.after, page.limit)
+    if page.stream:
+        chunks = _stream(query, sql, params)
+        first = next(chunks)  # connection, query and first batch, while an error status can still be sent
+        return StreamingResponse(itertools.chain([first], chunks), media_type="application/json")
+
+    def render():
+        with request_connection() as conn:
+            try:
+                with conn.cursor() as cur:
+                    cur.execute(sql, params)
+                    rows = cur.fetchall()
+            except Exception as e:
+                raise HTTPException(status_code=500, detail=str(e))
+        headers = {}
+        if page.limit is not None and len(rows) == page.limit:
+            last = rows[-1][query.columns.index(query.key)]
+            # Relative, since the cached response is shared by every Host the API is reached under
+            following = request.url.include_query_params(after=last)
+            headers["Link"] = f'<{following.path}?{following.query}>; rel="next"'
+        return encode([query.row(row) for row in rows]).encode(), headers
+
+    return cache.respond(request, render)
@@ -1,22 +1,11 @@
 # api/routes/alerts.py
-from fastapi import APIRouter, HTTPException
-import psycopg2
-import os
+from fastapi import APIRouter, Depends, HTTPException
+from api.db import get_db
 
 router = APIRouter()
 
-def get_db_connection():
-    return psycopg2.connect(
-        host=os.getenv("PGHOST", "db"),
-        port=os.getenv("PGPORT", "5432"),
-        dbname=os.getenv("PGDATABASE", "hslbussit"),
-        user=os.getenv("PGUSER", "postgres"),
-        password=os.getenv("PGPASSWORD", "supersecurepassword"),
-    )
-
 @router.get("/alerts")
-def get_alerts():
-    conn = get_db_connection()
+def get_alerts(conn=Depends(get_db)):
     cur = conn.cursor()
     try:
         cur.execute("SELECT alert_id, header_text, description_text, active_start, active_end FROM alerts WHERE active_end > NOW();")
@@ -34,5 +23,4 @@ def get_alerts():
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
     finally:
-        cur.close()
-        conn.close()
\ No newline at end of file
+        cur.close()
\ No newline at end of file
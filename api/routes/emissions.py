@@ -1,22 +1,11 @@
 # api/routes/emissions.py
-from fastapi import APIRouter, HTTPException
-import psycopg2
-import os
+from fastapi import APIRouter, Depends, HTTPException
+from api.db import get_db
 
 router = APIRouter()
 
-def get_db_connection():
-    return psycopg2.connect(
-        host=os.getenv("PGHOST", "db"),
-        port=os.getenv("PGPORT", "5432"),
-        dbname=os.getenv("PGDATABASE", "hslbussit"),
-        user=os.getenv("PGUSER", "postgres"),
-        password=os.getenv("PGPASSWORD", "supersecurepassword"),
-    )
-
 @router.get("/emissions")
-def get_emissions():
-    conn = get_db_connection()
+def get_emissions(conn=Depends(get_db)):
     cur = conn.cursor()
     try:
         cur.execute("SELECT vehicle_id, emission_type, emission_value FROM emissions;")
@@ -32,5 +21,4 @@ def get_emissions():
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
     finally:
-        cur.close()
-        conn.close()
\ No newline at end of file
+        cur.close()
\ No newline at end of file
@@ -1,22 +1,14 @@
 # api/routes/fare_attributes.py
-from fastapi import APIRouter, HTTPException
-import psycopg2
-import os
+from fastapi import APIRouter, Request
+from api.static_cache import cached_json
 
 router = APIRouter()
 
-def get_db_connection():
-    return psycopg2.connect(
-        host=os.getenv("PGHOST", "db"),
-        port=os.getenv("PGPORT", "5432"),
-        dbname=os.getenv("PGDATABASE", "hslbussit"),
-        user=os.getenv("PGUSER", "postgres"),
-        password=os.getenv("PGPASSWORD", "supersecurepassword"),
-    )
-
 @router.get("/fare_attributes")
-def get_fare_attributes():
-    conn = get_db_connection()
+def get_fare_attributes(request: Request):
+    return cached_json(request, fetch_fare_attributes)
+
+def fetch_fare_attributes(conn):
     cur = conn.cursor()
     try:
         cur.execute("SELECT fare_id, price, currency_type, payment_method FROM fare_attributes;")
@@ -30,8 +22,5 @@ def get_fare_attributes():
                 "payment_method": row[3]
             })
         return fares
-    except Exception as e:
-        raise HTTPException(status_code=500, detail=str(e))
     finally:
-        cur.close()
-        conn.close()
\ No newline at end of file
+        cur.close()
\ No newline at end of file
@@ -1,22 +1,14 @@
 # api/routes/fare_rules.py
-from fastapi import APIRouter, HTTPException
-import psycopg2
-import os
+from fastapi import APIRouter, Request
+from api.static_cache import cached_json
 
 router = APIRouter()
 
-def get_db_connection():
-    return psycopg2.connect(
-        host=os.getenv("PGHOST", "db"),
-        port=os.getenv("PGPORT", "5432"),
-        dbname=os.getenv("PGDATABASE", "hslbussit"),
-        user=os.getenv("PGUSER", "postgres"),
-        password=os.getenv("PGPASSWORD", "supersecurepassword"),
-    )
-
 @router.get("/fare_rules")
-def get_fare_rules():
-    conn = get_db_connection()
+def get_fare_rules(request: Request):
+    return cached_json(request, fetch_fare_rules)
+
+def fetch_fare_rules(conn):
     cur = conn.cursor()
     try:
         cur.execute("SELECT fare_id, origin_id, destination_id, contains_id FROM fare_rules;")
@@ -30,8 +22,5 @@ def get_fare_rules():
                 "contains_id": row[3]
             })
         return rules
-    except Exception as e:
-        raise HTTPException(status_code=500, detail=str(e))
     finally:
-        cur.close()
-        conn.close()
\ No newline at end of file
+        cur.close()
\ No newline at end of file
@@ -1,22 +1,15 @@
 # api/routes/routes.py
-from fastapi import APIRouter, HTTPException
-import psycopg2
-import os
+from fastapi import APIRouter, Depends, HTTPException, Query, Request
+from api.db import get_db
+from api.static_cache import cached_json
 
 router = APIRouter()
 
-def get_db_connection():
-    return psycopg2.connect(
-        host=os.getenv("PGHOST", "db"),
-        port=os.getenv("PGPORT", "5432"),
-        dbname=os.getenv("PGDATABASE", "hslbussit"),
-        user=os.getenv("PGUSER", "postgres"),
-        password=os.getenv("PGPASSWORD", "supersecurepassword"),
-    )
-
 @router.get("/routes")
-def get_routes():
-    conn = get_db_connection()
+def get_routes(request: Request):
+    return cached_json(request, fetch_routes)
+
+def fetch_routes(conn):
     cur = conn.cursor()
     try:
         cur.execute("SELECT route_id, route_short_name, route_long_name, route_type FROM routes;")
@@ -30,8 +23,31 @@ def get_routes():
                 "route_type": row[3]
             })
         return routes
+    finally:
+        cur.close()
+
+@router.get("/routes/{route_id}/stats")
+def get_route_stats(route_id: str, minutes: int = Query(60, ge=1, le=1440), conn=Depends(get_db)):
+    """Per-minute average speed, average delay and sample count for a route."""
+    cur = conn.cursor()
+    try:
+        cur.execute("""
+            SELECT bucket, avg_speed, avg_delay, samples
+            FROM mqtt_hfp_route_1m
+            WHERE route = %s AND bucket > now() - make_interval(mins => %s)
+            ORDER BY bucket;
+        """, (route_id, minutes))
+        rows = cur.fetchall()
+        stats = []
+        for row in rows:
+            stats.append({
+                "bucket": row[0].isoformat(),
+                "avg_speed": row[1],
+                "avg_delay": row[2],
+                "samples": row[3]
+            })
+        return stats
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
     finally:
         cur.close()
-        conn.close()
\ No newline at end of file
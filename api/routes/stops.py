@@ -1,37 +1,39 @@
 # api/routes/stops.py
-from fastapi import APIRouter, HTTPException
-import psycopg2
-import os
+from typing import Optional
+from fastapi import APIRouter, Depends, HTTPException, Query, Request
+from psycopg2 import OperationalError
+from api.db import PoolTimeout
+from api.paging import Page, TableQuery, paged_response
+from api.stop_index import stop_index
 
 router = APIRouter()
 
-def get_db_connection():
-    return psycopg2.connect(
-        host=os.getenv("PGHOST", "db"),
-        port=os.getenv("PGPORT", "5432"),
-        dbname=os.getenv("PGDATABASE", "hslbussit"),
-        user=os.getenv("PGUSER", "postgres"),
-        password=os.getenv("PGPASSWORD", "supersecurepassword"),
-    )
+STOPS = TableQuery(
+    "stops",
+    ("stop_id", "stop_name", "stop_lat", "stop_lon"),
+    key="stop_id",
+    filters={
+        "route_id": """stop_id IN (
+            SELECT st.stop_id FROM stop_times st JOIN trips t ON t.trip_id = st.trip_id
+            WHERE t.route_id = %s)""",
+    },
+)
 
 @router.get("/stops")
-def get_stops():
-    conn = get_db_connection()
-    cur = conn.cursor()
+def get_stops(request: Request, route_id: Optional[str] = None, page: Page = Depends()):
+    """Stops, optionally only those served by a route; paged like /trips."""
+    return paged_response(request, STOPS, {"route_id": route_id}, page)
+
+@router.get("/stops/nearby")
+def get_nearby_stops(
+    lat: float = Query(..., ge=-90, le=90),
+    lon: float = Query(..., ge=-180, le=180),
+    radius: float = Query(500, gt=0, le=20000),
+    limit: int = Query(10, ge=1, le=100),
+):
+    """Stops within `radius` metres of lat/lon, nearest first, each with its `distance_m`."""
     try:
-        cur.execute("SELECT stop_id, stop_name, stop_lat, stop_lon FROM stops;")
-        rows = cur.fetchall()
-        stops = []
-        for row in rows:
-            stops.append({
-                "stop_id": row[0],
-                "stop_name": row[1],
-                "stop_lat": row[2],
-                "stop_lon": row[3]
-            })
-        return stops
-    except Exception as e:
-        raise HTTPException(status_code=500, detail=str(e))
-    finally:
-        cur.close()
-        conn.close()
\ No newline at end of file
+        index = stop_index.get()
+    except (PoolTimeout, OperationalError) as e:
+        raise HTTPException(status_code=503, detail=str(e))
+    return index.query(lat, lon, radius, limit)
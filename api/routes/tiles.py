@@ -0,0 +1,42 @@
+# api/routes/tiles.py
+from fastapi import APIRouter, HTTPException, Response
+from psycopg2 import OperationalError
+from api.db import PoolTimeout
+from api.feed_version import watcher
+from api.mvt import CONTENT_TYPE
+from api.tiles import MAX_ZOOM, VEHICLE_TILE_TTL, stop_tiles, vehicle_tiles
+
+router = APIRouter()
+
+STOP_TILE_MAX_AGE = 300
+
+def check_tile(z, x, y):
+    if not 0 <= z <= MAX_ZOOM or not (0 <= x < 2 ** z and 0 <= y < 2 ** z):
+        raise HTTPException(status_code=404, detail=f"No tile {z}/{x}/{y}")
+
+def tile_response(data, max_age):
+    # An empty tile is a valid answer; 204 tells MapLibre there is nothing to draw
+    headers = {"Cache-Control": f"public, max-age={max_age}"}
+    if not data:
+        return Response(status_code=204, headers=headers)
+    return Response(data, media_type=CONTENT_TYPE, headers=headers)
+
+@router.get("/tiles/stops/{z}/{x}/{y}.pbf")
+def get_stop_tile(z: int, x: int, y: int):
+    """Stops of the current GTFS feed as a Mapbox Vector Tile (layer "stops")."""
+    check_tile(z, x, y)
+    try:
+        data = stop_tiles.tile(watcher.current, z, x, y)
+    except (PoolTimeout, OperationalError) as e:
+        raise HTTPException(status_code=503, detail=str(e))
+    return tile_response(data, STOP_TILE_MAX_AGE)
+
+@router.get("/tiles/vehicles/{z}/{x}/{y}.pbf")
+async def get_vehicle_tile(z: int, x: int, y: int):
+    """Latest vehicle positions as a Mapbox Vector Tile (layer "vehicles")."""
+    check_tile(z, x, y)
+    try:
+        data = await vehicle_tiles.tile(z, x, y)
+    except (PoolTimeout, OperationalError) as e:
+        raise HTTPException(status_code=503, detail=str(e))
+    return tile_response(data, max(int(VEHICLE_TILE_TTL), 1))
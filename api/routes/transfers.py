@@ -1,22 +1,14 @@
 # api/routes/transfers.py
-from fastapi import APIRouter, HTTPException
-import psycopg2
-import os
+from fastapi import APIRouter, Request
+from api.static_cache import cached_json
 
 router = APIRouter()
 
-def get_db_connection():
-    return psycopg2.connect(
-        host=os.getenv("PGHOST", "db"),
-        port=os.getenv("PGPORT", "5432"),
-        dbname=os.getenv("PGDATABASE", "hslbussit"),
-        user=os.getenv("PGUSER", "postgres"),
-        password=os.getenv("PGPASSWORD", "supersecurepassword"),
-    )
-
 @router.get("/transfers")
-def get_transfers():
-    conn = get_db_connection()
+def get_transfers(request: Request):
+    return cached_json(request, fetch_transfers)
+
+def fetch_transfers(conn):
     cur = conn.cursor()
     try:
         cur.execute("SELECT from_stop_id, to_stop_id, transfer_type, min_transfer_time FROM transfers;")
@@ -30,8 +22,5 @@ def get_transfers():
                 "min_transfer_time": row[3]
             })
         return transfers
-    except Exception as e:
-        raise HTTPException(status_code=500, detail=str(e))
     finally:
-        cur.close()
-        conn.close()
\ No newline at end of file
+        cur.close()
\ No newline at end of file
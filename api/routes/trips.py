@@ -1,38 +1,19 @@
 # api/routes/trips.py
-from fastapi import APIRouter, HTTPException
-import psycopg2
-import os
+from typing import Optional
+from fastapi import APIRouter, Depends, Request
+from api.paging import Page, TableQuery, paged_response
 
 router = APIRouter()
 
-def get_db_connection():
-    return psycopg2.connect(
-        host=os.getenv("PGHOST", "db"),
-        port=os.getenv("PGPORT", "5432"),
-        dbname=os.getenv("PGDATABASE", "hslbussit"),
-        user=os.getenv("PGUSER", "postgres"),
-        password=os.getenv("PGPASSWORD", "supersecurepassword"),
-    )
+TRIPS = TableQuery(
+    "trips",
+    ("trip_id", "route_id", "service_id", "trip_headsign", "direction_id"),
+    key="trip_id",
+    filters={"route_id": "route_id = %s", "service_id": "service_id = %s"},
+)
 
 @router.get("/trips")
-def get_trips():
-    conn = get_db_connection()
-    cur = conn.cursor()
-    try:
-        cur.execute("SELECT trip_id, route_id, service_id, trip_headsign, direction_id FROM trips;")
-        rows = cur.fetchall()
-        trips = []
-        for row in rows:
-            trips.append({
-                "trip_id": row[0],
-                "route_id": row[1],
-                "service_id": row[2],
-                "trip_headsign": row[3],
-                "direction_id": row[4]
-            })
-        return trips
-    except Exception as e:
-        raise HTTPException(status_code=500, detail=str(e))
-    finally:
-        cur.close()
-        conn.close()
\ No newline at end of file
+def get_trips(request: Request, route_id: Optional[str] = None, service_id: Optional[str] = None,
+              page: Page = Depends()):
+    """Trips, optionally of one route and/or service; paged with `limit`/`after`, or `stream=true`."""
+    return paged_response(request, TRIPS, {"route_id": route_id, "service_id": service_id}, page)
@@ -1,23 +1,12 @@
 # api/routes/vehicle_positions.py
-from fastapi import APIRouter, HTTPException
-import psycopg2
-import os
+from fastapi import APIRouter, Depends, HTTPException
+from api.db import get_db
 from datetime import datetime
 
 router = APIRouter()
 
-def get_db_connection():
-    return psycopg2.connect(
-        host=os.getenv("PGHOST", "db"),
-        port=os.getenv("PGPORT", "5432"),
-        dbname=os.getenv("PGDATABASE", "hslbussit"),
-        user=os.getenv("PGUSER", "postgres"),
-        password=os.getenv("PGPASSWORD", "supersecurepassword"),
-    )
-
 @router.get("/vehicle_positions")
-def get_vehicle_positions():
-    conn = get_db_connection()
+def get_vehicle_positions(conn=Depends(get_db)):
     cur = conn.cursor()
     try:
         cur.execute("""
@@ -41,5 +30,4 @@ def get_vehicle_positions():
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
     finally:
-        cur.close()
-        conn.close()
\ No newline at end of file
+        cur.close()
\ No newline at end of file
@@ -1,42 +1,44 @@
-import os
-import psycopg2
-from fastapi import APIRouter
+from typing import Optional
+from fastapi import APIRouter, HTTPException, Response
+from psycopg2 import OperationalError
+from api.db import PoolTimeout
+from api.live import broadcaster, encode
+from api.spatial import VehicleFilter
 
 router = APIRouter()
 
-DB_HOST = os.getenv("PGHOST", "db")
-DB_PORT = os.getenv("PGPORT", "5432")
-DB_NAME = os.getenv("PGDATABASE", "hslbussit")
-DB_USER = os.getenv("PGUSER", "postgres")
-DB_PASS = os.getenv("PGPASSWORD", "supersecurepassword")
-
 @router.get("/vehicles")
-def get_vehicles():
-    conn = psycopg2.connect(
-        host=DB_HOST, port=DB_PORT, dbname=DB_NAME,
-        user=DB_USER, password=DB_PASS
-    )
-    cur = conn.cursor()
-    cur.execute("""
-    SELECT
-      veh       AS vehicle_id,
-      desi      AS label,
-      lat,
-      long      AS lon,
-      spd       AS speed,
-      tst       AS timestamp
-    FROM (
-      SELECT
-        *,
-        ROW_NUMBER() OVER (PARTITION BY veh ORDER BY tst DESC) AS rn
-      FROM mqtt_hfp
-      WHERE tst > now() - interval '10 minutes'
-    ) sub
-    WHERE rn = 1;
-    """)
-    rows = cur.fetchall()
-    cols = [desc[0] for desc in cur.description]
-    result = [dict(zip(cols, row)) for row in rows]
-    cur.close()
-    conn.close()
-    return result
\ No newline at end of file
+async def get_vehicles(
+    since: Optional[int] = None,
+    delta: bool = False,
+    bbox: Optional[str] = None,
+    route: Optional[str] = None,
+    operator: Optional[str] = None,
+):
+    """
+    Without parameters: the full list of vehicles seen in the last 10 minutes.
+    With `since` (or `delta=true` for the first call): a delta envelope
+    {"type", "seq", "vehicles", "removed"} holding only what changed after
+    that sequence, or a keyframe if the sequence is unknown or too old.
+
+    `bbox=min_lon,min_lat,max_lon,max_lat`, `route` and `operator` (comma
+    separated) narrow either form to the matching vehicles; in a filtered
+    delta, vehicles that left the filter are listed under "removed". For a
+    `since` older than the previous tick, "removed" may also name vehicles
+    that never matched; clients ignore ids they do not have.
+    """
+    try:
+        vehicle_filter = VehicleFilter.from_params(bbox, route, operator)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    # Without the MQTT store these read the database outside get_db
+    try:
+        if since is None and not delta:
+            if vehicle_filter is None:
+                return await broadcaster.snapshot()
+            payload = await broadcaster.vehicles(vehicle_filter)
+        else:
+            payload = await broadcaster.delta(since, vehicle_filter)
+    except (PoolTimeout, OperationalError) as e:
+        raise HTTPException(status_code=503, detail=str(e))
+    return Response(encode(payload), media_type="application/json")
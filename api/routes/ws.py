@@ -0,0 +1,83 @@
+# api/routes/ws.py
+import json
+import asyncio
+from typing import Optional
+from fastapi import APIRouter, WebSocket, WebSocketDisconnect
+from api.live import broadcaster, encode
+from api.spatial import VehicleFilter
+
+router = APIRouter()
+
+@router.websocket("/ws")
+async def vehicle_stream(
+    websocket: WebSocket,
+    mode: str = "full",
+    bbox: Optional[str] = None,
+    route: Optional[str] = None,
+    operator: Optional[str] = None,
+):
+    """
+    mode=full:  every tick carries the full vehicle list.
+    mode=delta: a keyframe, then only changed/added/removed vehicles per tick.
+                Sending {"since": <seq>} asks for a resync from that sequence.
+
+    `bbox`, `route` and `operator` limit the stream to matching vehicles, as
+    on /vehicles. Sending {"bbox": ..., "route": ..., "operator": ...} replaces
+    the filter (e.g. when the map is panned) and is answered with a matching
+    snapshot, or a keyframe in delta mode.
+    """
+    if mode not in ("full", "delta"):
+        await websocket.close(code=1008)
+        return
+    try:
+        vehicle_filter = VehicleFilter.from_params(bbox, route, operator)
+    except ValueError:
+        await websocket.close(code=1008)
+        return
+    await websocket.accept()
+    client = broadcaster.register(websocket, mode, vehicle_filter)
+    sender = asyncio.create_task(client.send_forever())
+    try:
+        while not sender.done():
+            # receive() rather than receive_text(): a binary frame must not end the handler with a KeyError
+            receiver = asyncio.create_task(websocket.receive())
+            done, _ = await asyncio.wait({sender, receiver}, return_when=asyncio.FIRST_COMPLETED)
+            if receiver not in done:
+                receiver.cancel()
+                break
+            message = receiver.result()
+            if message["type"] == "websocket.disconnect":
+                break
+            if message.get("text") is not None:
+                handle_client_message(client, message["text"])
+    except WebSocketDisconnect:
+        pass
+    finally:
+        broadcaster.unregister(client)
+        sender.cancel()
+
+def handle_client_message(client, text):
+    try:
+        message = json.loads(text)
+    except ValueError:
+        return
+    if not isinstance(message, dict):
+        return
+    if message.keys() & {"bbox", "route", "operator"}:
+        try:
+            client.vehicle_filter = VehicleFilter.from_params(
+                message.get("bbox"), message.get("route"), message.get("operator")
+            )
+        except (TypeError, ValueError):
+            return
+        # Answer straight away instead of waiting for the next tick
+        if broadcaster.last_message is not None:
+            kind = "keyframe" if client.mode == "delta" else "full"
+            client.offer(encode(broadcaster.message(kind, client.vehicle_filter)))
+        return
+    if client.mode == "delta" and "since" in message:
+        try:
+            since = int(message["since"])
+        except (TypeError, ValueError):
+            since = None
+        client.offer(encode(broadcaster.tracker.delta(since, client.vehicle_filter)))
@@ -0,0 +1,135 @@
+"""
+Viewport filtering for the live vehicle snapshot.
+
+A map client only shows its viewport, so `/vehicles` and `/ws` accept a
+`bbox` (plus optional `route` / `operator`) and are answered from a uniform
+lat/lon grid over the latest positions. The grid is rebuilt once per
+broadcaster tick (O(vehicles)); a query only visits the cells its bbox
+overlaps, so a zoomed-in client costs tens of vehicles instead of thousands.
+"""
+import math
+import os
+
+# Cell edge in degrees; 0.01 is about 1.1 km north-south and 0.55 km east-west in Helsinki
+GRID_CELL_DEG = float(os.getenv("VEHICLE_GRID_CELL_DEG", "0.01"))
+
+
+def _split(value):
+    if value is None:
+        return []
+    if isinstance(value, str):
+        value = value.split(",")
+    return [str(v).strip() for v in value if str(v).strip()]
+
+
+def _operator(value):
+    # mqtt_hfp stores `oper` as text, the HFP stream as a number; "0012" == "12" == 12, "0000" == 0
+    if value is None:
+        return None
+    value = str(value).strip()
+    return str(int(value)) if value.isdigit() else value
+
+
+def parse_bbox(value):
+    """`min_lon,min_lat,max_lon,max_lat` (string or sequence) -> float tuple; raises ValueError."""
+    parts = _split(value)
+    if not parts:
+        return None
+    if len(parts) != 4:
+        raise ValueError("bbox must be min_lon,min_lat,max_lon,max_lat")
+    min_lon, min_lat, max_lon, max_lat = (float(v) for v in parts)
+    if not all(math.isfinite(v) for v in (min_lon, min_lat, max_lon, max_lat)):
+        raise ValueError("bbox values must be finite")
+    if min_lon > max_lon or min_lat > max_lat:
+        raise ValueError("bbox minimum is greater than its maximum")
+    return min_lon, min_lat, max_lon, max_lat
+
+
+class VehicleFilter:
+    """
+    Which vehicles a client wants: inside `bbox` and, when given, on one of
+    `routes` (HFP/GTFS route ids) and run by one of `operators`.
+    """
+
+    __slots__ = ("bbox", "routes", "operators", "key")
+
+    def __init__(self, bbox=None, routes=None, operators=None):
+        self.bbox = bbox
+        self.routes = frozenset(routes or ())
+        self.operators = frozenset(operators or ())
+        # Clients with equal filters share one encoded message per tick
+        self.key = (bbox, self.routes, self.operators)
+
+    @classmethod
+    def from_params(cls, bbox=None, route=None, operator=None):
+        """Filter from query/message parameters, or None when nothing is filtered; raises ValueError."""
+        vehicle_filter = cls(parse_bbox(bbox), _split(route), [_operator(v) for v in _split(operator)])
+        if not (vehicle_filter.bbox or vehicle_filter.routes or vehicle_filter.operators):
+            return None
+        return vehicle_filter
+
+    def matches(self, vehicle):
+        if self.bbox is not None:
+            lat, lon = vehicle["lat"], vehicle["lon"]
+            if lat is None or lon is None:
+                return False
+            min_lon, min_lat, max_lon, max_lat = self.bbox
+            if not (min_lon <= lon <= max_lon and min_lat <= lat <= max_lat):
+                return False
+        if self.routes and vehicle.get("route") not in self.routes:
+            return False
+        if self.operators and _operator(vehicle.get("operator")) not in self.operators:
+            return False
+        return True
+
+
+class GridIndex:
+    """
+    Vehicles (or any dicts with "lat" and "lon") bucketed by `cell_deg` x
+    `cell_deg` grid cell.
+    """
+
+    def __init__(self, vehicles=(), cell_deg=GRID_CELL_DEG):
+        self.cell_deg = cell_deg
+        self.vehicles = list(vehicles)
+        self._cells = {}
+        for vehicle in self.vehicles:
+            lat, lon = vehicle["lat"], vehicle["lon"]
+            if lat is None or lon is None:
+                continue
+            self._cells.setdefault(self._cell(lon, lat), []).append(vehicle)
+
+    def _cell(self, lon, lat):
+        return math.floor(lon / self.cell_deg), math.floor(lat / self.cell_deg)
+
+    def _candidates(self, bbox):
+        min_lon, min_lat, max_lon, max_lat = bbox
+        x0, y0 = self._cell(min_lon, min_lat)
+        x1, y1 = self._cell(max_lon, max_lat)
+        if (x1 - x0 + 1) * (y1 - y0 + 1) > len(self._cells):
+            # A bbox wider than the occupied area: walk the occupied cells instead
+            for (x, y), bucket in self._cells.items():
+                if x0 <= x <= x1 and y0 <= y <= y1:
+                    yield bucket
+            return
+        for x in range(x0, x1 + 1):
+            for y in range(y0, y1 + 1):
+                bucket = self._cells.get((x, y))
+                if bucket:
+                    yield bucket
+
+    def within(self, bbox):
+        """Items inside `bbox` (min_lon, min_lat, max_lon, max_lat), edges included."""
+        min_lon, min_lat, max_lon, max_lat = bbox
+        return [
+            v for bucket in self._candidates(bbox) for v in bucket
+            if min_lon <= v["lon"] <= max_lon and min_lat <= v["lat"] <= max_lat
+        ]
+
+    def query(self, vehicle_filter=None):
+        if vehicle_filter is None:
+            return self.vehicles
+        matches = vehicle_filter.matches
+        if vehicle_filter.bbox is None:
+            return [v for v in self.vehicles if matches(v)]
+        return [v for bucket in self._candidates(vehicle_filter.bbox) for v in bucket if matches(v)]
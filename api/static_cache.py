@@ -0,0 +1,184 @@
+"""
+In-process response cache for the static GTFS endpoints.
+
+Their data only changes when gtfs_static imports a new feed, so a rendered
+response is kept per (path, query) and feed version and reused until the
+feed version watcher reports a new import. Each entry holds the JSON body
+plus gzip and (with the optional `brotli` package) brotli encodings made
+once at render time, and strong ETags, one per encoding. A request whose
+If-None-Match names one of them gets a 304 without touching the database.
+
+Responses are sent with `Cache-Control: no-cache`: clients may keep them but
+revalidate every time, since a new feed can be imported at any moment.
+Nothing is cached until the feed version is known.
+"""
+import os
+import gzip
+import hashlib
+import threading
+from collections import OrderedDict
+
+from fastapi import HTTPException, Response
+
+from api.db import request_connection
+from api.feed_version import watcher
+from api.live import encode
+
+try:
+    import brotli
+except ImportError:  # gzip only
+    brotli = None
+
+STATIC_CACHE_MAX_BYTES = int(os.getenv("STATIC_CACHE_MAX_BYTES", str(256 << 20)))
+GZIP_LEVEL = int(os.getenv("STATIC_CACHE_GZIP_LEVEL", "6"))
+# Quality 11 takes minutes on the full /trips body; 6 is within a few percent of it at a fraction of the time
+BROTLI_QUALITY = int(os.getenv("STATIC_CACHE_BROTLI_QUALITY", "6"))
+MIN_COMPRESS_BYTES = 1024
+
+
+def accepted_encodings(header):
+    """Content codings allowed by an Accept-Encoding header (q=0 excluded)."""
+    accepted = set()
+    for part in (header or "").split(","):
+        coding, *params = (p.strip() for p in part.split(";"))
+        try:
+            q = next((float(p[2:]) for p in params if p.startswith("q=")), 1.0)
+        except ValueError:
+            q = 1.0
+        if coding and q > 0:
+            accepted.add(coding.lower())
+    return accepted
+
+
+class CachedResponse:
+    """One rendered response: its body in every encoding and their ETags."""
+
+    def __init__(self, version, body, headers, media_type):
+        self.version = version
+        self.headers = headers
+        self.media_type = media_type
+        digest = hashlib.sha256(body).hexdigest()[:32]
+        self.bodies = {"identity": body}
+        if len(body) >= MIN_COMPRESS_BYTES:
+            self.bodies["gzip"] = gzip.compress(body, GZIP_LEVEL, mtime=0)
+            if brotli is not None:
+                self.bodies["br"] = brotli.compress(body, quality=BROTLI_QUALITY)
+        # A strong validator must differ between encodings of the same content
+        self.etags = {
+            coding: f'"{digest}"' if coding == "identity" else f'"{digest}-{coding}"'
+            for coding in self.bodies
+        }
+        self.size = sum(len(b) for b in self.bodies.values())
+
+    def matches(self, if_none_match):
+        if not if_none_match:
+            return False
+        if if_none_match.strip() == "*":
+            return True
+        tags = {tag.strip().removeprefix("W/") for tag in if_none_match.split(",")}
+        return not tags.isdisjoint(self.etags.values())
+
+    def response(self, request):
+        accepted = accepted_encodings(request.headers.get("accept-encoding"))
+        coding = next((c for c in ("br", "gzip") if c in self.bodies and c in accepted), "identity")
+        headers = dict(self.headers, ETag=self.etags[coding], Vary="Accept-Encoding")
+        headers["Cache-Control"] = "no-cache"
+        if coding != "identity":
+            headers["Content-Encoding"] = coding
+        if self.matches(request.headers.get("if-none-match")):
+            return Response(status_code=304, headers=headers)
+        return Response(self.bodies[coding], media_type=self.media_type, headers=headers)
+
+
+class StaticCache:
+    """LRU of CachedResponse by (path, query), bounded to `max_bytes` of bodies."""
+
+    def __init__(self, max_bytes=STATIC_CACHE_MAX_BYTES):
+        self.max_bytes = max_bytes
+        self._entries = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self._rendering = {}
+        self.hits = 0
+        self.misses = 0
+
+    def clear(self, version=None):
+        """Feed version watcher callback; entries are also checked against the version on every hit."""
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+
+    def _get(self, key, version):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry.version == version:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return entry
+        return None
+
+    def _put(self, key, entry):
+        with self._lock:
+            previous = self._entries.pop(key, None)
+            if previous is not None:
+                self._bytes -= previous.size
+            if entry.size > self.max_bytes:
+                return
+            self._entries[key] = entry
+            self._bytes += entry.size
+            while self._bytes > self.max_bytes:
+                _, evicted = self._entries.popitem(last=False)
+                self._bytes -= evicted.size
+
+    def respond(self, request, render, media_type="application/json"):
+        """
+        The cached response for this request, or `render()` -> (body bytes,
+        extra headers) cached under the current feed version. Concurrent
+        misses for one key render once.
+        """
+        version = watcher.current
+        if version is None:
+            body, headers = render()
+            return Response(body, media_type=media_type, headers=headers)
+
+        key = (request.url.path, request.url.query)
+        entry = self._get(key, version)
+        if entry is not None:
+            return entry.response(request)
+
+        with self._lock:
+            lock = self._rendering.setdefault(key, threading.Lock())
+        try:
+            with lock:
+                entry = self._get(key, version)
+                if entry is None:
+                    self.misses += 1
+                    body, headers = render()
+                    # Keyed on the version seen before rendering: a feed imported
+                    # meanwhile makes this entry stale at once instead of hiding it
+                    entry = CachedResponse(version, body, headers, media_type)
+                    self._put(key, entry)
+        finally:
+            # Also when render() raises (e.g. a 503), or every failing URL would leave a lock behind
+            with self._lock:
+                self._rendering.pop(key, None)
+        return entry.response(request)
+
+    def stats(self):
+        with self._lock:
+            return {"entries": len(self._entries), "bytes": self._bytes, "hits": self.hits, "misses": self.misses}
+
+
+cache = StaticCache()
+
+
+def cached_json(request, fetch):
+    """Cached JSON of `fetch(conn)`; a pooled connection is only taken on a miss."""
+    def render():
+        with request_connection() as conn:
+            try:
+                payload = fetch(conn)
+            except Exception as e:
+                raise HTTPException(status_code=500, detail=str(e))
+        return encode(payload).encode(), {}
+    return cache.respond(request, render)
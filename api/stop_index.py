@@ -0,0 +1,143 @@
+"""
+In-memory spatial index of GTFS stops for /stops/nearby.
+
+Stops are sorted by the cell of a uniform grid (CELL_METERS on a side, in a
+local equirectangular projection), so every cell is a contiguous slice of
+the coordinate arrays. A query gathers the slices of the cells its circle
+touches and computes haversine distances for those candidates in one NumPy
+expression; its cost depends on the stops near the point, not on the total.
+
+The index is built from the stops table when the feed version watcher first
+reports a version, rebuilt on every new import and swapped in atomically.
+"""
+import math
+import logging
+import threading
+
+import numpy as np
+
+from api import db
+
+logger = logging.getLogger(__name__)
+
+EARTH_RADIUS_M = 6371008.8
+CELL_METERS = 500.0
+
+STOPS_SQL = "SELECT stop_id, stop_name, stop_lat, stop_lon FROM stops WHERE stop_lat IS NOT NULL AND stop_lon IS NOT NULL"
+
+
+class StopIndex:
+    """Immutable grid index over one set of stops."""
+
+    def __init__(self, rows, cell_meters=CELL_METERS):
+        self.cell_meters = cell_meters
+        ids, names, lats, lons = zip(*rows) if rows else ((), (), (), ())
+        lat = np.asarray(lats, dtype=np.float64)
+        lon = np.asarray(lons, dtype=np.float64)
+        # Projection centred on the data; distances are exact (haversine), the grid only picks candidates
+        self._cos_lat0 = math.cos(math.radians(float(lat.mean()))) if len(lat) else 1.0
+
+        cx, cy = self._cells(lat, lon)
+        order = np.lexsort((cy, cx))
+        self.ids = np.asarray(ids, dtype=object)[order]
+        self.names = np.asarray(names, dtype=object)[order]
+        self.lat = lat[order]
+        self.lon = lon[order]
+        self._lat_rad = np.radians(self.lat)
+        self._lon_rad = np.radians(self.lon)
+        cx, cy = cx[order], cy[order]
+
+        # Cell -> (start, end) slice of the sorted arrays
+        self._slices = {}
+        if len(order):
+            boundaries = np.flatnonzero((np.diff(cx) != 0) | (np.diff(cy) != 0)) + 1
+            starts = np.concatenate(([0], boundaries))
+            ends = np.concatenate((boundaries, [len(order)]))
+            for start, end in zip(starts.tolist(), ends.tolist()):
+                self._slices[(int(cx[start]), int(cy[start]))] = (start, end)
+
+    def __len__(self):
+        return len(self.ids)
+
+    def _cells(self, lat, lon):
+        y = np.radians(lat) * EARTH_RADIUS_M
+        x = np.radians(lon) * EARTH_RADIUS_M * self._cos_lat0
+        return np.floor(x / self.cell_meters).astype(np.int64), np.floor(y / self.cell_meters).astype(np.int64)
+
+    def _candidates(self, lat, lon, radius):
+        cx = math.floor(math.radians(lon) * EARTH_RADIUS_M * self._cos_lat0 / self.cell_meters)
+        cy = math.floor(math.radians(lat) * EARTH_RADIUS_M / self.cell_meters)
+        # Cells are at least cell_meters wide in the projection; one spare ring covers the scale error
+        reach = int(math.ceil(radius / self.cell_meters)) + 1
+        if (2 * reach + 1) ** 2 >= len(self._slices):
+            return None  # the circle covers most cells: scan everything
+        slices = [
+            self._slices[cell]
+            for cell in ((x, y) for x in range(cx - reach, cx + reach + 1) for y in range(cy - reach, cy + reach + 1))
+            if cell in self._slices
+        ]
+        if not slices:
+            return np.empty(0, dtype=np.int64)
+        return np.concatenate([np.arange(start, end) for start, end in slices])
+
+    def nearby(self, lat, lon, radius, limit):
+        """Up to `limit` stops within `radius` metres, nearest first, as (index array, distances)."""
+        candidates = self._candidates(lat, lon, radius)
+        lat_rad = self._lat_rad if candidates is None else self._lat_rad[candidates]
+        lon_rad = self._lon_rad if candidates is None else self._lon_rad[candidates]
+
+        p_lat, p_lon = math.radians(lat), math.radians(lon)
+        a = (np.sin((lat_rad - p_lat) / 2) ** 2
+             + math.cos(p_lat) * np.cos(lat_rad) * np.sin((lon_rad - p_lon) / 2) ** 2)
+        distance = 2 * EARTH_RADIUS_M * np.arcsin(np.sqrt(np.minimum(a, 1.0)))
+
+        within = np.flatnonzero(distance <= radius)
+        if len(within) > limit:
+            within = within[np.argpartition(distance[within], limit - 1)[:limit]]
+        within = within[np.argsort(distance[within], kind="stable")]
+        indexes = within if candidates is None else candidates[within]
+        return indexes, distance[within]
+
+    def query(self, lat, lon, radius, limit):
+        indexes, distances = self.nearby(lat, lon, radius, limit)
+        return [
+            {
+                "stop_id": self.ids[i],
+                "stop_name": self.names[i],
+                "stop_lat": float(self.lat[i]),
+                "stop_lon": float(self.lon[i]),
+                "distance_m": round(float(d), 1),
+            }
+            for i, d in zip(indexes.tolist(), distances.tolist())
+        ]
+
+
+class StopIndexHolder:
+    """The current StopIndex; rebuilt on feed version changes, or on first use without a version."""
+
+    def __init__(self):
+        self.index = None
+        self._lock = threading.Lock()
+
+    def rebuild(self, version=None):
+        with db.pool.connection() as conn:
+            with conn.cursor() as cur:
+                cur.execute(STOPS_SQL)
+                rows = cur.fetchall()
+        index = StopIndex(rows)
+        self.index = index
+        logger.info(f"Stop index built with {len(index)} stops (feed version {version})")
+        return index
+
+    def get(self):
+        index = self.index
+        if index is None:
+            with self._lock:
+                # An empty StopIndex is falsy (__len__), so test identity
+                index = self.index
+                if index is None:
+                    index = self.rebuild()
+        return index
+
+
+stop_index = StopIndexHolder()
@@ -0,0 +1,198 @@
+"""
+Mapbox Vector Tiles of stops and live vehicles, so the map loads only the
+markers of the tiles in view instead of the full /stops and /vehicles lists.
+
+Stop tiles only change with the GTFS feed. They are cached per feed version
+in memory (LRU) and, with TILE_CACHE_DIR set, on disk, and both copies are
+dropped when the feed version watcher sees a new import. Vehicle tiles are
+cut from the broadcaster's grid index and cached for VEHICLE_TILE_TTL seconds.
+"""
+import os
+import time
+import shutil
+import logging
+import threading
+from collections import OrderedDict
+
+from api import db
+from api.live import broadcaster
+from api.mvt import EXTENT, PointLayer, encode_tile, tile_bounds
+from api.spatial import GridIndex, VehicleFilter
+
+logger = logging.getLogger(__name__)
+
+TILE_CACHE_DIR = os.getenv("TILE_CACHE_DIR")
+TILE_CACHE_SIZE = int(os.getenv("TILE_CACHE_SIZE", "4096"))
+VEHICLE_TILE_TTL = float(os.getenv("VEHICLE_TILE_TTL", "1.0"))
+MAX_ZOOM = 22
+
+# Features this far outside the tile (in tile widths) are included, so markers
+# that straddle a tile edge are drawn by both tiles instead of being cut off
+TILE_BUFFER = 64 / EXTENT
+
+STOPS_SQL = "SELECT stop_id, stop_name, stop_lat, stop_lon FROM stops WHERE stop_lat IS NOT NULL AND stop_lon IS NOT NULL"
+
+
+def _feature_id(value):
+    # HSL ids are numeric strings; MVT feature ids must be unsigned integers
+    return int(value) if value and value.isdigit() else None
+
+
+def _vehicle_feature_id(vehicle_id):
+    # "oper/veh" -> oper << 32 | veh, unique as long as both are numeric
+    oper, _, veh = (vehicle_id or "").rpartition("/")
+    if not oper:
+        return _feature_id(veh)
+    if oper.isdigit() and veh.isdigit():
+        return int(oper) << 32 | int(veh)
+    return None
+
+
+class TileCache:
+    """
+    Encoded tiles by key: an LRU of `max_tiles` in memory and, when
+    `directory` is given, files under directory/<key parts>.pbf that survive
+    restarts.
+    """
+
+    def __init__(self, max_tiles, directory=None):
+        self.max_tiles = max_tiles
+        self.directory = directory
+        self._tiles = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def _path(self, key):
+        return os.path.join(self.directory, *map(str, key)) + ".pbf"
+
+    def get(self, key):
+        with self._lock:
+            data = self._tiles.get(key)
+            if data is not None:
+                self._tiles.move_to_end(key)
+                self.hits += 1
+                return data
+        if self.directory:
+            try:
+                with open(self._path(key), "rb") as f:
+                    data = f.read()
+            except OSError:
+                data = None
+            if data is not None:
+                self._remember(key, data)
+                self.hits += 1
+                return data
+        self.misses += 1
+        return None
+
+    def put(self, key, data):
+        self._remember(key, data)
+        if self.directory:
+            path = self._path(key)
+            try:
+                os.makedirs(os.path.dirname(path), exist_ok=True)
+                tmp = f"{path}.{threading.get_ident()}.tmp"
+                with open(tmp, "wb") as f:
+                    f.write(data)
+                os.replace(tmp, path)
+            except OSError as e:
+                logger.error(f"Tile cache write failed for {path}: {e}")
+
+    def _remember(self, key, data):
+        with self._lock:
+            self._tiles[key] = data
+            self._tiles.move_to_end(key)
+            while len(self._tiles) > self.max_tiles:
+                self._tiles.popitem(last=False)
+
+    def clear(self, keep=None):
+        """Forget every tile; on disk, remove every top-level directory except `keep`."""
+        with self._lock:
+            self._tiles.clear()
+        if not self.directory or not os.path.isdir(self.directory):
+            return
+        for name in os.listdir(self.directory):
+            if name != str(keep):
+                shutil.rmtree(os.path.join(self.directory, name), ignore_errors=True)
+
+
+class StopTiles:
+    """Stop tiles of the current feed version, cut from an in-memory grid of all stops."""
+
+    def __init__(self, cache):
+        self.cache = cache
+        self._index = None
+        self._index_version = None
+        self._lock = threading.Lock()
+
+    def invalidate(self, version):
+        """Feed version watcher callback: drop tiles and stops of older versions."""
+        with self._lock:
+            self._index = None
+            self._index_version = None
+        self.cache.clear(keep=version)
+
+    def _stops(self, version):
+        with self._lock:
+            if self._index is None or self._index_version != version:
+                with db.pool.connection() as conn:
+                    with conn.cursor() as cur:
+                        cur.execute(STOPS_SQL)
+                        rows = cur.fetchall()
+                self._index = GridIndex(
+                    {"stop_id": stop_id, "stop_name": name, "lat": lat, "lon": lon}
+                    for stop_id, name, lat, lon in rows
+                )
+                self._index_version = version
+            return self._index
+
+    def tile(self, version, z, x, y):
+        key = (version, z, x, y)
+        data = self.cache.get(key)
+        if data is None:
+            layer = PointLayer("stops", z, x, y)
+            for stop in self._stops(version).within(tile_bounds(z, x, y, TILE_BUFFER)):
+                layer.add(stop["lon"], stop["lat"], {"stop_id": stop["stop_id"], "name": stop["stop_name"]},
+                          _feature_id(stop["stop_id"]))
+            data = encode_tile(layer)
+            self.cache.put(key, data)
+        return data
+
+
+class VehicleTiles:
+    """Vehicle tiles from the live snapshot, each reused for `ttl` seconds."""
+
+    def __init__(self, ttl=VEHICLE_TILE_TTL, max_tiles=TILE_CACHE_SIZE):
+        self.ttl = ttl
+        self.max_tiles = max_tiles
+        self._tiles = {}
+
+    async def tile(self, z, x, y):
+        now = time.monotonic()
+        cached = self._tiles.get((z, x, y))
+        if cached is not None and cached[0] > now:
+            return cached[1]
+
+        vehicles = await broadcaster.vehicles(VehicleFilter(bbox=tile_bounds(z, x, y, TILE_BUFFER)))
+        layer = PointLayer("vehicles", z, x, y)
+        for v in vehicles:
+            timestamp = v["timestamp"]
+            layer.add(v["lon"], v["lat"], {
+                "vehicle_id": v["vehicle_id"],
+                "label": v["label"],
+                "route": v.get("route"),
+                "operator": v.get("operator"),
+                "speed": float(v["speed"]) if v["speed"] is not None else None,
+                "timestamp": int(timestamp.timestamp()) if timestamp is not None else None,
+            }, _vehicle_feature_id(v["vehicle_id"]))
+        data = encode_tile(layer)
+
+        if len(self._tiles) >= self.max_tiles:
+            self._tiles = {key: entry for key, entry in self._tiles.items() if entry[0] > now}
+        self._tiles[(z, x, y)] = (now + self.ttl, data)
+        return data
+
+
+stop_tiles = StopTiles(TileCache(TILE_CACHE_SIZE, os.path.join(TILE_CACHE_DIR, "stops") if TILE_CACHE_DIR else None))
+vehicle_tiles = VehicleTiles()
@@ -0,0 +1,118 @@
+import os
+import logging
+import threading
+from datetime import datetime, timedelta, timezone
+
+import paho.mqtt.client as mqtt
+
+from ingestion.mqtt_hfp_ingest.decode import decode
+
+logger = logging.getLogger(__name__)
+
+# "db" answers /vehicles from mqtt_hfp, "mqtt" from the in-memory store below
+VEHICLE_SOURCE = os.getenv("VEHICLE_SOURCE", "db")
+
+MQTT_BROKER = os.getenv("MQTT_BROKER", "mqtt.hsl.fi")
+MQTT_PORT = int(os.getenv("MQTT_PORT", "1883"))
+MQTT_TOPIC = os.getenv("MQTT_TOPIC", "/hfp/v2/journey/ongoing/vp/bus/#")
+
+# Same window as the mqtt_hfp query it replaces
+STALE_AFTER = timedelta(seconds=int(os.getenv("VEHICLE_STALE_SECONDS", "600")))
+
+
+def vehicle_key(oper, veh):
+    """
+    `oper/veh`: HSL vehicle numbers are only unique within an operator. The
+    same form as `vehicle_id` in LATEST_VEHICLES_SQL (api/live.py).
+    """
+    return "/".join(str(part) for part in (oper, veh) if part is not None)
+
+
+class VehicleStore:
+    """
+    Latest known position per vehicle, keyed by `oper/veh`.
+
+    Updates are O(1) and come straight from the HFP stream; snapshot() is
+    O(vehicles) and drops entries whose last report is older than
+    `stale_after`, matching the 10 minute window of the database query.
+    """
+
+    def __init__(self, stale_after=STALE_AFTER):
+        self.stale_after = stale_after
+        self._vehicles = {}
+        self._lock = threading.Lock()
+        self.updates = 0
+        self.evicted = 0
+
+    def update(self, vp):
+        """Apply one decoded HFP position (an HfpRecord from ingestion/mqtt_hfp_ingest/decode.py)."""
+        if vp.veh is None or vp.tst is None or vp.lat is None or vp.long is None:
+            return
+        vehicle_id = vehicle_key(vp.oper, vp.veh)
+        tst = vp.tst
+        record = {
+            "vehicle_id": vehicle_id,
+            "label": vp.desi,
+            "lat": vp.lat,
+            "lon": vp.long,
+            "speed": vp.spd,
+            "timestamp": tst,
+            "route": vp.route,
+            "operator": vp.oper,
+        }
+        with self._lock:
+            prev = self._vehicles.get(vehicle_id)
+            # QoS 0 delivery can reorder; never move a bus back in time
+            if prev is None or prev["timestamp"] <= tst:
+                self._vehicles[vehicle_id] = record
+                self.updates += 1
+
+    def snapshot(self, now=None):
+        cutoff = (now or datetime.now(timezone.utc)) - self.stale_after
+        with self._lock:
+            stale = [vid for vid, rec in self._vehicles.items() if rec["timestamp"] <= cutoff]
+            for vid in stale:
+                del self._vehicles[vid]
+            self.evicted += len(stale)
+            return list(self._vehicles.values())
+
+    def __len__(self):
+        return len(self._vehicles)
+
+
+class HfpSubscriber:
+    """Feeds a VehicleStore from the HSL HFP MQTT stream on paho's network thread."""
+
+    def __init__(self, store, broker=MQTT_BROKER, port=MQTT_PORT, topic=MQTT_TOPIC):
+        self.store = store
+        self.broker = broker
+        self.port = port
+        self.topic = topic
+        self.client = mqtt.Client(mqtt.CallbackAPIVersion.VERSION2)
+        self.client.on_connect = self._on_connect
+        self.client.on_message = self._on_message
+
+    def _on_connect(self, client, userdata, flags, reason_code, properties):
+        logger.info(f"Vehicle store connected to {self.broker}:{self.port} ({reason_code}), subscribing {self.topic}")
+        client.subscribe(self.topic)
+
+    def _on_message(self, client, userdata, msg):
+        # The ingester's decoder: msgspec/orjson when installed, typed fields and a parsed tst
+        try:
+            vp = decode(msg.payload)
+        except (ValueError, TypeError, AttributeError):  # not JSON, not an object, or a malformed tst
+            return
+        if vp is not None:
+            self.store.update(vp)
+
+    def start(self):
+        self.client.connect_async(self.broker, self.port, 60)
+        self.client.loop_start()
+
+    def stop(self):
+        self.client.loop_stop()
+        self.client.disconnect()
+
+
+store = VehicleStore()
+subscriber = HfpSubscriber(store) if VEHICLE_SOURCE == "mqtt" else None
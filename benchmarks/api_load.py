@@ -0,0 +1,97 @@
+"""API latency/throughput under concurrent clients (run through benchmarks/run.py)."""
+import os
+import subprocess
+import sys
+import threading
+import time
+
+import requests
+
+from common import ROOT, db_env, percentile
+
+
+def start_api(dsn, port, pool_max):
+    """uvicorn serving api.main:app against `dsn`; returns (process, base URL) once /health answers."""
+    env = dict(os.environ, **db_env(dsn))
+    env.update({"VEHICLE_SOURCE": "db", "DB_POOL_MAX": str(pool_max), "DB_POOL_MIN": str(min(4, pool_max))})
+    process = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "api.main:app", "--host", "127.0.0.1", "--port", str(port),
+         "--log-level", "warning"],
+        cwd=ROOT, env=env,
+    )
+    url = f"http://127.0.0.1:{port}"
+    deadline = time.monotonic() + 30
+    while time.monotonic() < deadline:
+        try:
+            if requests.get(url + "/health", timeout=1).ok:
+                return process, url
+        except requests.ConnectionError:
+            pass
+        if process.poll() is not None:
+            break
+        time.sleep(0.2)
+    process.terminate()
+    raise RuntimeError("API server did not start")
+
+
+def load(url, clients, duration):
+    """`clients` threads requesting `url` back to back for `duration` seconds."""
+    latencies = [[] for _ in range(clients)]
+    errors = [0] * clients
+    payload_bytes = [0] * clients
+    deadline = time.perf_counter() + duration
+
+    def client(n):
+        session = requests.Session()
+        while time.perf_counter() < deadline:
+            started = time.perf_counter()
+            try:
+                response = session.get(url, timeout=30)
+                body = response.content
+                if response.status_code >= 400:
+                    errors[n] += 1
+                    continue
+            except requests.RequestException:
+                errors[n] += 1
+                continue
+            latencies[n].append(time.perf_counter() - started)
+            payload_bytes[n] += len(body)
+
+    threads = [threading.Thread(target=client, args=(n,)) for n in range(clients)]
+    started = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - started
+
+    samples = sorted(latency for per_client in latencies for latency in per_client)
+    ms = lambda value: value * 1000 if value is not None else None  # noqa: E731
+    return {
+        "clients": clients,
+        "requests": len(samples),
+        "errors": sum(errors),
+        "req_per_s": len(samples) / elapsed,
+        "p50_ms": ms(percentile(samples, 50)),
+        "p95_ms": ms(percentile(samples, 95)),
+        "p99_ms": ms(percentile(samples, 99)),
+        "max_ms": ms(samples[-1] if samples else None),
+        "avg_response_kb": sum(payload_bytes) / max(len(samples), 1) / 1024,
+    }
+
+
+def bench_api(dsn, endpoints, clients, duration, api_url=None, port=18007):
+    """Load every endpoint in turn, starting a local API server unless `api_url` is given."""
+    process = None
+    if api_url is None:
+        process, api_url = start_api(dsn, port, pool_max=clients)
+    try:
+        results = {}
+        for endpoint in endpoints:
+            load(api_url + endpoint, clients, min(duration, 1.0))  # warm up
+            results[endpoint] = load(api_url + endpoint, clients, duration)
+        return results
+    finally:
+        if process is not None:
+            process.terminate()
+            process.wait(10)
@@ -0,0 +1,82 @@
+"""Shared helpers for the benchmark suite (see benchmarks/run.py)."""
+import os
+import platform
+import subprocess
+import sys
+from datetime import datetime, timezone
+
+import psycopg2
+from psycopg2.extensions import make_dsn, parse_dsn
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+
+# Matches benchmarks/docker-compose.yaml
+BENCH_DSN = os.getenv("BENCH_DSN", "host=localhost port=25432 dbname=hslbussit user=postgres password=bench")
+BENCH_MQTT = os.getenv("BENCH_MQTT", "localhost:21883")
+
+for path in ("tools", os.path.join("ingestion", "mqtt_hfp_ingest"), "ingestion"):
+    if os.path.join(ROOT, path) not in sys.path:
+        sys.path.insert(0, os.path.join(ROOT, path))
+
+
+def db_env(dsn):
+    """DB_* variables (ingesters, gtfs_static) and PG* variables (API) for `dsn`."""
+    params = parse_dsn(dsn)
+    env = {
+        "DB_HOST": params.get("host", "localhost"),
+        "DB_PORT": params.get("port", "5432"),
+        "DB_NAME": params.get("dbname", "hslbussit"),
+        "DB_USER": params.get("user", "postgres"),
+        "DB_PASS": params.get("password", ""),
+    }
+    env.update({
+        "PGHOST": env["DB_HOST"], "PGPORT": env["DB_PORT"], "PGDATABASE": env["DB_NAME"],
+        "PGUSER": env["DB_USER"], "PGPASSWORD": env["DB_PASS"],
+    })
+    return env
+
+
+def redact_dsn(dsn):
+    """`dsn` without its password, for results that get shared."""
+    try:
+        params = parse_dsn(dsn)
+    except psycopg2.ProgrammingError:
+        return "<unparsable>"
+    params.pop("password", None)
+    return make_dsn(**params)
+
+
+def execute(dsn, statement):
+    conn = psycopg2.connect(dsn)
+    try:
+        with conn.cursor() as cur:
+            cur.execute(statement)
+            result = cur.fetchone() if cur.description else None
+        conn.commit()
+        return result
+    finally:
+        conn.close()
+
+
+def percentile(sorted_values, p):
+    """Nearest-rank percentile of an already sorted list."""
+    if not sorted_values:
+        return None
+    index = max(int(round(p / 100 * len(sorted_values) + 0.5)) - 1, 0)
+    return sorted_values[min(index, len(sorted_values) - 1)]
+
+
+def environment():
+    try:
+        commit = subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], cwd=ROOT, capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        commit = None
+    return {
+        "timestamp": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+        "commit": commit,
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpus": os.cpu_count(),
+    }
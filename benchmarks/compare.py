@@ -0,0 +1,67 @@
+"""
+Compare two benchmarks/run.py result files and flag regressions.
+
+    python benchmarks/compare.py baseline.json results.json --tolerance 0.10
+
+Metrics ending in `_per_s` are better when higher, metrics ending in `_ms`
+or `_s` are better when lower; other values are informational. Exits with 1
+if any metric is worse than the baseline by more than --tolerance.
+"""
+import argparse
+import json
+import sys
+
+
+def metrics(results, prefix=""):
+    """Flatten nested result dicts to {"bench.endpoint.metric": value} for numeric values."""
+    flat = {}
+    for key, value in results.items():
+        name = f"{prefix}{key}"
+        if isinstance(value, dict):
+            flat.update(metrics(value, name + "."))
+        elif isinstance(value, (int, float)) and not isinstance(value, bool):
+            flat[name] = value
+    return flat
+
+
+def direction(name):
+    metric = name.rsplit(".", 1)[-1]
+    if metric.endswith("_per_s"):
+        return 1
+    if metric.endswith("_ms") or metric.endswith("_s"):
+        return -1
+    return 0
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("baseline")
+    parser.add_argument("current")
+    parser.add_argument("--tolerance", type=float, default=0.10, help="allowed relative slowdown (default 0.10)")
+    args = parser.parse_args()
+
+    with open(args.baseline) as f:
+        baseline = metrics(json.load(f)["results"])
+    with open(args.current) as f:
+        current = metrics(json.load(f)["results"])
+
+    regressions = 0
+    print(f"{'metric':<48} {'baseline':>12} {'current':>12} {'change':>8}")
+    for name in sorted(set(baseline) & set(current)):
+        sign = direction(name)
+        if not sign or not baseline[name]:
+            continue
+        change = (current[name] - baseline[name]) / abs(baseline[name])
+        regressed = change * sign < -args.tolerance
+        regressions += regressed
+        print(f"{name:<48} {baseline[name]:>12.2f} {current[name]:>12.2f} {change:>+7.1%}"
+              f"{'  ❌ regression' if regressed else ''}")
+
+    if regressions:
+        print(f"❌ {regressions} metric(s) regressed by more than {args.tolerance:.0%}")
+        sys.exit(1)
+    print("✅ No regressions")
+
+
+if __name__ == "__main__":
+    main()
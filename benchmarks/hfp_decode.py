@@ -0,0 +1,98 @@
+"""
+Single-core HFP decode throughput: the original on_message decode versus the
+decoders in ingestion/mqtt_hfp_ingest/decode.py.
+
+    python benchmarks/hfp_decode.py                       # synthetic payloads
+    python benchmarks/hfp_decode.py --payloads sample.jsonl
+
+--payloads takes one raw HFP payload per line (e.g. captured with
+mosquitto_sub -t '/hfp/v2/journey/ongoing/vp/bus/#' > sample.jsonl).
+"""
+import argparse
+import json
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "ingestion", "mqtt_hfp_ingest"))
+import decode  # noqa: E402
+
+
+def synthetic_payloads(count, seed=1):
+    rng = random.Random(seed)
+    payloads = []
+    for i in range(count):
+        vp = {
+            "desi": rng.choice(["551", "550", "20", "39N", "615"]),
+            "dir": rng.choice(["1", "2"]),
+            "oper": rng.choice([6, 12, 17, 18, 22, 47]),
+            "veh": rng.randint(1, 1999),
+            "tst": f"2025-06-19T10:{rng.randint(0, 59):02d}:{rng.randint(0, 59):02d}.{rng.randint(0, 999):03d}Z",
+            "tsi": 1750327953 + i,
+            "spd": round(rng.uniform(0, 25), 2),
+            "hdg": rng.randint(0, 359),
+            "lat": round(rng.uniform(60.1, 60.4), 6),
+            "long": round(rng.uniform(24.6, 25.2), 6),
+            "acc": round(rng.uniform(-1.5, 1.5), 2),
+            "dl": rng.randint(-300, 600),
+            "odo": rng.randint(0, 40000),
+            "drst": rng.choice([0, 1]),
+            "oday": "2025-06-19",
+            "jrn": rng.randint(1, 2000),
+            "line": rng.randint(1, 1500),
+            "start": f"{rng.randint(5, 23):02d}:{rng.choice(['00', '15', '30', '45'])}",
+            "loc": "GPS",
+            "stop": rng.choice([None, rng.randint(1000000, 9999999)]),
+            "route": rng.choice(["2551", "2550", "1020", "4615"]),
+            "occu": 0,
+        }
+        payloads.append(json.dumps({"VP": vp}).encode())
+    return payloads
+
+
+def legacy_decode(payload):
+    """The decode step of the original on_message, minus its per-message logging."""
+    vp = json.loads(payload.decode("utf-8")).get("VP", {})
+    if not vp:
+        return None
+    return {key: vp.get(key) for key in decode.FIELDS}
+
+
+def measure(fn, payloads, repeat):
+    best = float("inf")
+    for _ in range(repeat):
+        started = time.perf_counter()
+        for payload in payloads:
+            fn(payload)
+        best = min(best, time.perf_counter() - started)
+    return len(payloads) / best
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--payloads", help="file with one raw HFP payload per line")
+    parser.add_argument("--count", type=int, default=100000, help="synthetic payloads to generate")
+    parser.add_argument("--repeat", type=int, default=5, help="best of N runs")
+    args = parser.parse_args()
+
+    if args.payloads:
+        with open(args.payloads, "rb") as f:
+            payloads = [line.strip() for line in f if line.strip()]
+    else:
+        payloads = synthetic_payloads(args.count)
+
+    decoders = [("legacy json + dict", legacy_decode), (f"dict ({'orjson' if decode.orjson else 'json'})", decode.decode_dict)]
+    if decode.BACKEND == "msgspec":
+        decoders.append(("msgspec struct", decode.decode))
+
+    baseline = None
+    print(f"{len(payloads)} payloads, best of {args.repeat}")
+    for name, fn in decoders:
+        rate = measure(fn, payloads, args.repeat)
+        baseline = baseline or rate
+        print(f"  {name:<22} {rate:>12,.0f} msg/s  ({rate / baseline:.1f}x)")
+
+
+if __name__ == "__main__":
+    main()
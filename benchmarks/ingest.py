@@ -0,0 +1,319 @@
+"""Ingest benchmarks: HFP, GTFS-RT and GTFS static (run through benchmarks/run.py)."""
+import csv
+import functools
+import importlib.util
+import io
+import os
+import random
+import signal
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import zipfile
+from http.server import SimpleHTTPRequestHandler, ThreadingHTTPServer
+
+from common import ROOT, db_env, execute
+
+from feed_replay import synthetic_messages
+
+
+# -- HFP --
+
+def bench_hfp_decode(vehicles, duration, repeat=3):
+    """Single-core decode rate of the ingester's HFP decoder, no database."""
+    import decode
+    payloads = [payload for _, _, payload in synthetic_messages(vehicles, 1.0, duration)]
+    best = float("inf")
+    for _ in range(repeat):
+        started = time.perf_counter()
+        for payload in payloads:
+            decode.decode(payload)
+        best = min(best, time.perf_counter() - started)
+    return {"backend": decode.BACKEND, "messages": len(payloads), "msgs_per_s": len(payloads) / best}
+
+
+def bench_hfp_pipeline(dsn, vehicles, duration):
+    """
+    Topic filter -> decode -> BatchWriter -> mqtt_hfp in one process, no
+    broker: the ceiling of one ingest worker.
+    """
+    from decode import decode
+    from topic import TopicFilter
+    from writer import BatchWriter
+
+    messages = list(synthetic_messages(vehicles, 1.0, duration))
+    execute(dsn, "TRUNCATE mqtt_hfp")
+    topic_filter = TopicFilter()
+    writer = BatchWriter(dsn, backpressure="block", block_timeout=60)
+    writer.start()
+
+    started = time.perf_counter()
+    for _, topic, payload in messages:
+        if topic_filter.accepts(topic):
+            record = decode(payload)
+            if record is not None:
+                writer.submit(record)
+    submitted = time.perf_counter()
+    writer.stop(timeout=600)
+    elapsed = time.perf_counter() - started
+
+    rows = execute(dsn, "SELECT count(*) FROM mqtt_hfp")[0]
+    return {
+        "messages": len(messages),
+        "rows": rows,
+        "msgs_per_s": len(messages) / elapsed,
+        "decode_submit_s": submitted - started,
+        "elapsed_s": elapsed,
+        "batches": writer.batches,
+    }
+
+
+def bench_hfp_e2e(dsn, broker, vehicles, duration, workers=1):
+    """
+    Publish synthetic traffic to a local broker as fast as possible and time
+    how long ingestion/mqtt_hfp_ingest/main.py takes to make it visible in
+    mqtt_hfp. QoS 0 end to end, so `lost` counts messages that never arrived.
+    """
+    import paho.mqtt.client as mqtt
+
+    host, port = broker.rsplit(":", 1)
+    try:
+        socket.create_connection((host, int(port)), timeout=2).close()
+    except OSError as e:
+        return {"skipped": f"no MQTT broker at {broker}: {e}"}
+
+    messages = list(synthetic_messages(vehicles, 1.0, duration))
+    execute(dsn, "TRUNCATE mqtt_hfp")
+
+    env = dict(os.environ, **db_env(dsn))
+    env.update({
+        "MQTT_BROKER": host, "MQTT_PORT": port, "HFP_WORKERS": str(workers),
+        "HFP_BACKPRESSURE": "block", "HFP_STATS_INTERVAL": "10",
+        "PYTHONPATH": os.path.join(ROOT, "ingestion"),
+    })
+    env.pop("HFP_SPOOL_DIR", None)
+    ingester = subprocess.Popen(
+        [sys.executable, "main.py"], cwd=os.path.join(ROOT, "ingestion", "mqtt_hfp_ingest"), env=env,
+        stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+    )
+    try:
+        time.sleep(3)  # connect and subscribe
+        client = mqtt.Client()
+        client.connect(host, int(port), 60)
+        client.loop_start()
+        started = time.perf_counter()
+        for _, topic, payload in messages:
+            client.publish(topic, payload, qos=0)
+        published = time.perf_counter()
+
+        rows, last_change, seen = 0, published, 0
+        while rows < len(messages) and time.perf_counter() - last_change < 10:
+            time.sleep(0.5)
+            rows = execute(dsn, "SELECT count(*) FROM mqtt_hfp")[0]
+            if rows != seen:
+                seen, last_change = rows, time.perf_counter()
+        client.loop_stop()
+        client.disconnect()
+    finally:
+        ingester.send_signal(signal.SIGTERM)
+        ingester.wait(60)
+
+    elapsed = last_change - started
+    return {
+        "messages": len(messages),
+        "rows": rows,
+        "lost": len(messages) - rows,
+        "workers": workers,
+        "publish_s": published - started,
+        "elapsed_s": elapsed,
+        "msgs_per_s": rows / elapsed,
+    }
+
+
+# -- GTFS-RT --
+
+def synthetic_feeds(vehicles, feeds, interval=5):
+    from google.transit import gtfs_realtime_pb2
+
+    rng = random.Random(1)
+    now = int(time.time()) - feeds * interval
+    contents = []
+    for n in range(feeds):
+        feed = gtfs_realtime_pb2.FeedMessage()
+        feed.header.gtfs_realtime_version = "2.0"
+        feed.header.timestamp = now + n * interval
+        for v in range(vehicles):
+            entity = feed.entity.add()
+            entity.id = str(v)
+            vp = entity.vehicle
+            vp.vehicle.id = f"{v:05d}"
+            vp.trip.route_id = str(1000 + v % 500)
+            vp.position.latitude = 60.1 + rng.random() * 0.3
+            vp.position.longitude = 24.6 + rng.random() * 0.6
+            vp.position.bearing = rng.randint(0, 359)
+            vp.position.speed = rng.random() * 20
+            # Roughly a third of vehicles have not reported since the previous feed
+            vp.timestamp = feed.header.timestamp - (interval if rng.random() < 0.3 else 0)
+        contents.append(feed.SerializeToString())
+    return contents
+
+
+def bench_gtfs_rt(dsn, vehicles, feeds):
+    """parse_feed() + PositionWriter.write() of vehicle_positions_ingest.py over synthetic feeds."""
+    os.environ.update(db_env(dsn))
+    import vehicle_positions_ingest as ingest
+
+    contents = synthetic_feeds(vehicles, feeds)
+    execute(dsn, "TRUNCATE vehicle_positions")
+    writer = ingest.PositionWriter()
+    parse_s = write_s = 0.0
+    for content in contents:
+        started = time.perf_counter()
+        _, rows = ingest.parse_feed(content)
+        parsed = time.perf_counter()
+        writer.write(rows)
+        parse_s += parsed - started
+        write_s += time.perf_counter() - parsed
+
+    entities = vehicles * feeds
+    return {
+        "feeds": feeds,
+        "entities": entities,
+        "rows": execute(dsn, "SELECT count(*) FROM vehicle_positions")[0],
+        "suppressed": writer.suppressed,
+        "entities_per_s": entities / (parse_s + write_s),
+        "parse_entities_per_s": entities / parse_s,
+        "parse_s": parse_s,
+        "write_s": write_s,
+    }
+
+
+# -- GTFS static --
+
+def _gtfs_tables():
+    """TABLES from gtfs_static/main.py, without running it."""
+    sys.path.insert(0, os.path.join(ROOT, "gtfs_static"))
+    try:
+        spec = importlib.util.spec_from_file_location("gtfs_static_main", os.path.join(ROOT, "gtfs_static", "main.py"))
+        module = importlib.util.module_from_spec(spec)
+        spec.loader.exec_module(module)
+        return module.TABLES
+    finally:
+        sys.path.pop(0)
+
+
+def synthetic_gtfs(path, scale):
+    """A GTFS zip shaped like HSL's feed at `scale` (1.0 is about HSL size)."""
+    rng = random.Random(1)
+    stops = max(int(8500 * scale), 100)
+    routes = max(int(550 * scale), 10)
+    trips = max(int(200000 * scale), 100)
+    stops_per_trip = 25
+    shape_points = 300
+
+    def write(z, name, header, rows):
+        with z.open(name, "w") as raw, io.TextIOWrapper(raw, encoding="utf-8", newline="") as f:
+            out = csv.writer(f)
+            out.writerow(header)
+            out.writerows(rows)
+
+    with zipfile.ZipFile(path, "w", zipfile.ZIP_DEFLATED) as z:
+        write(z, "agency.txt", ["agency_id", "agency_name", "agency_url", "agency_timezone"],
+              [["HSL", "Helsingin seudun liikenne", "https://www.hsl.fi/", "Europe/Helsinki"]])
+        write(z, "stops.txt", ["stop_id", "stop_name", "stop_lat", "stop_lon"],
+              ([str(1000000 + s), f"Stop {s}", f"{60.1 + rng.random() * 0.3:.6f}", f"{24.6 + rng.random() * 0.6:.6f}"]
+               for s in range(stops)))
+        write(z, "routes.txt", ["route_id", "agency_id", "route_short_name", "route_long_name", "route_type"],
+              ([str(1000 + r), "HSL", str(r), f"Route {r}", "3"] for r in range(routes)))
+        write(z, "calendar.txt",
+              ["service_id", "monday", "tuesday", "wednesday", "thursday", "friday", "saturday", "sunday",
+               "start_date", "end_date"],
+              ([f"S{s}", "1", "1", "1", "1", "1", str(s % 2), str(s % 2), "20250101", "20251231"] for s in range(20)))
+        write(z, "calendar_dates.txt", ["service_id", "date", "exception_type"],
+              ([f"S{s}", f"202506{d:02d}", "2"] for s in range(20) for d in range(1, 8)))
+        write(z, "trips.txt", ["route_id", "service_id", "trip_id", "trip_headsign", "direction_id", "shape_id"],
+              ([str(1000 + t % routes), f"S{t % 20}", f"T{t}", "Keskusta", str(t % 2), f"SH{t % (routes * 2)}"]
+               for t in range(trips)))
+
+        def stop_times():
+            for t in range(trips):
+                first = rng.randint(5 * 3600, 23 * 3600)
+                for seq in range(1, stops_per_trip + 1):
+                    at = first + seq * 90
+                    clock = f"{at // 3600:02d}:{at // 60 % 60:02d}:{at % 60:02d}"
+                    yield [f"T{t}", clock, clock, str(1000000 + rng.randrange(stops)), str(seq), "0", "0",
+                           f"{seq * 400.0:.1f}", "1"]
+        write(z, "stop_times.txt",
+              ["trip_id", "arrival_time", "departure_time", "stop_id", "stop_sequence", "pickup_type",
+               "drop_off_type", "shape_dist_traveled", "timepoint"],
+              stop_times())
+        write(z, "shapes.txt",
+              ["shape_id", "shape_pt_lat", "shape_pt_lon", "shape_pt_sequence", "shape_dist_traveled"],
+              ([f"SH{s}", f"{60.1 + p * 0.001:.6f}", f"{24.6 + p * 0.001:.6f}", str(p), f"{p * 50.0:.1f}"]
+               for s in range(routes * 2) for p in range(shape_points)))
+        write(z, "transfers.txt", ["from_stop_id", "to_stop_id", "transfer_type", "min_transfer_time"],
+              ([str(1000000 + s), str(1000000 + (s + 1) % stops), "2", "120"] for s in range(0, stops, 10)))
+        write(z, "fare_attributes.txt",
+              ["fare_id", "price", "currency_type", "payment_method", "transfers", "agency_id", "transfer_duration"],
+              [["AB", "3.10", "EUR", "1", "", "HSL", "5400"], ["ABC", "4.10", "EUR", "1", "", "HSL", "6600"]])
+        write(z, "fare_rules.txt", ["fare_id", "route_id", "origin_id", "destination_id", "contains_id"],
+              ([["AB", "ABC"][r % 2], str(1000 + r), "", "", ""] for r in range(routes)))
+        write(z, "feed_info.txt",
+              ["feed_publisher_name", "feed_publisher_url", "feed_lang", "feed_start_date", "feed_end_date",
+               "feed_version"],
+              [["HSL", "https://www.hsl.fi/", "fi", "20250101", "20251231", "bench"]])
+    return {"stops": stops, "routes": routes, "trips": trips, "stop_times": trips * stops_per_trip}
+
+
+class QuietHandler(SimpleHTTPRequestHandler):
+    def log_message(self, format, *args):
+        pass
+
+
+def bench_gtfs_static(dsn, zip_path=None, scale=0.1):
+    """
+    Wall time of gtfs_static/main.py against a feed served from a local HTTP
+    server: a cold import into empty tables, a forced reload of the same feed
+    and a refresh where nothing changed.
+    """
+    workdir = tempfile.mkdtemp(prefix="bench_gtfs_")
+    sizes = {}
+    if zip_path is None:
+        zip_path = os.path.join(workdir, "feed.zip")
+        sizes = synthetic_gtfs(zip_path, scale)
+
+    handler = functools.partial(QuietHandler, directory=os.path.dirname(os.path.abspath(zip_path)))
+    server = ThreadingHTTPServer(("127.0.0.1", 0), handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+
+    tables = list(_gtfs_tables()) + ["gtfs_feed_version"]
+    execute(dsn, "DROP TABLE IF EXISTS " + ", ".join(tables) + " CASCADE")
+
+    env = dict(os.environ, **db_env(dsn))
+    env.update({
+        "GTFS_URL": f"http://127.0.0.1:{server.server_port}/{os.path.basename(zip_path)}",
+        "GTFS_ZIP_PATH": os.path.join(workdir, "download", "feed.zip"),
+    })
+
+    def run(force):
+        started = time.perf_counter()
+        subprocess.run(
+            [sys.executable, "main.py"], cwd=os.path.join(ROOT, "gtfs_static"), check=True,
+            env=dict(env, GTFS_FORCE="1" if force else "0"), stdout=subprocess.DEVNULL,
+        )
+        return time.perf_counter() - started
+
+    try:
+        results = {
+            "zip_mb": os.path.getsize(zip_path) / 1e6,
+            "cold_import_s": run(force=True),
+            "forced_reload_s": run(force=True),
+            "unchanged_refresh_s": run(force=False),
+        }
+    finally:
+        server.shutdown()
+    results.update(sizes)
+    return results
@@ -0,0 +1,96 @@
+"""
+End-to-end benchmark suite. Runs against a scratch database: tables are
+truncated and the GTFS tables dropped and re-imported.
+
+    docker compose -f benchmarks/docker-compose.yaml up -d   # Timescale on :25432, Mosquitto on :21883
+    python benchmarks/run.py --output results.json
+    python benchmarks/run.py --only hfp-pipeline,api --output results.json
+    python benchmarks/compare.py baseline.json results.json
+
+Benchmarks (--only):
+  hfp-decode      HFP payload decode rate, no database
+  hfp-pipeline    topic filter + decode + BatchWriter into mqtt_hfp, no broker
+  hfp-e2e         broker -> ingestion/mqtt_hfp_ingest/main.py -> mqtt_hfp (needs --mqtt)
+  gtfs-rt         parse + write of vehicle_positions_ingest.py, entities/s
+  gtfs-static     gtfs_static/main.py import time (synthetic feed, or --gtfs-zip)
+  api             p50/p95/p99 latency and req/s of API endpoints under --clients
+
+Results are written as JSON: {"environment": ..., "parameters": ..., "results": {benchmark: {metric: value}}}.
+"""
+import argparse
+import json
+import sys
+import traceback
+
+from common import BENCH_DSN, BENCH_MQTT, environment, redact_dsn
+
+BENCHMARKS = ("hfp-decode", "hfp-pipeline", "hfp-e2e", "gtfs-rt", "gtfs-static", "api")
+
+
+def run(name, args):
+    import ingest
+    if name == "hfp-decode":
+        return ingest.bench_hfp_decode(args.vehicles, args.hfp_duration)
+    if name == "hfp-pipeline":
+        return ingest.bench_hfp_pipeline(args.dsn, args.vehicles, args.hfp_duration)
+    if name == "hfp-e2e":
+        return ingest.bench_hfp_e2e(args.dsn, args.mqtt, args.vehicles, args.hfp_duration, args.workers)
+    if name == "gtfs-rt":
+        return ingest.bench_gtfs_rt(args.dsn, args.rt_vehicles, args.rt_feeds)
+    if name == "gtfs-static":
+        return ingest.bench_gtfs_static(args.dsn, args.gtfs_zip, args.gtfs_scale)
+    if name == "api":
+        import api_load
+        return api_load.bench_api(args.dsn, args.endpoints.split(","), args.clients, args.api_duration, args.api_url)
+    raise ValueError(name)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--dsn", default=BENCH_DSN, help="scratch database (default $BENCH_DSN)")
+    parser.add_argument("--mqtt", default=BENCH_MQTT, help="host:port of a local MQTT broker (default $BENCH_MQTT)")
+    parser.add_argument("--only", help=f"comma separated subset of {', '.join(BENCHMARKS)}")
+    parser.add_argument("--output", help="write JSON results here")
+    parser.add_argument("--vehicles", type=int, default=1500, help="HFP vehicles, one message/s each")
+    parser.add_argument("--hfp-duration", type=float, default=60, help="seconds of synthetic HFP traffic")
+    parser.add_argument("--workers", type=int, default=1, help="HFP_WORKERS for hfp-e2e")
+    parser.add_argument("--rt-vehicles", type=int, default=1500, help="entities per GTFS-RT feed")
+    parser.add_argument("--rt-feeds", type=int, default=50)
+    parser.add_argument("--gtfs-zip", help="GTFS zip to import instead of a synthetic one")
+    parser.add_argument("--gtfs-scale", type=float, default=0.1, help="synthetic GTFS size, 1.0 is about HSL")
+    parser.add_argument("--api-url", help="benchmark a running API instead of starting one")
+    parser.add_argument("--endpoints", default="/vehicles,/stops,/trips")
+    parser.add_argument("--clients", type=int, default=16)
+    parser.add_argument("--api-duration", type=float, default=10, help="seconds per endpoint")
+    args = parser.parse_args()
+
+    selected = args.only.split(",") if args.only else list(BENCHMARKS)
+    unknown = set(selected) - set(BENCHMARKS)
+    if unknown:
+        parser.error(f"unknown benchmarks: {', '.join(sorted(unknown))}")
+
+    results = {}
+    failed = False
+    for name in BENCHMARKS:
+        if name not in selected:
+            continue
+        print(f"▶ {name}", flush=True)
+        try:
+            results[name] = run(name, args)
+        except Exception as e:
+            traceback.print_exc()
+            results[name] = {"error": str(e)}
+            failed = True
+        print(json.dumps(results[name], indent=2, default=str), flush=True)
+
+    parameters = dict(vars(args), dsn=redact_dsn(args.dsn))
+    document = {"environment": environment(), "parameters": parameters, "results": results}
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(document, f, indent=2, default=str)
+        print(f"✅ Results written to {args.output}")
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
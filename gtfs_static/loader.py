@@ -0,0 +1,139 @@
+import csv
+import time
+from psycopg2 import sql
+
+COPY_CHUNK_SIZE = 1 << 16
+
+
+def read_header(f):
+    return [name.strip() for name in next(csv.reader([f.readline()]))]
+
+
+def create_table(cur, table, spec):
+    columns = sql.SQL(", ").join(
+        sql.SQL("{} {}").format(sql.Identifier(name), sql.SQL(type_)) for name, type_ in spec["columns"]
+    )
+    if spec.get("key"):
+        columns = sql.SQL("{}, PRIMARY KEY ({})").format(
+            columns, sql.SQL(", ").join(map(sql.Identifier, spec["key"]))
+        )
+    cur.execute(sql.SQL("CREATE TABLE IF NOT EXISTS {} ({})").format(sql.Identifier(table), columns))
+
+    # Tables created by older versions (or init_timescale.sql) may lack newer columns.
+    # ALTER TABLE takes an ACCESS EXCLUSIVE lock even when the column exists, which
+    # would block API readers until the import commits, so only missing ones are added.
+    cur.execute(
+        "SELECT column_name FROM information_schema.columns WHERE table_schema = current_schema() AND table_name = %s",
+        (table,),
+    )
+    existing = {row[0] for row in cur.fetchall()}
+    for name, type_ in spec["columns"]:
+        if name in existing:
+            continue
+        cur.execute(sql.SQL("ALTER TABLE {} ADD COLUMN IF NOT EXISTS {} {}").format(
+            sql.Identifier(table), sql.Identifier(name), sql.SQL(type_)
+        ))
+
+    for columns in spec.get("indexes", []):
+        cur.execute(sql.SQL("CREATE INDEX IF NOT EXISTS {} ON {} ({})").format(
+            sql.Identifier(f"{table}_{'_'.join(columns)}_idx"),
+            sql.Identifier(table),
+            sql.SQL(", ").join(map(sql.Identifier, columns)),
+        ))
+
+
+def _projection(spec, header):
+    return sql.SQL(", ").join(
+        sql.SQL("NULLIF({0}, '')::{1} AS {0}").format(sql.Identifier(name), sql.SQL(type_)) if name in header
+        else sql.SQL("NULL::{1} AS {0}").format(sql.Identifier(name), sql.SQL(type_))
+        for name, type_ in spec["columns"]
+    )
+
+
+def _replace_statement(table, spec, stage, header):
+    """One statement that swaps the contents of a keyless table for the staged file."""
+    return sql.SQL("""
+        WITH cleared AS (DELETE FROM {table})
+        INSERT INTO {table} ({target_cols})
+        SELECT {projected} FROM {stage}
+    """).format(
+        table=sql.Identifier(table),
+        target_cols=sql.SQL(", ").join(sql.Identifier(name) for name, _ in spec["columns"]),
+        projected=_projection(spec, header),
+        stage=sql.Identifier(stage),
+    )
+
+
+def _merge_statement(table, spec, stage, header):
+    """
+    One statement that makes `table` equal to the staged file: upsert every
+    staged row (skipping rows that did not change) and delete rows that are no
+    longer in the file.
+    """
+    names = [name for name, _ in spec["columns"]]
+    key = spec["key"]
+
+    projected = _projection(spec, header)
+    target_cols = sql.SQL(", ").join(map(sql.Identifier, names))
+    key_cols = sql.SQL(", ").join(map(sql.Identifier, key))
+    updates = sql.SQL(", ").join(
+        sql.SQL("{0} = EXCLUDED.{0}").format(sql.Identifier(name)) for name in names if name not in key
+    )
+    key_match = sql.SQL(" AND ").join(
+        sql.SQL("s.{0} = t.{0}").format(sql.Identifier(name)) for name in key
+    )
+
+    return sql.SQL("""
+        WITH staged AS (
+            SELECT DISTINCT ON ({key_cols}) {projected}
+            FROM {stage}
+        ),
+        upserted AS (
+            INSERT INTO {table} AS t ({target_cols})
+            SELECT * FROM staged
+            ON CONFLICT ({key_cols}) DO UPDATE SET {updates}
+            WHERE (t.*) IS DISTINCT FROM (EXCLUDED.*)
+            RETURNING 1
+        )
+        DELETE FROM {table} t
+        WHERE NOT EXISTS (SELECT 1 FROM staged s WHERE {key_match})
+    """).format(
+        key_cols=key_cols, projected=projected, stage=sql.Identifier(stage),
+        table=sql.Identifier(table), target_cols=target_cols, updates=updates, key_match=key_match,
+    )
+
+
+def load_file(conn, table, spec, f):
+    """
+    COPY a GTFS text stream into a temporary all-TEXT staging table shaped
+    like its header line, then merge it into `table` in one set-based
+    statement. COPY pulls the stream in small chunks, so memory use does not
+    depend on file size (stop_times.txt is millions of rows for HSL).
+    Nothing is committed here; the caller decides the transaction boundary.
+    Returns (rows staged, copy seconds, merge seconds).
+    """
+    header = read_header(f)
+    stage = f"stage_{table}"
+
+    with conn.cursor() as cur:
+        cur.execute(sql.SQL("CREATE TEMP TABLE {} ({}) ON COMMIT DROP").format(
+            sql.Identifier(stage),
+            sql.SQL(", ").join(sql.SQL("{} TEXT").format(sql.Identifier(name)) for name in header),
+        ))
+
+        started = time.perf_counter()
+        # The header line has already been consumed from `f`
+        cur.copy_expert(
+            sql.SQL("COPY {} FROM STDIN WITH (FORMAT csv)").format(sql.Identifier(stage)),
+            f,
+            size=COPY_CHUNK_SIZE,
+        )
+        rows = cur.rowcount
+        copied = time.perf_counter()
+
+        statement = _merge_statement if spec.get("key") else _replace_statement
+        cur.execute(statement(table, spec, stage, header))
+        merged = time.perf_counter()
+        cur.execute(sql.SQL("DROP TABLE {}").format(sql.Identifier(stage)))
+
+    return rows, copied - started, merged - copied
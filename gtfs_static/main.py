@@ -1,11 +1,23 @@
+import io
 import os
+import time
 import zipfile
 import requests
 import psycopg2
-import pandas as pd
-from io import BytesIO
+from psycopg2 import sql
+from loader import create_table, load_file
+from versions import create_version_table, file_sha256, latest_version, record_version, touch_version
 
-GTFS_URL = "https://infopalvelut.storage.hsldev.com/gtfs/hsl.zip"
+GTFS_URL = os.getenv("GTFS_URL", "https://infopalvelut.storage.hsldev.com/gtfs/hsl.zip")
+GTFS_ZIP_PATH = os.getenv("GTFS_ZIP_PATH", "/tmp/gtfs_static/hsl.zip")
+DOWNLOAD_CHUNK_SIZE = 1 << 20
+# (connect, read) seconds; the read timeout applies between chunks, not to the whole download
+DOWNLOAD_TIMEOUT = (
+    float(os.getenv("GTFS_CONNECT_TIMEOUT", "10")),
+    float(os.getenv("GTFS_READ_TIMEOUT", "120")),
+)
+# Reload every file even if its hash matches the last applied feed
+GTFS_FORCE = os.getenv("GTFS_FORCE", "0") == "1"
 
 DB_HOST = os.getenv("DB_HOST", "db")
 DB_PORT = os.getenv("DB_PORT", "5432")
@@ -19,96 +31,281 @@ def get_db_connection():
         user=DB_USER, password=DB_PASS
     )
 
-def download_gtfs():
+def download_gtfs(previous=None):
+    """
+    Download the feed to GTFS_ZIP_PATH in fixed-size chunks, or return None
+    if the server says it has not changed since `previous` (conditional GET
+    with the stored ETag / Last-Modified). Returns (etag, last_modified).
+    """
     print("Downloading GTFS...")
-    r = requests.get(GTFS_URL)
-    r.raise_for_status()
-    return BytesIO(r.content)
+    headers = {}
+    if previous and previous["etag"]:
+        headers["If-None-Match"] = previous["etag"]
+    if previous and previous["last_modified"]:
+        headers["If-Modified-Since"] = previous["last_modified"]
+    with requests.get(GTFS_URL, headers=headers, stream=True, timeout=DOWNLOAD_TIMEOUT) as r:
+        if r.status_code == 304:
+            return None
+        r.raise_for_status()
 
-def extract_gtfs(zip_data):
-    print("Extracting files...")
-    with zipfile.ZipFile(zip_data) as z:
-        z.extractall("/tmp/gtfs_static")
+        os.makedirs(os.path.dirname(GTFS_ZIP_PATH), exist_ok=True)
+        partial = GTFS_ZIP_PATH + ".part"
+        size = 0
+        with open(partial, "wb") as f:
+            for chunk in r.iter_content(chunk_size=DOWNLOAD_CHUNK_SIZE):
+                f.write(chunk)
+                size += len(chunk)
+        os.replace(partial, GTFS_ZIP_PATH)
+        print(f"  {size / 1e6:.1f} MB downloaded")
+        return r.headers.get("ETag"), r.headers.get("Last-Modified")
+
+def open_member(z, name):
+    """A zip member as a text stream; rows are decompressed as COPY reads them."""
+    return io.TextIOWrapper(z.open(name), encoding="utf-8-sig", newline="")
+
+# Tables loaded from the feed, in load order. Columns missing from a file are
+# loaded as NULL. Tables without a "key" have no natural key in GTFS and are
+# replaced wholesale on every load.
+TABLES = {
+    "agency": {
+        "file": "agency.txt",
+        "columns": [
+            ("agency_id", "TEXT"),
+            ("agency_name", "TEXT"),
+            ("agency_url", "TEXT"),
+            ("agency_timezone", "TEXT"),
+        ],
+        "key": ["agency_id"],
+    },
+    "stops": {
+        "file": "stops.txt",
+        "columns": [
+            ("stop_id", "TEXT"),
+            ("stop_name", "TEXT"),
+            ("stop_lat", "DOUBLE PRECISION"),
+            ("stop_lon", "DOUBLE PRECISION"),
+        ],
+        "key": ["stop_id"],
+    },
+    "routes": {
+        "file": "routes.txt",
+        "columns": [
+            ("route_id", "TEXT"),
+            ("route_short_name", "TEXT"),
+            ("route_long_name", "TEXT"),
+            ("route_type", "INTEGER"),
+        ],
+        "key": ["route_id"],
+    },
+    "trips": {
+        "file": "trips.txt",
+        "columns": [
+            ("trip_id", "TEXT"),
+            ("route_id", "TEXT"),
+            ("service_id", "TEXT"),
+            ("trip_headsign", "TEXT"),
+            ("direction_id", "INTEGER"),
+            ("shape_id", "TEXT"),
+        ],
+        "key": ["trip_id"],
+        "indexes": [["route_id"], ["service_id"]],
+    },
+    "stop_times": {
+        "file": "stop_times.txt",
+        "columns": [
+            ("trip_id", "TEXT"),
+            ("arrival_time", "INTERVAL"),  # GTFS times run past 24:00:00
+            ("departure_time", "INTERVAL"),
+            ("stop_id", "TEXT"),
+            ("stop_sequence", "INTEGER"),
+            ("pickup_type", "INTEGER"),
+            ("drop_off_type", "INTEGER"),
+            ("shape_dist_traveled", "DOUBLE PRECISION"),
+            ("timepoint", "INTEGER"),
+        ],
+        "key": ["trip_id", "stop_sequence"],
+        "indexes": [["stop_id", "arrival_time"]],
+    },
+    "shapes": {
+        "file": "shapes.txt",
+        "columns": [
+            ("shape_id", "TEXT"),
+            ("shape_pt_lat", "DOUBLE PRECISION"),
+            ("shape_pt_lon", "DOUBLE PRECISION"),
+            ("shape_pt_sequence", "INTEGER"),
+            ("shape_dist_traveled", "DOUBLE PRECISION"),
+        ],
+        "key": ["shape_id", "shape_pt_sequence"],
+    },
+    "calendar": {
+        "file": "calendar.txt",
+        "columns": [
+            ("service_id", "TEXT"),
+            ("monday", "BOOLEAN"),
+            ("tuesday", "BOOLEAN"),
+            ("wednesday", "BOOLEAN"),
+            ("thursday", "BOOLEAN"),
+            ("friday", "BOOLEAN"),
+            ("saturday", "BOOLEAN"),
+            ("sunday", "BOOLEAN"),
+            ("start_date", "DATE"),
+            ("end_date", "DATE"),
+        ],
+        "key": ["service_id"],
+    },
+    "calendar_dates": {
+        "file": "calendar_dates.txt",
+        "columns": [
+            ("service_id", "TEXT"),
+            ("date", "DATE"),
+            ("exception_type", "INTEGER"),
+        ],
+        "key": ["service_id", "date"],
+    },
+    "transfers": {
+        "file": "transfers.txt",
+        "columns": [
+            ("from_stop_id", "TEXT"),
+            ("to_stop_id", "TEXT"),
+            ("transfer_type", "INTEGER"),
+            ("min_transfer_time", "INTEGER"),
+            ("from_route_id", "TEXT"),
+            ("to_route_id", "TEXT"),
+            ("from_trip_id", "TEXT"),
+            ("to_trip_id", "TEXT"),
+        ],
+    },
+    "fare_attributes": {
+        "file": "fare_attributes.txt",
+        "columns": [
+            ("fare_id", "TEXT"),
+            ("price", "NUMERIC"),
+            ("currency_type", "TEXT"),
+            ("payment_method", "INTEGER"),
+            ("transfers", "INTEGER"),
+            ("agency_id", "TEXT"),
+            ("transfer_duration", "INTEGER"),
+        ],
+        "key": ["fare_id"],
+    },
+    "fare_rules": {
+        "file": "fare_rules.txt",
+        "columns": [
+            ("fare_id", "TEXT"),
+            ("route_id", "TEXT"),
+            ("origin_id", "TEXT"),
+            ("destination_id", "TEXT"),
+            ("contains_id", "TEXT"),
+        ],
+    },
+    "feed_info": {
+        "file": "feed_info.txt",
+        "columns": [
+            ("feed_publisher_name", "TEXT"),
+            ("feed_publisher_url", "TEXT"),
+            ("feed_lang", "TEXT"),
+            ("feed_start_date", "DATE"),
+            ("feed_end_date", "DATE"),
+            ("feed_version", "TEXT"),
+        ],
+    },
+}
+
+# A feed without these is broken, not smaller; it is rejected instead of emptying the tables
+REQUIRED_FILES = {"agency.txt", "stops.txt", "routes.txt", "trips.txt", "stop_times.txt"}
 
 def create_tables():
     with get_db_connection() as conn:
         cur = conn.cursor()
-        cur.execute("""
-            CREATE TABLE IF NOT EXISTS agency (
-                agency_id TEXT PRIMARY KEY,
-                agency_name TEXT,
-                agency_url TEXT,
-                agency_timezone TEXT
-            );
-        """)
-        cur.execute("""
-            CREATE TABLE IF NOT EXISTS stops (
-                stop_id TEXT PRIMARY KEY,
-                stop_name TEXT,
-                stop_lat DOUBLE PRECISION,
-                stop_lon DOUBLE PRECISION
-            );
-        """)
-        cur.execute("""
-            CREATE TABLE IF NOT EXISTS routes (
-                route_id TEXT PRIMARY KEY,
-                route_short_name TEXT,
-                route_long_name TEXT,
-                route_type INTEGER
-            );
-        """)
-        cur.execute("""
-            CREATE TABLE IF NOT EXISTS trips (
-                trip_id TEXT PRIMARY KEY,
-                route_id TEXT,
-                service_id TEXT,
-                trip_headsign TEXT,
-                direction_id INTEGER
-            );
-        """)
+        create_version_table(cur)
+        for table, spec in TABLES.items():
+            create_table(cur, table, spec)
         conn.commit()
 
-def load_data():
-    with get_db_connection() as conn:
-        cur = conn.cursor()
+def hash_files(z):
+    members = set(z.namelist())
+    hashes = {}
+    for spec in TABLES.values():
+        if spec["file"] in members:
+            with z.open(spec["file"]) as f:
+                hashes[spec["file"]] = file_sha256(f)
+    return hashes
 
-        agency = pd.read_csv("/tmp/gtfs_static/agency.txt")
-        for _, row in agency.iterrows():
-            cur.execute("""
-                INSERT INTO agency (agency_id, agency_name, agency_url, agency_timezone)
-                VALUES (%s, %s, %s, %s)
-                ON CONFLICT (agency_id) DO UPDATE SET agency_name=EXCLUDED.agency_name
-            """, (row['agency_id'], row['agency_name'], row['agency_url'], row['agency_timezone']))
+def load_data(conn, z, hashes, previous_hashes):
+    """
+    Merge every file whose hash differs from the previously applied feed and
+    empty the tables of files the feed no longer has. Returns the number of
+    tables changed. Nothing is committed here.
+    """
+    loaded = 0
+    for table, spec in TABLES.items():
+        name = spec["file"]
+        if name not in hashes:
+            # DELETE rather than TRUNCATE: readers keep the old rows until the commit instead of blocking
+            with conn.cursor() as cur:
+                cur.execute(sql.SQL("DELETE FROM {}").format(sql.Identifier(table)))
+                removed = cur.rowcount
+            if removed or name in previous_hashes:
+                print(f"  {name}: no longer in feed, {removed} rows removed")
+                loaded += 1
+            else:
+                print(f"  {name}: not in feed, skipped")
+            continue
+        if previous_hashes.get(name) == hashes[name]:
+            print(f"  {name}: unchanged, skipped")
+            continue
+        started = time.perf_counter()
+        with open_member(z, name) as f:
+            rows, copy_s, merge_s = load_file(conn, table, spec, f)
+        print(f"  {name}: {rows} rows in {time.perf_counter() - started:.2f}s "
+              f"(copy {copy_s:.2f}s, merge {merge_s:.2f}s)")
+        loaded += 1
+    return loaded
 
-        stops = pd.read_csv("/tmp/gtfs_static/stops.txt")
-        for _, row in stops.iterrows():
-            cur.execute("""
-                INSERT INTO stops (stop_id, stop_name, stop_lat, stop_lon)
-                VALUES (%s, %s, %s, %s)
-                ON CONFLICT (stop_id) DO UPDATE SET stop_name=EXCLUDED.stop_name
-            """, (row['stop_id'], row['stop_name'], row['stop_lat'], row['stop_lon']))
-
-        routes = pd.read_csv("/tmp/gtfs_static/routes.txt")
-        for _, row in routes.iterrows():
-            cur.execute("""
-                INSERT INTO routes (route_id, route_short_name, route_long_name, route_type)
-                VALUES (%s, %s, %s, %s)
-                ON CONFLICT (route_id) DO UPDATE SET route_short_name=EXCLUDED.route_short_name
-            """, (row['route_id'], row['route_short_name'], row['route_long_name'], row['route_type']))
+def refresh():
+    """
+    Apply the current feed incrementally. All changed files and the new
+    gtfs_feed_version row are committed in a single transaction, so API
+    readers keep seeing the complete previous feed until they see the
+    complete new one.
+    """
+    create_tables()
+    conn = get_db_connection()
+    try:
+        with conn.cursor() as cur:
+            previous = latest_version(cur)
+        conn.commit()
 
-        trips = pd.read_csv("/tmp/gtfs_static/trips.txt")
-        for _, row in trips.iterrows():
-            cur.execute("""
-                INSERT INTO trips (trip_id, route_id, service_id, trip_headsign, direction_id)
-                VALUES (%s, %s, %s, %s, %s)
-                ON CONFLICT (trip_id) DO UPDATE SET trip_headsign=EXCLUDED.trip_headsign
-            """, (row['trip_id'], row['route_id'], row['service_id'], row['trip_headsign'], row['direction_id']))
+        if GTFS_FORCE:
+            previous = dict(previous, etag=None, last_modified=None, files={}) if previous else None
+        try:
+            downloaded = download_gtfs(previous)
+        except (requests.Timeout, requests.ConnectionError) as e:
+            # A read timeout while streaming the body surfaces as ConnectionError
+            print(f"❌ GTFS download failed, keeping the current feed: {e}")
+            return
+        if downloaded is None:
+            print("✅ GTFS feed not modified, nothing to do.")
+            return
+        etag, last_modified = downloaded
 
+        with zipfile.ZipFile(GTFS_ZIP_PATH) as z:
+            hashes = hash_files(z)
+            missing = REQUIRED_FILES - hashes.keys()
+            if missing:
+                print(f"❌ GTFS feed lacks {', '.join(sorted(missing))}, keeping the current feed")
+                return
+            loaded = load_data(conn, z, hashes, previous["files"] if previous else {})
+        with conn.cursor() as cur:
+            if loaded:
+                version_id = record_version(cur, etag, last_modified, hashes)
+                print(f"✅ GTFS static import done, feed version {version_id} ({loaded} files changed).")
+            elif previous:
+                touch_version(cur, previous["id"], etag, last_modified)
+                print("✅ GTFS files unchanged, nothing to do.")
         conn.commit()
+    finally:
+        conn.close()
 
 if __name__ == "__main__":
-    zip_data = download_gtfs()
-    extract_gtfs(zip_data)
-    create_tables()
-    load_data()
-    print("✅ GTFS static import done.")
+    refresh()
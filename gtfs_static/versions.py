@@ -0,0 +1,53 @@
+import json
+import hashlib
+
+# One row per applied feed. The API keys its caches on the latest id, so a new
+# row is only written when at least one file actually changed.
+CREATE_SQL = """
+CREATE TABLE IF NOT EXISTS gtfs_feed_version (
+    id SERIAL PRIMARY KEY,
+    loaded_at TIMESTAMPTZ NOT NULL DEFAULT now(),
+    etag TEXT,
+    last_modified TEXT,
+    files JSONB NOT NULL DEFAULT '{}'
+);
+"""
+
+
+def file_sha256(f, chunk_size=1 << 20):
+    digest = hashlib.sha256()
+    for chunk in iter(lambda: f.read(chunk_size), b""):
+        digest.update(chunk)
+    return digest.hexdigest()
+
+
+def create_version_table(cur):
+    cur.execute(CREATE_SQL)
+
+
+def latest_version(cur):
+    """The most recently applied feed as a dict, or None before the first import."""
+    cur.execute("SELECT id, etag, last_modified, files FROM gtfs_feed_version ORDER BY id DESC LIMIT 1")
+    row = cur.fetchone()
+    if row is None:
+        return None
+    return {"id": row[0], "etag": row[1], "last_modified": row[2], "files": row[3] or {}}
+
+
+def record_version(cur, etag, last_modified, files):
+    cur.execute(
+        "INSERT INTO gtfs_feed_version (etag, last_modified, files) VALUES (%s, %s, %s) RETURNING id",
+        (etag, last_modified, json.dumps(files)),
+    )
+    version_id = cur.fetchone()[0]
+    # Lets API processes LISTENing on gtfs_feed_version drop their caches right away
+    cur.execute("SELECT pg_notify('gtfs_feed_version', %s)", (str(version_id),))
+    return version_id
+
+
+def touch_version(cur, version_id, etag, last_modified):
+    """Remember new HTTP validators for a feed whose files did not change."""
+    cur.execute(
+        "UPDATE gtfs_feed_version SET etag = %s, last_modified = %s WHERE id = %s",
+        (etag, last_modified, version_id),
+    )
@@ -1,9 +1,16 @@
 import os
 
-GTFS_VEHICLE_URL = "https://realtime.hsl.fi/realtime/vehicle-positions/v2/hsl"
+GTFS_VEHICLE_URL = os.getenv("GTFS_VEHICLE_URL", "https://realtime.hsl.fi/realtime/vehicle-positions/v2/hsl")
+GTFS_RT_INTERVAL = float(os.getenv("GTFS_RT_INTERVAL", "5"))
+GTFS_RT_HTTP_TIMEOUT = float(os.getenv("GTFS_RT_HTTP_TIMEOUT", "10"))
+# Durable spool for parsed feeds (disabled when unset), see spool.py
+GTFS_RT_SPOOL_DIR = os.getenv("GTFS_RT_SPOOL_DIR")
+GTFS_RT_SPOOL_MAX_BYTES = int(os.getenv("GTFS_RT_SPOOL_MAX_BYTES", str(1 << 30)))
+# Prometheus listener (0 disables), see metrics.py
+GTFS_RT_METRICS_PORT = int(os.getenv("GTFS_RT_METRICS_PORT", "9102"))
 
-DB_HOST = "db"
-DB_PORT = 5432
-DB_NAME = "hslbussit"
-DB_USER = "postgres"
-DB_PASS = "supersecurepassword"
\ No newline at end of file
+DB_HOST = os.getenv("DB_HOST", "db")
+DB_PORT = int(os.getenv("DB_PORT", "5432"))
+DB_NAME = os.getenv("DB_NAME", "hslbussit")
+DB_USER = os.getenv("DB_USER", "postgres")
+DB_PASS = os.getenv("DB_PASS", "supersecurepassword")
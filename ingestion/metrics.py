@@ -0,0 +1,104 @@
+"""
+Prometheus metrics for the ingesters.
+
+The counters the ingesters already keep as plain ints (BatchWriter.stats(),
+Spool.stats(), ...) are read only when Prometheus scrapes, through
+StatsCollector, so the message callbacks do no extra work per message. The
+histograms below are observed once per database write.
+
+Every metric carries a `source` label ("hfp" or "gtfs_rt"); each HFP worker
+process serves its own listener, so shards are told apart by scrape target.
+"""
+import logging
+
+from prometheus_client import REGISTRY, Histogram, start_http_server
+from prometheus_client.core import CounterMetricFamily, GaugeMetricFamily
+
+logger = logging.getLogger(__name__)
+
+BATCH_ROWS = Histogram(
+    "ingest_batch_rows", "Rows per database write", ["source"],
+    buckets=(1, 10, 50, 100, 250, 500, 1000, 2500, 5000),
+)
+DB_WRITE_SECONDS = Histogram(
+    "ingest_db_write_seconds", "Duration of one batch INSERT including commit", ["source"],
+    buckets=(0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10),
+)
+VISIBLE_LAG_SECONDS = Histogram(
+    "ingest_visible_lag_seconds", "Time from a row's event timestamp to the commit that makes it queryable",
+    ["source"],
+    buckets=(0.25, 0.5, 1, 2, 3, 5, 10, 20, 30, 60, 120, 300, 900),
+)
+
+# stats() keys exported as gauges; every other numeric key is a monotonic counter
+GAUGES = {
+    "queue_depth": "Rows waiting in the in-memory writer queue",
+    "backlog_bytes": "Bytes in the spool not yet replayed to the database",
+}
+
+DESCRIPTIONS = {
+    "received": "Messages handed to the writer",
+    "inserted": "Rows committed to the database",
+    "dropped": "Rows dropped by backpressure or rejected by the database",
+    "filtered": "Messages dropped by topic filters before decoding",
+    "batches": "Database writes",
+    "failed_batches": "Database writes that failed and were retried",
+    "appended": "Messages appended to the spool",
+    "fsyncs": "Spool fsync calls",
+    "dropped_bytes": "Spool bytes deleted unreplayed to stay under the size limit",
+    "dropped_segments": "Spool segments deleted unreplayed to stay under the size limit",
+    "replayed": "Spool records written to the database",
+    "failed_writes": "Spool replay batches that failed and were retried",
+    "skipped": "Polled feeds replaced by a newer one before they were written",
+    "suppressed": "Rows not written because the vehicle's timestamp had not advanced",
+    "unchanged": "Polled feeds that were not modified since the previous poll",
+}
+
+
+class StatsCollector:
+    """Exposes a `stats()` dict as ingest_<key>_total counters and ingest_<key> gauges."""
+
+    def __init__(self, source, stats):
+        self.source = source
+        self.stats = stats
+
+    def collect(self):
+        for key, value in self.stats().items():
+            if key in GAUGES:
+                family = GaugeMetricFamily(f"ingest_{key}", GAUGES[key], labels=["source"])
+            else:
+                family = CounterMetricFamily(f"ingest_{key}", DESCRIPTIONS.get(key, key), labels=["source"])
+            family.add_metric([self.source], value)
+            yield family
+
+
+class WriteTimer:
+    """Per-source histogram children, bound once so a write only pays for the observations."""
+
+    def __init__(self, source):
+        self.batch_rows = BATCH_ROWS.labels(source)
+        self.write_seconds = DB_WRITE_SECONDS.labels(source)
+        self.visible_lag = VISIBLE_LAG_SECONDS.labels(source)
+
+    def observe(self, rows, seconds, committed_at, event_times):
+        """Record one committed write; `event_times` are the rows' epoch seconds (None skipped)."""
+        self.batch_rows.observe(rows)
+        self.write_seconds.observe(seconds)
+        observe = self.visible_lag.observe
+        for event_time in event_times:
+            if event_time is not None:
+                observe(max(committed_at - event_time, 0.0))
+
+
+def serve(port, source, stats):
+    """Start the /metrics listener on `port` (0 disables it). A busy port is logged, not fatal."""
+    REGISTRY.register(StatsCollector(source, stats))
+    if not port:
+        return False
+    try:
+        start_http_server(port)
+    except OSError as e:
+        logger.error(f"❌ Metrics listener on port {port} not started: {e}")
+        return False
+    logger.info(f"📈 Metrics on :{port}/metrics")
+    return True
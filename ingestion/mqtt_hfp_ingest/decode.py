@@ -0,0 +1,130 @@
+"""
+HFP payload decoding.
+
+`decode(payload)` turns the raw MQTT payload of a vehicle position message
+into an `HfpRecord` (a typed tuple in mqtt_hfp column order, ready for the
+batched writer) or returns None when the payload has no "VP" object.
+
+The fastest available backend is picked at import time:
+
+- msgspec: decodes straight into typed structs, parsing `tst` to a datetime
+- orjson:  fast dict decoding, `tst` parsed with datetime.fromisoformat
+- json:    stdlib fallback, same as orjson
+"""
+import json
+from datetime import datetime
+from typing import NamedTuple, Optional, Union
+
+try:
+    import msgspec
+except ImportError:
+    msgspec = None
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+
+class HfpRecord(NamedTuple):
+    desi: Optional[str]
+    dir: Optional[str]
+    oper: Optional[int]
+    veh: Optional[int]
+    tst: Optional[datetime]
+    tsi: Optional[int]
+    spd: Optional[float]
+    hdg: Optional[float]
+    lat: Optional[float]
+    long: Optional[float]
+    acc: Optional[float]
+    dl: Optional[float]
+    odo: Optional[float]
+    drst: Optional[int]
+    oday: Optional[str]
+    jrn: Optional[int]
+    line: Optional[int]
+    start: Optional[str]
+    loc: Optional[str]
+    stop: Optional[Union[int, str]]
+    route: Optional[str]
+    occu: Optional[int]
+
+
+FIELDS = HfpRecord._fields
+
+
+def _parse_tst(value):
+    # fromisoformat() accepts the trailing "Z" HFP uses from Python 3.11 on
+    return datetime.fromisoformat(value) if value else None
+
+
+def _record_from_dict(vp):
+    get = vp.get
+    return HfpRecord(
+        get("desi"), get("dir"), get("oper"), get("veh"), _parse_tst(get("tst")),
+        get("tsi"), get("spd"), get("hdg"), get("lat"), get("long"), get("acc"),
+        get("dl"), get("odo"), get("drst"), get("oday"), get("jrn"), get("line"),
+        get("start"), get("loc"), get("stop"), get("route"), get("occu"),
+    )
+
+
+_loads = orjson.loads if orjson is not None else json.loads
+
+
+def decode_dict(payload):
+    """Decode via a plain dict (orjson or stdlib json)."""
+    vp = _loads(payload).get("VP")
+    if not vp:
+        return None
+    return _record_from_dict(vp)
+
+
+if msgspec is not None:
+    class _VP(msgspec.Struct):
+        desi: Optional[str] = None
+        dir: Optional[str] = None
+        oper: Optional[int] = None
+        veh: Optional[int] = None
+        tst: Optional[datetime] = None
+        tsi: Optional[int] = None
+        spd: Optional[float] = None
+        hdg: Optional[float] = None
+        lat: Optional[float] = None
+        long: Optional[float] = None
+        acc: Optional[float] = None
+        dl: Optional[float] = None
+        odo: Optional[float] = None
+        drst: Optional[int] = None
+        oday: Optional[str] = None
+        jrn: Optional[int] = None
+        line: Optional[int] = None
+        start: Optional[str] = None
+        loc: Optional[str] = None
+        stop: Optional[Union[int, str]] = None
+        route: Optional[str] = None
+        occu: Optional[int] = None
+
+    class _Payload(msgspec.Struct):
+        VP: Optional[_VP] = None
+
+    _decoder = msgspec.json.Decoder(_Payload)
+
+    def decode(payload):
+        try:
+            vp = _decoder.decode(payload).VP
+        except msgspec.ValidationError:
+            # Unexpected field types (HFP occasionally sends them); take the lenient path
+            return decode_dict(payload)
+        if vp is None:
+            return None
+        return HfpRecord(
+            vp.desi, vp.dir, vp.oper, vp.veh, vp.tst, vp.tsi, vp.spd, vp.hdg,
+            vp.lat, vp.long, vp.acc, vp.dl, vp.odo, vp.drst, vp.oday, vp.jrn,
+            vp.line, vp.start, vp.loc, vp.stop, vp.route, vp.occu,
+        )
+
+    BACKEND = "msgspec"
+else:
+    decode = decode_dict
+    BACKEND = "orjson" if orjson is not None else "json"
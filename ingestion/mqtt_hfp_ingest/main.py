@@ -1,10 +1,17 @@
 import os
-import json
 import time
+import queue
 import logging
-import psycopg2
+import signal
+import multiprocessing
 import paho.mqtt.client as mqtt
 from datetime import datetime
+from decode import decode, BACKEND
+from metrics import serve as serve_metrics
+from shard import shard_subscriptions
+from spool import Spool, SpoolReplayer
+from topic import TopicFilter
+from writer import BatchWriter
 
 # Environment variables
 MQTT_BROKER = os.getenv("MQTT_BROKER", "mqtt.hsl.fi")
@@ -17,13 +24,37 @@ DB_NAME = os.getenv("DB_NAME", "hslbussit")
 DB_USER = os.getenv("DB_USER", "postgres")
 DB_PASS = os.getenv("DB_PASS", "supersecurepassword")
 
+# Batched writer tuning
+BATCH_SIZE = int(os.getenv("HFP_BATCH_SIZE", "500"))
+FLUSH_INTERVAL = float(os.getenv("HFP_FLUSH_INTERVAL", "1.0"))
+QUEUE_SIZE = int(os.getenv("HFP_QUEUE_SIZE", "50000"))
+BACKPRESSURE = os.getenv("HFP_BACKPRESSURE", "drop_oldest")  # block | drop_oldest | drop_newest
+STATS_INTERVAL = float(os.getenv("HFP_STATS_INTERVAL", "60"))
+
+# Sharding: with HFP_WORKERS > 1 a supervisor runs that many worker processes,
+# each with its own MQTT client, decoder and batched writer (see shard.py)
+WORKERS = int(os.getenv("HFP_WORKERS", "1"))
+SHARD_MODE = os.getenv("HFP_SHARD_MODE", "shared")  # shared | geohash
+SHARD_GROUP = os.getenv("HFP_SHARD_GROUP", "hfp-ingest")
+REPORT_INTERVAL = 5.0
+
+# Durable spool: with HFP_SPOOL_DIR set, accepted payloads are appended to
+# segment files on local disk and replayed to the database in the background
+# (see ingestion/spool.py), so database outages delay rows instead of dropping them
+SPOOL_DIR = os.getenv("HFP_SPOOL_DIR")
+SPOOL_MAX_BYTES = int(os.getenv("HFP_SPOOL_MAX_BYTES", str(2 << 30)))
+SPOOL_FSYNC_INTERVAL = float(os.getenv("HFP_SPOOL_FSYNC_INTERVAL", "1.0"))
+
+# Prometheus listener per worker on HFP_METRICS_PORT + shard (0 disables), see ingestion/metrics.py
+METRICS_PORT = int(os.getenv("HFP_METRICS_PORT", "9101"))
+
 # Setup logging
 logfile_path = "/var/log/mqtt_ingest.log"
 os.makedirs(os.path.dirname(logfile_path), exist_ok=True)
 
 logging.basicConfig(
     level=logging.INFO,
-    format="%(asctime)s [%(levelname)s] %(message)s",
+    format="%(asctime)s [%(levelname)s] %(processName)s: %(message)s",
     handlers=[
         logging.FileHandler(logfile_path),
         logging.StreamHandler()
@@ -32,79 +63,195 @@ logging.basicConfig(
 
 def log(msg): logging.info(msg)
 
-# MQTT event callbacks
-def on_connect(client, userdata, flags, rc):
-    log(f"Connected to MQTT broker {MQTT_BROKER}:{MQTT_PORT} with result code {rc}")
-    client.subscribe(MQTT_TOPIC)
-    log(f"Subscribed to topic: {MQTT_TOPIC}")
-
-def on_message(client, userdata, msg):
-    log("🔔 Message received")
-    try:
-        payload = json.loads(msg.payload.decode("utf-8"))
-        log(f"🔍 Raw payload: {msg.payload[:80]}...")
-
-        vp = payload.get("VP", {})
-        if not vp:
-            log("⚠️  No 'VP' key, skipping insert")
-            return
-
-        record = {
-            "desi": vp.get("desi"),
-            "dir": vp.get("dir"),
-            "oper": vp.get("oper"),
-            "veh": vp.get("veh"),
-            "tst": vp.get("tst"),
-            "tsi": vp.get("tsi"),
-            "spd": vp.get("spd"),
-            "hdg": vp.get("hdg"),
-            "lat": vp.get("lat"),
-            "long": vp.get("long"),
-            "acc": vp.get("acc"),
-            "dl": vp.get("dl"),
-            "odo": vp.get("odo"),
-            "drst": vp.get("drst"),
-            "oday": vp.get("oday"),
-            "jrn": vp.get("jrn"),
-            "line": vp.get("line"),
-            "start": vp.get("start"),
-            "loc": vp.get("loc"),
-            "stop": vp.get("stop"),
-            "route": vp.get("route"),
-            "occu": vp.get("occu"),
-        }
-
-        log(f"✅ Inserting record for veh={record['veh']} tst={record['tst']}")
-
-        conn = psycopg2.connect(
-            host=DB_HOST,
-            port=DB_PORT,
-            dbname=DB_NAME,
-            user=DB_USER,
-            password=DB_PASS,
+running = True
+
+def shutdown(signum, frame):
+    global running
+    running = False
+
+def run_worker(shard=0, shards=1, reports=None):
+    """
+    Ingest one slice of the HFP stream until SIGTERM/SIGINT. Under the
+    supervisor, stats are put on `reports` every REPORT_INTERVAL seconds;
+    standalone they are logged every STATS_INTERVAL seconds.
+    """
+    signal.signal(signal.SIGTERM, shutdown)
+    signal.signal(signal.SIGINT, shutdown)
+
+    # Early-drop filters, evaluated on the topic before the payload is decoded:
+    # HFP_FILTER_ROUTES, HFP_FILTER_OPERATORS, HFP_FILTER_EVENTS, HFP_FILTER_MODES
+    # (comma separated) and HFP_FILTER_BBOX (min_lon,min_lat,max_lon,max_lat)
+    topic_filter = TopicFilter.from_env(os.environ)
+    subscriptions = shard_subscriptions(MQTT_TOPIC, SHARD_MODE, shard, shards, SHARD_GROUP)
+
+    # Writer setup
+    writer = BatchWriter(
+        dsn=f"host={DB_HOST} port={DB_PORT} dbname={DB_NAME} user={DB_USER} password={DB_PASS}",
+        batch_size=BATCH_SIZE,
+        flush_interval=FLUSH_INTERVAL,
+        max_queue=QUEUE_SIZE,
+        backpressure=BACKPRESSURE,
+    )
+
+    spool = replayer = None
+    if SPOOL_DIR:
+        spool = Spool(
+            os.path.join(SPOOL_DIR, f"shard-{shard}"),
+            max_bytes=SPOOL_MAX_BYTES // shards,
+            fsync_interval=SPOOL_FSYNC_INTERVAL,
         )
-        cur = conn.cursor()
-        cur.execute("""
-            INSERT INTO mqtt_hfp (desi, dir, oper, veh, tst, tsi, spd, hdg, lat, long, acc,
-                                  dl, odo, drst, oday, jrn, line, start, loc, stop, route, occu)
-            VALUES (%(desi)s, %(dir)s, %(oper)s, %(veh)s, %(tst)s, %(tsi)s, %(spd)s, %(hdg)s,
-                    %(lat)s, %(long)s, %(acc)s, %(dl)s, %(odo)s, %(drst)s, %(oday)s, %(jrn)s,
-                    %(line)s, %(start)s, %(loc)s, %(stop)s, %(route)s, %(occu)s)
-        """, record)
-        conn.commit()
-        cur.close()
-        conn.close()
-
-        log("✔️ Insert successful")
-
-    except Exception as e:
-        log(f"❌ Error inserting message: {str(e)}")
-
-# MQTT setup
-client = mqtt.Client()
-client.on_connect = on_connect
-client.on_message = on_message
-
-log("🚀 Starting MQTT client loop")
-client.connect(MQTT_BROKER, MQTT_PORT, 60)
-client.loop_forever()
\ No newline at end of file
+        replayer = SpoolReplayer(spool, lambda payloads: write_payloads(writer, payloads), batch_size=BATCH_SIZE)
+        spool.start()
+        replayer.start()
+    else:
+        writer.start()
+
+    # MQTT event callbacks
+    def on_connect(client, userdata, flags, rc):
+        log(f"Connected to MQTT broker {MQTT_BROKER}:{MQTT_PORT} with result code {rc}")
+        client.subscribe([(topic, 0) for topic in subscriptions])
+        log(f"Subscribed to {len(subscriptions)} topic(s): {subscriptions[0]}{' ...' if len(subscriptions) > 1 else ''}")
+
+    def on_message(client, userdata, msg):
+        try:
+            if not topic_filter.accepts(msg.topic):
+                return
+            if spool is not None:
+                spool.append(msg.payload)
+                return
+            record = decode(msg.payload)
+            if record is None:
+                logging.debug("No 'VP' key, skipping insert")
+                return
+            writer.submit(record)
+        except Exception as e:
+            log(f"❌ Error handling message: {str(e)} payload={msg.payload[:80]!r}")
+
+    def stats():
+        if replayer is not None:
+            return dict(writer.stats(), filtered=topic_filter.dropped, **replayer.stats())
+        return dict(writer.stats(), filtered=topic_filter.dropped)
+
+    def counters():
+        if replayer is not None:
+            return dict(writer.stats(), filtered=topic_filter.dropped, **replayer.counters())
+        return dict(writer.stats(), filtered=topic_filter.dropped)
+
+    serve_metrics(METRICS_PORT + shard if METRICS_PORT else 0, "hfp", counters)
+
+    # MQTT setup
+    client = mqtt.Client()
+    client.on_connect = on_connect
+    client.on_message = on_message
+
+    log(f"🚀 Starting MQTT client loop (HFP decoder: {BACKEND}, shard {shard + 1}/{shards})")
+    client.connect(MQTT_BROKER, MQTT_PORT, 60)
+    client.loop_start()
+
+    last_stats = last_report = time.monotonic()
+    while running:
+        time.sleep(1)
+        now = time.monotonic()
+        if reports is not None and now - last_report >= REPORT_INTERVAL:
+            last_report = now
+            reports.put((shard, stats()))
+        if reports is None and now - last_stats >= STATS_INTERVAL:
+            last_stats = now
+            log(f"📊 Writer stats: {stats()}")
+
+    log("🛑 Shutting down, flushing queued rows")
+    client.loop_stop()
+    client.disconnect()
+    if replayer is not None:
+        # Whatever is not replayed yet stays in the spool for the next start
+        replayer.stop()
+        spool.stop()
+    writer.stop()
+    if reports is not None:
+        reports.put((shard, stats()))
+    log(f"📊 Final writer stats: {stats()}")
+
+def write_payloads(writer, payloads):
+    """Decode spooled payloads and insert them as one batch (raises if the database is down)."""
+    rows = []
+    for payload in payloads:
+        try:
+            record = decode(payload)
+        except Exception as e:
+            log(f"❌ Dropping undecodable spooled payload: {str(e)} payload={payload[:80]!r}")
+            continue
+        if record is not None:
+            rows.append(record)
+    if rows:
+        writer.insert(rows)
+
+def start_worker(shard, reports):
+    process = multiprocessing.Process(
+        target=run_worker, args=(shard, WORKERS, reports), name=f"hfp-worker-{shard}"
+    )
+    process.start()
+    return process
+
+def supervise():
+    """
+    Run WORKERS worker processes, restart any that die, and log throughput
+    summed over all workers (plus inserted rows per second) every
+    STATS_INTERVAL seconds.
+    """
+    signal.signal(signal.SIGTERM, shutdown)
+    signal.signal(signal.SIGINT, shutdown)
+
+    reports = multiprocessing.Queue()
+    workers = [start_worker(shard, reports) for shard in range(WORKERS)]
+    latest = {}
+
+    def drain():
+        while True:
+            try:
+                shard, stats = reports.get_nowait()
+            except queue.Empty:
+                return
+            latest[shard] = stats
+
+    def totals():
+        summed = {}
+        for stats in latest.values():
+            for key, value in stats.items():
+                summed[key] = summed.get(key, 0) + value
+        return summed
+
+    log(f"🚀 Supervising {WORKERS} HFP workers ({SHARD_MODE} sharding)")
+    last_stats = time.monotonic()
+    last_inserted = 0
+    while running:
+        time.sleep(1)
+        drain()
+        for shard, process in enumerate(workers):
+            if not process.is_alive() and running:
+                log(f"❌ Worker {shard} exited with code {process.exitcode}, restarting")
+                # Its counters start again from zero in the new process
+                latest.pop(shard, None)
+                workers[shard] = start_worker(shard, reports)
+
+        now = time.monotonic()
+        if now - last_stats >= STATS_INTERVAL:
+            summed = totals()
+            inserted = summed.get("inserted", 0)
+            rate = max(inserted - last_inserted, 0) / (now - last_stats)
+            last_stats, last_inserted = now, inserted
+            per_worker = [latest.get(shard, {}).get("inserted", 0) for shard in range(WORKERS)]
+            log(f"📊 Total stats: {summed}, {rate:.0f} rows/s, inserted per worker: {per_worker}")
+
+    log("🛑 Stopping workers")
+    for process in workers:
+        process.terminate()  # SIGTERM: every worker flushes its own queue
+    for process in workers:
+        process.join(30)
+    drain()
+    log(f"📊 Final total stats: {totals()}")
+
+if __name__ == "__main__":
+    if WORKERS > 1:
+        supervise()
+    else:
+        run_worker()
@@ -0,0 +1,37 @@
+"""
+Splitting the HFP subscription between worker processes.
+
+Two modes, chosen with HFP_SHARD_MODE:
+
+- "shared":  every worker subscribes to `$share/<group>/<topic>` and the
+             broker hands each message to exactly one of them. Needs a broker
+             with shared subscription support (Mosquitto 2, EMQX, HiveMQ, ...).
+- "geohash": each worker subscribes only to its own share of the 100
+             first-level geohash cells (the 0.1 degree digit pair after
+             "<lat>;<long>" in the topic). Works with any broker, but
+             messages without a location in the topic are not received.
+"""
+
+SHARD_MODES = ("shared", "geohash")
+
+# Topic levels between the "/hfp/v2/<journey>/<temporal>/<event>/<mode>" prefix
+# and the first geohash digit pair: operator, vehicle, route, direction,
+# headsign, start, next stop, geohash level and "<lat>;<long>"
+_LEVELS_BEFORE_GEOHASH = 9
+
+GEOHASH_CELLS = [f"{lat}{lon}" for lat in range(10) for lon in range(10)]
+
+
+def shard_subscriptions(topic, mode, index, count, group="hfp-ingest"):
+    """MQTT topic filters for worker `index` of `count`."""
+    if mode not in SHARD_MODES:
+        raise ValueError(f"Unknown shard mode {mode!r}, expected one of {SHARD_MODES}")
+    if count == 1:
+        return [topic]
+    if mode == "shared":
+        return [f"$share/{group}/{topic}"]
+
+    if not topic.endswith("/#") or len(topic.split("/")) != 8:
+        raise ValueError(f"Geohash sharding needs a /hfp/v2/<journey>/<temporal>/<event>/<mode>/# topic, got {topic!r}")
+    prefix = topic[:-2] + "/+" * _LEVELS_BEFORE_GEOHASH
+    return [f"{prefix}/{cell}/#" for cell in GEOHASH_CELLS[index::count]]
@@ -0,0 +1,154 @@
+"""
+HFP v2 topic parsing and ingest filters.
+
+An HFP topic carries most routing fields, so messages can be filtered on the
+topic string before the payload is decoded at all:
+
+    /hfp/v2/journey/ongoing/vp/bus/0018/00423/1054/1/Ruskeasuo/14:02/1111111/4/60;24/19/73/26
+            |       |       |  |   |    |     |    | |         |     |       | |     '-- geohash digits
+            |       |       |  |   |    |     |    | |         |     |       | '-- lat;long integer part
+            |       |       |  |   |    |     |    | |         |     |       '-- geohash level
+            |       |       |  |   |    |     |    | |         |     '-- next stop
+            |       |       |  |   |    |     |    | |         '-- start time
+            |       |       |  |   |    |     |    | '-- headsign
+            |       |       |  |   |    |     |    '-- direction
+            |       |       |  |   |    |     '-- route
+            |       |       |  |   |    '-- vehicle number
+            |       |       |  |   '-- operator
+            |       |       |  '-- transport mode
+            |       |       '-- event type
+            |       '-- temporal type
+            '-- journey type
+
+See https://digitransit.fi/en/developers/apis/5-realtime-api/vehicle-positions/high-frequency-positioning/
+"""
+from typing import NamedTuple, Optional
+
+# Indexes into topic.split("/")
+_JOURNEY_TYPE = 3
+_EVENT_TYPE = 5
+_TRANSPORT_MODE = 6
+_OPERATOR = 7
+_VEHICLE = 8
+_ROUTE = 9
+_DIRECTION = 10
+_GEOHASH = 15
+
+
+class HfpTopic(NamedTuple):
+    journey_type: Optional[str]
+    event_type: Optional[str]
+    transport_mode: Optional[str]
+    operator: Optional[str]
+    vehicle: Optional[str]
+    route: Optional[str]
+    direction: Optional[str]
+    lat: Optional[float]
+    lon: Optional[float]
+    precision: Optional[float]
+
+
+def _level(parts, index):
+    return parts[index] or None if len(parts) > index else None
+
+
+def geohash_cell(parts):
+    """
+    (lat, lon, size) of the south-west corner and edge length in degrees of
+    the cell encoded in the topic's geohash levels, or None without location.
+    """
+    if len(parts) <= _GEOHASH or ";" not in parts[_GEOHASH]:
+        return None
+    lat_int, lon_int = parts[_GEOHASH].split(";", 1)
+    try:
+        lat, lon = float(lat_int), float(lon_int)
+    except ValueError:
+        return None
+    size = 1.0
+    for digits in parts[_GEOHASH + 1:]:
+        if len(digits) != 2 or not digits.isdigit():
+            break
+        size /= 10
+        lat += int(digits[0]) * size
+        lon += int(digits[1]) * size
+    return lat, lon, size
+
+
+def parse_topic(topic):
+    parts = topic.split("/")
+    cell = geohash_cell(parts)
+    lat, lon, size = cell if cell else (None, None, None)
+    return HfpTopic(
+        _level(parts, _JOURNEY_TYPE), _level(parts, _EVENT_TYPE), _level(parts, _TRANSPORT_MODE),
+        _level(parts, _OPERATOR), _level(parts, _VEHICLE), _level(parts, _ROUTE),
+        _level(parts, _DIRECTION), lat, lon, size,
+    )
+
+
+def _number_id(value):
+    # Operator and vehicle numbers are zero padded in topics ("0018", "0000"), compare them as numbers
+    value = value.strip()
+    return str(int(value)) if value.isdigit() else value
+
+
+def _id_set(value):
+    return {_number_id(item) for item in value.split(",") if item.strip()} if value else None
+
+
+def _str_set(value):
+    return {item.strip() for item in value.split(",") if item.strip()} if value else None
+
+
+class TopicFilter:
+    """
+    Cheap accept/reject on the raw topic string. Every configured criterion
+    must match; unset criteria match everything. Messages without a location
+    in the topic are rejected when a bounding box is set.
+    """
+
+    def __init__(self, routes=None, operators=None, event_types=None, transport_modes=None, bbox=None):
+        self.routes = _str_set(routes)
+        self.operators = _id_set(operators)
+        self.event_types = _str_set(event_types)
+        self.transport_modes = _str_set(transport_modes)
+        self.bbox = tuple(float(v) for v in bbox.split(",")) if bbox else None  # min_lon,min_lat,max_lon,max_lat
+        self.enabled = any((self.routes, self.operators, self.event_types, self.transport_modes, self.bbox))
+        self.dropped = 0
+
+    @classmethod
+    def from_env(cls, environ):
+        return cls(
+            routes=environ.get("HFP_FILTER_ROUTES"),
+            operators=environ.get("HFP_FILTER_OPERATORS"),
+            event_types=environ.get("HFP_FILTER_EVENTS"),
+            transport_modes=environ.get("HFP_FILTER_MODES"),
+            bbox=environ.get("HFP_FILTER_BBOX"),
+        )
+
+    def accepts(self, topic):
+        if not self.enabled:
+            return True
+        if self._matches(topic.split("/")):
+            return True
+        self.dropped += 1
+        return False
+
+    def _matches(self, parts):
+        if self.event_types and _level(parts, _EVENT_TYPE) not in self.event_types:
+            return False
+        if self.transport_modes and _level(parts, _TRANSPORT_MODE) not in self.transport_modes:
+            return False
+        if self.operators and _number_id(_level(parts, _OPERATOR) or "") not in self.operators:
+            return False
+        if self.routes and _level(parts, _ROUTE) not in self.routes:
+            return False
+        if self.bbox:
+            cell = geohash_cell(parts)
+            if cell is None:
+                return False
+            lat, lon, size = cell
+            min_lon, min_lat, max_lon, max_lat = self.bbox
+            # Keep the message if its (possibly coarse) cell overlaps the box
+            if lat > max_lat or lat + size < min_lat or lon > max_lon or lon + size < min_lon:
+                return False
+        return True
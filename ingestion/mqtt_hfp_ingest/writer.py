@@ -0,0 +1,217 @@
+import queue
+import logging
+import threading
+import time
+import psycopg2
+from psycopg2.extras import execute_values
+from metrics import WriteTimer
+
+logger = logging.getLogger(__name__)
+
+# Column order of the rows handed to BatchWriter.submit()
+COLUMNS = (
+    "desi", "dir", "oper", "veh", "tst", "tsi", "spd", "hdg", "lat", "long", "acc",
+    "dl", "odo", "drst", "oday", "jrn", "line", "start", "loc", "stop", "route", "occu",
+)
+
+# Duplicates of (veh, tst) are QoS redeliveries; the unique index drops them
+INSERT_SQL = f"INSERT INTO mqtt_hfp ({', '.join(COLUMNS)}) VALUES %s ON CONFLICT DO NOTHING"
+
+BACKPRESSURE_MODES = ("block", "drop_oldest", "drop_newest")
+
+
+class BatchWriter:
+    """
+    Buffers HFP rows in a bounded queue and writes them to mqtt_hfp in
+    multi-row INSERTs over one persistent connection.
+
+    A batch is flushed when it reaches `batch_size` rows or when
+    `flush_interval` seconds have passed since its first row, whichever
+    comes first. When the queue is full, `backpressure` decides what happens:
+
+    - "block":       the caller waits up to `block_timeout` seconds, then the row is dropped
+    - "drop_oldest": the oldest queued row is discarded to make room
+    - "drop_newest": the incoming row is discarded
+
+    Every committed batch is recorded in the ingest_* histograms of
+    metrics.py under `source`.
+    """
+
+    def __init__(self, dsn, batch_size=500, flush_interval=1.0, max_queue=50000,
+                 backpressure="drop_oldest", block_timeout=5.0, source="hfp"):
+        if backpressure not in BACKPRESSURE_MODES:
+            raise ValueError(f"Unknown backpressure mode {backpressure!r}, expected one of {BACKPRESSURE_MODES}")
+        self.dsn = dsn
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.backpressure = backpressure
+        self.block_timeout = block_timeout
+
+        self._queue = queue.Queue(maxsize=max_queue)
+        self._stop = threading.Event()
+        self._thread = None
+        self._conn = None
+        self._timer = WriteTimer(source)
+
+        self.received = 0
+        self.inserted = 0
+        self.dropped = 0
+        self.batches = 0
+        self.failed_batches = 0
+
+    # -- producer side (MQTT callback thread) --
+
+    def submit(self, row):
+        """Queue one row. Returns False if the row was dropped."""
+        self.received += 1
+        if self.backpressure == "block":
+            try:
+                self._queue.put(row, timeout=self.block_timeout)
+                return True
+            except queue.Full:
+                self.dropped += 1
+                return False
+
+        try:
+            self._queue.put_nowait(row)
+            return True
+        except queue.Full:
+            pass
+
+        self.dropped += 1
+        if self.backpressure == "drop_newest":
+            return False
+
+        # drop_oldest: make room by discarding the head of the queue
+        try:
+            self._queue.get_nowait()
+        except queue.Empty:
+            pass
+        try:
+            self._queue.put_nowait(row)
+        except queue.Full:
+            return False
+        return True
+
+    def queue_depth(self):
+        return self._queue.qsize()
+
+    # -- consumer side (writer thread) --
+
+    def start(self):
+        self._thread = threading.Thread(target=self._run, name="hfp-writer", daemon=True)
+        self._thread.start()
+
+    def stop(self, timeout=10.0):
+        """Stop the writer thread after flushing whatever is queued."""
+        self._stop.set()
+        if self._thread:
+            self._thread.join(timeout)
+        if self._conn is not None:
+            self._conn.close()
+            self._conn = None
+
+    def _next_batch(self):
+        try:
+            first = self._queue.get(timeout=self.flush_interval)
+        except queue.Empty:
+            return []
+
+        batch = [first]
+        deadline = time.monotonic() + self.flush_interval
+        while len(batch) < self.batch_size:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(self._queue.get(timeout=remaining))
+            except queue.Empty:
+                break
+        return batch
+
+    def _run(self):
+        while not (self._stop.is_set() and self._queue.empty()):
+            batch = self._next_batch()
+            if not batch:
+                continue
+            try:
+                self._write(batch)
+            except Exception as e:
+                self.dropped += len(batch)
+                logger.error(f"❌ Writer lost batch of {len(batch)} rows: {e}")
+
+    def _connection(self):
+        if self._conn is None or self._conn.closed:
+            self._conn = psycopg2.connect(self.dsn)
+        return self._conn
+
+    def _write(self, batch):
+        """Write one batch, retrying with backoff while the database is unavailable."""
+        delay = 1.0
+        while True:
+            try:
+                self.insert(batch)
+                return
+            except psycopg2.Error as e:
+                self.failed_batches += 1
+                logger.error(f"❌ Error inserting batch of {len(batch)} rows: {e}")
+                if self._stop.is_set():
+                    self.dropped += len(batch)
+                    return
+                # While we wait here the queue fills up and backpressure kicks in
+                time.sleep(delay)
+                delay = min(delay * 2, 30.0)
+
+    def insert(self, batch):
+        """
+        Write one batch now, in the calling thread. Rows the database rejects
+        are dropped one by one; any other database error is raised (after
+        discarding the connection) for the caller to retry.
+        """
+        try:
+            conn = self._connection()
+            started = time.perf_counter()
+            with conn.cursor() as cur:
+                execute_values(cur, INSERT_SQL, batch, page_size=len(batch))
+            conn.commit()
+            self.inserted += len(batch)
+            self.batches += 1
+            self._timer.observe(len(batch), time.perf_counter() - started, time.time(),
+                                (row[4].timestamp() if row[4] else None for row in batch))
+        except (psycopg2.DataError, psycopg2.IntegrityError) as e:
+            # A bad row poisons the whole statement; isolate it instead of retrying forever
+            logger.error(f"❌ Batch rejected ({e}), retrying row by row")
+            self._conn.rollback()
+            self._write_rows(batch)
+        except psycopg2.Error:
+            if self._conn is not None:
+                try:
+                    self._conn.close()
+                except psycopg2.Error:
+                    pass
+                self._conn = None
+            raise
+
+    def _write_rows(self, batch):
+        conn = self._conn
+        with conn.cursor() as cur:
+            for row in batch:
+                try:
+                    execute_values(cur, INSERT_SQL, [row])
+                    conn.commit()
+                    self.inserted += 1
+                except (psycopg2.DataError, psycopg2.IntegrityError) as e:
+                    conn.rollback()
+                    self.dropped += 1
+                    logger.error(f"❌ Dropping row veh={row[3]} tst={row[4]}: {e}")
+        self.batches += 1
+
+    def stats(self):
+        return {
+            "received": self.received,
+            "inserted": self.inserted,
+            "dropped": self.dropped,
+            "batches": self.batches,
+            "failed_batches": self.failed_batches,
+            "queue_depth": self.queue_depth(),
+        }
@@ -0,0 +1,328 @@
+"""
+Durable local spool for the ingesters.
+
+Messages are appended to numbered segment files on local disk before they go
+anywhere near the database, and a replayer thread writes them to the
+database in batches whenever it is reachable. A slow or restarting database
+then only makes the spool grow; nothing is lost and the message callback
+never waits for a connection.
+
+Segment format: a sequence of records, each `<length:u32><crc32:u32><bytes>`
+(little endian). A torn or corrupt record ends the segment; everything
+after it is skipped.
+
+Appends are buffered and fsync'd together every `fsync_interval` seconds,
+so a crash loses at most that much. The replay position is stored in a
+`position` file after every committed batch (without fsync); after a crash
+the last batch may be written twice. The HFP unique index absorbs that;
+vehicle_positions has no unique key, so replayed GTFS-RT feeds are stored at
+least once and can leave duplicate rows after a crash (the writer's
+per-vehicle timestamp check only spans one process lifetime).
+"""
+import logging
+import os
+import struct
+import threading
+import time
+import zlib
+
+logger = logging.getLogger(__name__)
+
+HEADER = struct.Struct("<II")
+SEGMENT_SUFFIX = ".seg"
+READ_BUFFER = 1 << 20
+
+
+class Spool:
+    """
+    Append-only on-disk queue of byte records.
+
+    The active segment is rotated once it grows past `segment_bytes`. When
+    the segments on disk exceed `max_bytes`, the oldest are deleted, replayed
+    or not, and counted in `dropped_bytes`.
+    """
+
+    def __init__(self, directory, segment_bytes=64 << 20, max_bytes=2 << 30, fsync_interval=1.0):
+        self.directory = directory
+        self.segment_bytes = segment_bytes
+        self.max_bytes = max_bytes
+        self.fsync_interval = fsync_interval
+        os.makedirs(directory, exist_ok=True)
+
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+
+        segments = self._segments()
+        self._active = (segments[-1] + 1) if segments else 0
+        self._file = None
+        self._size = 0
+        self._durable = 0
+        self._open_active()
+
+        self._position = self._load_position(segments)
+
+        self.appended = 0
+        self.fsyncs = 0
+        self.dropped_bytes = 0
+        self.dropped_segments = 0
+
+    # -- files --
+
+    def _path(self, seq):
+        return os.path.join(self.directory, f"{seq:012d}{SEGMENT_SUFFIX}")
+
+    def _segments(self):
+        return sorted(
+            int(name[:-len(SEGMENT_SUFFIX)]) for name in os.listdir(self.directory)
+            if name.endswith(SEGMENT_SUFFIX)
+        )
+
+    def _open_active(self):
+        # Always a fresh segment: a torn tail in an older one is never appended to
+        self._file = open(self._path(self._active), "ab", buffering=READ_BUFFER)
+        self._size = self._durable = 0
+
+    def _load_position(self, segments):
+        try:
+            with open(os.path.join(self.directory, "position")) as f:
+                seq, offset = map(int, f.read().split())
+            return seq, offset
+        except (OSError, ValueError):
+            return (segments[0] if segments else self._active), 0
+
+    def _save_position(self):
+        path = os.path.join(self.directory, "position")
+        with open(path + ".tmp", "w") as f:
+            f.write("%d %d" % self._position)
+        os.replace(path + ".tmp", path)
+
+    # -- writer side --
+
+    def append(self, record):
+        with self._lock:
+            if self._size >= self.segment_bytes:
+                self._rotate()
+            self._file.write(HEADER.pack(len(record), zlib.crc32(record)))
+            self._file.write(record)
+            self._size += HEADER.size + len(record)
+            self.appended += 1
+
+    def _rotate(self):
+        self._sync()
+        self._file.close()
+        self._active += 1
+        self._open_active()
+        self._enforce_limit()
+
+    def _sync(self):
+        if self._durable == self._size:
+            return
+        self._file.flush()
+        os.fsync(self._file.fileno())
+        self._durable = self._size
+        self.fsyncs += 1
+
+    def flush(self):
+        """Make every appended record durable and visible to read()."""
+        with self._lock:
+            if self._durable == self._size:
+                return
+            self._file.flush()
+            active, size = self._active, self._size
+            # A duplicate stays valid if append() rotates and closes the file meanwhile
+            fd = os.dup(self._file.fileno())
+        # fsync outside the lock: append() runs on the MQTT callback thread and
+        # must not wait for the disk
+        try:
+            os.fsync(fd)
+        finally:
+            os.close(fd)
+        with self._lock:
+            if self._active == active and self._durable < size:
+                self._durable = size
+            self.fsyncs += 1
+
+    def _enforce_limit(self):
+        segments = self._segments()
+        sizes = {seq: os.path.getsize(self._path(seq)) for seq in segments}
+        total = sum(sizes.values())
+        for seq in segments:
+            if total <= self.max_bytes or seq == self._active:
+                break
+            try:
+                os.remove(self._path(seq))
+            except FileNotFoundError:
+                continue  # Replayed and removed meanwhile
+            total -= sizes[seq]
+            self.dropped_bytes += sizes[seq]
+            self.dropped_segments += 1
+            logger.error(f"❌ Spool over {self.max_bytes} bytes, dropped unreplayed segment {seq}")
+
+    def start(self):
+        self._thread = threading.Thread(target=self._run, name="spool-fsync", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread:
+            self._thread.join()
+        with self._lock:
+            self._sync()
+            self._file.close()
+
+    def _run(self):
+        while not self._stop.wait(self.fsync_interval):
+            try:
+                self.flush()
+            except OSError as e:
+                logger.error(f"❌ Spool fsync failed: {e}")
+
+    # -- replay side --
+
+    def read(self, max_records):
+        """
+        Up to `max_records` durable records from the replay position onwards,
+        and the position just after them to pass to commit().
+        """
+        with self._lock:
+            active, durable = self._active, self._durable
+        seq, offset = self._position
+        records = []
+        while len(records) < max_records and seq <= active:
+            limit = durable if seq == active else None
+            try:
+                f = open(self._path(seq), "rb", buffering=READ_BUFFER)
+            except FileNotFoundError:
+                if seq == active:
+                    break
+                seq, offset = seq + 1, 0
+                continue
+            with f:
+                f.seek(offset)
+                while len(records) < max_records:
+                    if limit is not None and offset + HEADER.size > limit:
+                        break
+                    header = f.read(HEADER.size)
+                    if len(header) < HEADER.size:
+                        break
+                    length, crc = HEADER.unpack(header)
+                    if limit is not None and offset + HEADER.size + length > limit:
+                        break
+                    record = f.read(length)
+                    if len(record) < length or zlib.crc32(record) != crc:
+                        if seq < active:
+                            logger.error(f"❌ Torn record in spool segment {seq} at {offset}, skipping the rest")
+                        break
+                    records.append(record)
+                    offset += HEADER.size + length
+                else:
+                    break
+            if seq == active:
+                break
+            # Reached the end of a sealed segment
+            seq, offset = seq + 1, 0
+        return records, (seq, offset)
+
+    @property
+    def position(self):
+        return self._position
+
+    def commit(self, position):
+        """Mark everything before `position` as written and delete finished segments."""
+        self._position = position
+        self._save_position()
+        for seq in self._segments():
+            if seq >= position[0]:
+                break
+            try:
+                os.remove(self._path(seq))
+            except FileNotFoundError:
+                pass  # Already dropped by _enforce_limit()
+
+    def backlog_bytes(self):
+        seq, offset = self._position
+        total = 0
+        for segment in self._segments():
+            if segment >= seq:
+                try:
+                    total += os.path.getsize(self._path(segment))
+                except FileNotFoundError:
+                    pass
+        return max(total - offset, 0)
+
+    def stats(self):
+        return {
+            "appended": self.appended,
+            "fsyncs": self.fsyncs,
+            "backlog_bytes": self.backlog_bytes(),
+            "dropped_bytes": self.dropped_bytes,
+            "dropped_segments": self.dropped_segments,
+        }
+
+
+class SpoolReplayer:
+    """
+    Replays a Spool into `write(records)` on its own thread. `write` either
+    stores the whole batch or raises; a failed batch is retried from the
+    spool with exponential backoff, so while the database is down records
+    simply stay on disk.
+    """
+
+    def __init__(self, spool, write, batch_size=500, idle_wait=0.2):
+        self.spool = spool
+        self.write = write
+        self.batch_size = batch_size
+        self.idle_wait = idle_wait
+        self._stop = threading.Event()
+        self._thread = None
+
+        self.replayed = 0
+        self.failed_writes = 0
+        self._rate_mark = (time.monotonic(), 0)
+
+    def start(self):
+        self._thread = threading.Thread(target=self._run, name="spool-replay", daemon=True)
+        self._thread.start()
+
+    def stop(self, timeout=10.0):
+        """Stop after the batch in flight; unreplayed records stay in the spool."""
+        self._stop.set()
+        if self._thread:
+            self._thread.join(timeout)
+
+    def _run(self):
+        delay = 1.0
+        while not self._stop.is_set():
+            records, position = self.spool.read(self.batch_size)
+            if not records:
+                # Nothing durable yet, or only a torn tail was skipped
+                if position != self.spool.position:
+                    self.spool.commit(position)
+                self._stop.wait(self.idle_wait)
+                continue
+            try:
+                self.write(records)
+            except Exception as e:
+                self.failed_writes += 1
+                logger.error(f"❌ Spool replay of {len(records)} records failed, retrying in {delay:.0f}s: {e}")
+                self._stop.wait(delay)
+                delay = min(delay * 2, 30.0)
+                continue
+            self.spool.commit(position)
+            self.replayed += len(records)
+            delay = 1.0
+
+    def counters(self):
+        """Spool and replay counters, without touching the `replay_rate` mark (for metrics scrapes)."""
+        return dict(self.spool.stats(), replayed=self.replayed, failed_writes=self.failed_writes)
+
+    def stats(self):
+        """Replay counters; `replay_rate` is records/s since the previous call."""
+        now = time.monotonic()
+        since, replayed = self._rate_mark
+        self._rate_mark = (now, self.replayed)
+        return dict(
+            self.counters(),
+            replay_rate=round((self.replayed - replayed) / max(now - since, 1e-9), 1),
+        )
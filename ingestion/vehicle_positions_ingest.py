@@ -1,8 +1,14 @@
-import requests
+import json
+import queue
+import threading
 import time
+import requests
 import psycopg2
+from psycopg2.extras import execute_values
 from google.transit import gtfs_realtime_pb2
 import config
+from metrics import WriteTimer, serve as serve_metrics
+from spool import Spool, SpoolReplayer
 
 GTFS_VEHICLE_URL = config.GTFS_VEHICLE_URL
 DB_HOST = config.DB_HOST
@@ -10,53 +16,226 @@ DB_PORT = config.DB_PORT
 DB_NAME = config.DB_NAME
 DB_USER = config.DB_USER
 DB_PASS = config.DB_PASS
+POLL_INTERVAL = config.GTFS_RT_INTERVAL
+HTTP_TIMEOUT = config.GTFS_RT_HTTP_TIMEOUT
+SPOOL_DIR = config.GTFS_RT_SPOOL_DIR
+SPOOL_MAX_BYTES = config.GTFS_RT_SPOOL_MAX_BYTES
+METRICS_PORT = config.GTFS_RT_METRICS_PORT
+DEDUP_HORIZON = 3600  # seconds a vehicle's last stored timestamp is remembered
+
+INSERT_SQL = """
+    INSERT INTO vehicle_positions (vehicle_id, route_id, lat, lon, bearing, speed, timestamp)
+    VALUES %s
+"""
+INSERT_TEMPLATE = "(%s, %s, %s, %s, %s, %s, to_timestamp(%s))"
+
+def parse_feed(content):
+    """Rows for vehicle_positions from a serialized GTFS-RT FeedMessage."""
+    feed = gtfs_realtime_pb2.FeedMessage()
+    feed.ParseFromString(content)
+    rows = []
+    for entity in feed.entity:
+        if not entity.HasField("vehicle"):
+            continue
+        vp = entity.vehicle
+        rows.append((
+            vp.vehicle.id,
+            vp.trip.route_id,
+            vp.position.latitude,
+            vp.position.longitude,
+            vp.position.bearing,
+            vp.position.speed,
+            vp.timestamp,
+        ))
+    return feed, rows
+
+class PositionWriter:
+    """
+    Writes parsed feeds on its own thread over one persistent connection, so
+    the poller can fetch the next feed while the previous one is inserted.
+    Only one feed waits at a time; if the database is slower than the poll
+    interval the waiting feed is replaced by the newer one.
+
+    Vehicles whose `timestamp` is not newer than the last one stored for them
+    are suppressed; rows without a timestamp are always written. The per-vehicle timestamps only advance after a commit,
+    so rows from a failed write are not mistaken for duplicates later.
+    """
 
-def fetch_and_store():
-    print("Connecting to database...")
-    conn = psycopg2.connect(
-        host=DB_HOST, port=DB_PORT, dbname=DB_NAME,
-        user=DB_USER, password=DB_PASS
-    )
-    cur = conn.cursor()
-    print("Connected to database.")
-
-    try:
-        print("Fetching GTFS realtime feed...")
-        response = requests.get(GTFS_VEHICLE_URL)
-        response.raise_for_status()
-        print("Feed fetched successfully, parsing...")
-        feed = gtfs_realtime_pb2.FeedMessage()
-        feed.ParseFromString(response.content)
-        print(f"Parsed feed: {len(feed.entity)} entities")
-
-        for entity in feed.entity:
-            if not entity.HasField("vehicle"):
+    def __init__(self):
+        self._queue = queue.Queue(maxsize=1)
+        self._conn = None
+        self._last_stored = {}
+        self._timer = WriteTimer("gtfs_rt")
+        self.last_write_seconds = 0.0
+        self.last_write_rows = 0
+        self.inserted = 0
+        self.batches = 0
+        self.failed_batches = 0
+        self.skipped = 0
+        self.suppressed = 0
+
+    def start(self):
+        threading.Thread(target=self._run, name="vehicle-writer", daemon=True).start()
+
+    def submit(self, rows):
+        try:
+            self._queue.put_nowait(rows)
+        except queue.Full:
+            try:
+                self._queue.get_nowait()
+                self.skipped += 1
+            except queue.Empty:
+                pass
+            self._queue.put_nowait(rows)
+
+    def _connection(self):
+        if self._conn is None or self._conn.closed:
+            print("Connecting to database...")
+            self._conn = psycopg2.connect(
+                host=DB_HOST, port=DB_PORT, dbname=DB_NAME,
+                user=DB_USER, password=DB_PASS
+            )
+        return self._conn
+
+    def _new_rows(self, rows):
+        fresh = {}
+        unstamped = []
+        for row in rows:
+            vehicle_id, timestamp = row[0], row[6]
+            if not timestamp:
+                # vp.timestamp is optional; without it there is nothing to compare, so store as is
+                unstamped.append(row)
+                continue
+            if timestamp <= self._last_stored.get(vehicle_id, 0):
                 continue
+            # A feed can list the same vehicle twice; keep its newest sample
+            if vehicle_id not in fresh or fresh[vehicle_id][6] < timestamp:
+                fresh[vehicle_id] = row
+        return list(fresh.values()) + unstamped
 
-            vp = entity.vehicle
-            vehicle_id = vp.vehicle.id
-            route_id = vp.trip.route_id
-            lat = vp.position.latitude
-            lon = vp.position.longitude
-            bearing = vp.position.bearing
-            speed = vp.position.speed
-            timestamp = vp.timestamp
-
-            cur.execute("""
-                INSERT INTO vehicle_positions (vehicle_id, route_id, lat, lon, bearing, speed, timestamp)
-                VALUES (%s, %s, %s, %s, %s, %s, to_timestamp(%s))
-            """, (vehicle_id, route_id, lat, lon, bearing, speed, timestamp))
-
-        conn.commit()
-        print("Commit done.")
-
-    except Exception as e:
-        print(f"Error during fetch or insert: {e}")
-    finally:
-        cur.close()
-        conn.close()
+    def _remember(self, rows):
+        for row in rows:
+            if row[6]:
+                self._last_stored[row[0]] = row[6]
+        # Forget vehicles that have not reported for a long time
+        horizon = time.time() - DEDUP_HORIZON
+        if len(self._last_stored) > 2 * len(rows) + 1000:
+            self._last_stored = {vid: ts for vid, ts in self._last_stored.items() if ts > horizon}
 
-if __name__ == "__main__":
+    def write(self, rows):
+        """Insert the new rows of one feed now; raises if the insert fails."""
+        fresh = self._new_rows(rows)
+        started = time.monotonic()
+        if fresh:
+            try:
+                conn = self._connection()
+                with conn.cursor() as cur:
+                    execute_values(cur, INSERT_SQL, fresh, template=INSERT_TEMPLATE, page_size=1000)
+                conn.commit()
+            except Exception:
+                self.failed_batches += 1
+                if self._conn is not None:
+                    self._conn.close()
+                    self._conn = None
+                raise
+            self._remember(fresh)
+            self.inserted += len(fresh)
+            self.batches += 1
+            self._timer.observe(len(fresh), time.monotonic() - started, time.time(), (row[6] or None for row in fresh))
+        self.suppressed += len(rows) - len(fresh)
+        self.last_write_rows = len(fresh)
+        self.last_write_seconds = time.monotonic() - started
+
+    def stats(self):
+        return {
+            "inserted": self.inserted,
+            "batches": self.batches,
+            "failed_batches": self.failed_batches,
+            "skipped": self.skipped,
+            "suppressed": self.suppressed,
+            "queue_depth": self._queue.qsize(),
+        }
+
+    def _run(self):
+        while True:
+            rows = self._queue.get()
+            try:
+                self.write(rows)
+            except Exception as e:
+                print(f"Error during insert: {e}")
+
+def write_spooled(writer, records):
+    """Replay spooled feeds (JSON row lists) in order."""
+    for record in records:
+        writer.write(json.loads(record))
+
+def poll_forever():
+    session = requests.Session()
+    writer = PositionWriter()
+    spool = replayer = None
+    if SPOOL_DIR:
+        # Feeds go to local disk first and are replayed in order, so a database
+        # outage delays rows instead of losing the feeds polled meanwhile
+        spool = Spool(SPOOL_DIR, max_bytes=SPOOL_MAX_BYTES)
+        replayer = SpoolReplayer(spool, lambda records: write_spooled(writer, records), batch_size=10)
+        spool.start()
+        replayer.start()
+    else:
+        writer.start()
+
+    etag = None
+    last_header_timestamp = None
+    polled = {"received": 0, "unchanged": 0}
+
+    def counters():
+        values = dict(writer.stats(), **polled)
+        if replayer is not None:
+            values.update(replayer.counters())
+        return values
+
+    serve_metrics(METRICS_PORT, "gtfs_rt", counters)
+
+    next_run = time.monotonic()
     while True:
-        fetch_and_store()
-        time.sleep(5)
\ No newline at end of file
+        started = time.monotonic()
+        try:
+            headers = {"If-None-Match": etag} if etag else {}
+            response = session.get(GTFS_VEHICLE_URL, headers=headers, timeout=HTTP_TIMEOUT)
+            fetched = time.monotonic()
+            if response.status_code == 304:
+                polled["unchanged"] += 1
+                print(f"Cycle: feed not modified (ETag), fetch {fetched - started:.2f}s")
+            else:
+                response.raise_for_status()
+                etag = response.headers.get("ETag")
+                feed, rows = parse_feed(response.content)
+                parsed = time.monotonic()
+                if feed.header.timestamp and feed.header.timestamp == last_header_timestamp:
+                    polled["unchanged"] += 1
+                    print(f"Cycle: feed header timestamp unchanged, fetch {fetched - started:.2f}s")
+                else:
+                    last_header_timestamp = feed.header.timestamp
+                    polled["received"] += len(rows)
+                    if spool is not None:
+                        spool.append(json.dumps(rows).encode())
+                    else:
+                        writer.submit(rows)
+                    print(f"Cycle: {len(feed.entity)} entities, fetch {fetched - started:.2f}s, "
+                          f"parse {parsed - fetched:.2f}s, previous write {writer.last_write_seconds:.2f}s "
+                          f"({writer.last_write_rows} rows), skipped feeds {writer.skipped}, "
+                          f"unchanged feeds {polled['unchanged']}, duplicate rows suppressed {writer.suppressed}"
+                          + (f", spool {replayer.stats()}" if replayer is not None else ""))
+        except Exception as e:
+            print(f"Error during fetch: {e}")
+
+        # Fixed rate: fetch and parse time come out of the interval instead of adding to it
+        next_run += POLL_INTERVAL
+        delay = next_run - time.monotonic()
+        if delay < 0:
+            print(f"Cycle overran the {POLL_INTERVAL}s interval by {-delay:.2f}s")
+            next_run = time.monotonic()
+            delay = 0
+        time.sleep(delay)
+
+if __name__ == "__main__":
+    poll_forever()
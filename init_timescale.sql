@@ -1,8 +1,10 @@
+-- Safe to re-run: every statement is idempotent, so this file doubles as the
+-- migration for existing databases:
+--   docker compose exec -T db psql -U postgres -d hslbussit < init_timescale.sql
 CREATE EXTENSION IF NOT EXISTS timescaledb;
 
-DROP TABLE IF EXISTS vehicle_positions;
-
-CREATE TABLE vehicle_positions (
+-- vehicle_positions (GTFS-RT positions, written by ingestion/vehicle_positions_ingest.py)
+CREATE TABLE IF NOT EXISTS vehicle_positions (
     id SERIAL,
     vehicle_id TEXT,
     route_id TEXT,
@@ -12,6 +14,108 @@ CREATE TABLE vehicle_positions (
     speed DOUBLE PRECISION,
     timestamp TIMESTAMPTZ NOT NULL
 );
+SELECT create_hypertable('vehicle_positions', 'timestamp', if_not_exists => TRUE, create_default_indexes => FALSE, migrate_data => TRUE);
+SELECT set_chunk_time_interval('vehicle_positions', INTERVAL '1 day');
+CREATE INDEX IF NOT EXISTS vehicle_positions_timestamp_idx ON vehicle_positions (timestamp DESC);
+CREATE INDEX IF NOT EXISTS vehicle_positions_vehicle_id_timestamp_idx ON vehicle_positions (vehicle_id, timestamp DESC);
+
+-- mqtt_hfp (raw HFP vehicle positions, written by ingestion/mqtt_hfp_ingest)
+CREATE TABLE IF NOT EXISTS mqtt_hfp (
+    desi TEXT,
+    dir TEXT,
+    oper TEXT,
+    veh TEXT,
+    tst TIMESTAMPTZ NOT NULL,
+    tsi BIGINT,
+    spd DOUBLE PRECISION,
+    hdg DOUBLE PRECISION,
+    lat DOUBLE PRECISION,
+    long DOUBLE PRECISION,
+    acc DOUBLE PRECISION,
+    dl DOUBLE PRECISION,
+    odo DOUBLE PRECISION,
+    drst INTEGER,
+    oday DATE,
+    jrn INTEGER,
+    line INTEGER,
+    start TEXT,
+    loc TEXT,
+    stop TEXT,
+    route TEXT,
+    occu INTEGER
+);
+-- Older deployments created mqtt_hfp from main.py with only 12 columns, tst
+-- as TIMESTAMP and tst as the only primary key, which silently dropped every
+-- vehicle but one reporting in the same instant. Bring such a table up to the
+-- layout above.
+ALTER TABLE mqtt_hfp DROP CONSTRAINT IF EXISTS mqtt_hfp_pkey;
+ALTER TABLE mqtt_hfp
+    ADD COLUMN IF NOT EXISTS desi TEXT,
+    ADD COLUMN IF NOT EXISTS dir TEXT,
+    ADD COLUMN IF NOT EXISTS oper TEXT,
+    ADD COLUMN IF NOT EXISTS tsi BIGINT,
+    ADD COLUMN IF NOT EXISTS spd DOUBLE PRECISION,
+    ADD COLUMN IF NOT EXISTS hdg DOUBLE PRECISION,
+    ADD COLUMN IF NOT EXISTS lat DOUBLE PRECISION,
+    ADD COLUMN IF NOT EXISTS long DOUBLE PRECISION,
+    ADD COLUMN IF NOT EXISTS acc DOUBLE PRECISION,
+    ADD COLUMN IF NOT EXISTS dl DOUBLE PRECISION,
+    ADD COLUMN IF NOT EXISTS odo DOUBLE PRECISION,
+    ADD COLUMN IF NOT EXISTS drst INTEGER,
+    ADD COLUMN IF NOT EXISTS oday DATE,
+    ADD COLUMN IF NOT EXISTS jrn INTEGER,
+    ADD COLUMN IF NOT EXISTS line INTEGER,
+    ADD COLUMN IF NOT EXISTS start TEXT,
+    ADD COLUMN IF NOT EXISTS loc TEXT,
+    ADD COLUMN IF NOT EXISTS stop TEXT,
+    ADD COLUMN IF NOT EXISTS route TEXT,
+    ADD COLUMN IF NOT EXISTS occu INTEGER;
+DO $$
+BEGIN
+    -- HFP timestamps are UTC; the old TIMESTAMP column stored them without a zone
+    IF (SELECT data_type FROM information_schema.columns
+        WHERE table_schema = current_schema() AND table_name = 'mqtt_hfp' AND column_name = 'tst')
+       = 'timestamp without time zone' THEN
+        ALTER TABLE mqtt_hfp ALTER COLUMN tst TYPE TIMESTAMPTZ USING tst AT TIME ZONE 'UTC';
+    END IF;
+END $$;
+SELECT create_hypertable('mqtt_hfp', 'tst', if_not_exists => TRUE, migrate_data => TRUE);
+SELECT set_chunk_time_interval('mqtt_hfp', INTERVAL '6 hours');
+CREATE UNIQUE INDEX IF NOT EXISTS mqtt_hfp_veh_tst_idx ON mqtt_hfp (veh, tst DESC);
+
+-- Compress chunks once they are no longer written to, segmented per vehicle so
+-- per-vehicle history queries only decompress that vehicle's segments.
+DO $$
+BEGIN
+    -- Compression settings cannot be re-applied once chunks are compressed
+    IF NOT (SELECT compression_enabled FROM timescaledb_information.hypertables
+            WHERE hypertable_name = 'mqtt_hfp') THEN
+        ALTER TABLE mqtt_hfp SET (
+            timescaledb.compress,
+            timescaledb.compress_segmentby = 'veh',
+            timescaledb.compress_orderby = 'tst DESC'
+        );
+    END IF;
+END $$;
+SELECT add_compression_policy('mqtt_hfp', INTERVAL '1 day', if_not_exists => TRUE);
+
+DO $$
+BEGIN
+    IF NOT (SELECT compression_enabled FROM timescaledb_information.hypertables
+            WHERE hypertable_name = 'vehicle_positions') THEN
+        ALTER TABLE vehicle_positions SET (
+            timescaledb.compress,
+            timescaledb.compress_segmentby = 'vehicle_id',
+            timescaledb.compress_orderby = 'timestamp DESC'
+        );
+    END IF;
+END $$;
+SELECT add_compression_policy('vehicle_positions', INTERVAL '1 day', if_not_exists => TRUE);
+
+-- Raw positions are kept for 30 days; the per-route rollups below outlive them.
+SELECT add_retention_policy('mqtt_hfp', INTERVAL '30 days', if_not_exists => TRUE);
+SELECT add_retention_policy('vehicle_positions', INTERVAL '30 days', if_not_exists => TRUE);
+
 -- vehicles
 CREATE TABLE IF NOT EXISTS vehicles (
     vehicle_id TEXT PRIMARY KEY,
@@ -84,4 +188,61 @@ CREATE TABLE IF NOT EXISTS emissions (
     emission_type TEXT,
     emission_value NUMERIC
 );
-SELECT create_hypertable('vehicle_positions', 'timestamp', if_not_exists => TRUE, create_default_indexes => FALSE);
+
+-- Per-minute last position of every vehicle. Real-time aggregation
+-- (materialized_only = false) adds the not yet materialized tail from
+-- mqtt_hfp, so the latest minute is always included.
+CREATE MATERIALIZED VIEW IF NOT EXISTS mqtt_hfp_vehicle_1m
+WITH (timescaledb.continuous, timescaledb.materialized_only = false) AS
+SELECT
+    time_bucket('1 minute', tst) AS bucket,
+    veh,
+    last(desi, tst)  AS desi,
+    last(route, tst) AS route,
+    last(oper, tst)  AS oper,
+    last(lat, tst)   AS lat,
+    last(long, tst)  AS long,
+    last(spd, tst)   AS spd,
+    last(hdg, tst)   AS hdg,
+    last(dl, tst)    AS dl,
+    max(tst)         AS tst
+FROM mqtt_hfp
+GROUP BY bucket, veh
+WITH NO DATA;
+
+SELECT add_continuous_aggregate_policy('mqtt_hfp_vehicle_1m',
+    start_offset => INTERVAL '1 hour',
+    end_offset => INTERVAL '1 minute',
+    schedule_interval => INTERVAL '1 minute',
+    if_not_exists => TRUE);
+
+-- Last known position per vehicle seen in the last 10 minutes (what /vehicles serves)
+CREATE OR REPLACE VIEW vehicle_latest AS
+SELECT DISTINCT ON (veh)
+    veh, desi, route, oper, lat, long, spd, hdg, dl, tst
+FROM mqtt_hfp_vehicle_1m
+WHERE bucket > now() - INTERVAL '10 minutes'
+ORDER BY veh, bucket DESC;
+
+-- Per-minute rollups per route for history charts
+CREATE MATERIALIZED VIEW IF NOT EXISTS mqtt_hfp_route_1m
+WITH (timescaledb.continuous, timescaledb.materialized_only = false) AS
+SELECT
+    time_bucket('1 minute', tst) AS bucket,
+    route,
+    avg(spd) AS avg_speed,
+    avg(dl)  AS avg_delay,
+    count(*) AS samples
+FROM mqtt_hfp
+GROUP BY bucket, route
+WITH NO DATA;
+
+SELECT add_continuous_aggregate_policy('mqtt_hfp_route_1m',
+    start_offset => INTERVAL '1 hour',
+    end_offset => INTERVAL '1 minute',
+    schedule_interval => INTERVAL '1 minute',
+    if_not_exists => TRUE);
+
+SELECT add_retention_policy('mqtt_hfp_route_1m', INTERVAL '1 year', if_not_exists => TRUE);
+-- Only vehicle_latest reads the per-vehicle aggregate, and only its last 10 minutes
+SELECT add_retention_policy('mqtt_hfp_vehicle_1m', INTERVAL '1 day', if_not_exists => TRUE);
@@ -17,11 +17,11 @@ DB_PASS = os.getenv("DB_PASS", "supersecurepassword")
 engine = create_engine(f"postgresql://{DB_USER}:{DB_PASS}@{DB_HOST}:{DB_PORT}/{DB_NAME}")
 metadata = MetaData()
 
-# Create table definition
+# Table definition (schema, hypertable and indexes are managed in init_timescale.sql)
 mqtt_hfp = Table(
     'mqtt_hfp', metadata,
     Column('tst', TIMESTAMP, primary_key=True),
-    Column('veh', String),
+    Column('veh', String, primary_key=True),
     Column('desi', String),
     Column('dir', String),
     Column('lat', Float),
@@ -34,9 +34,6 @@ mqtt_hfp = Table(
     Column('oper', String),
 )
 
-# Create table if not exists
-metadata.create_all(engine)
-
 # MQTT Callback
 def on_message(client, userdata, msg):
     payload_str = msg.payload.decode('utf-8', errors='replace')
@@ -69,7 +66,7 @@ def on_message(client, userdata, msg):
                 odo=v.get('odo'),
                 route=v.get('route'),
                 oper=v.get('oper'),
-            ).on_conflict_do_nothing()
+            ).on_conflict_do_nothing(index_elements=['veh', 'tst'])
             conn.execute(stmt)
             print("✔️  Insert succeeded")
     except Exception as e:
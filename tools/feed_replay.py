@@ -0,0 +1,484 @@
+"""
+Record and replay HFP (MQTT) and GTFS-RT traffic, for load testing the
+ingesters without mqtt.hsl.fi / realtime.hsl.fi.
+
+    # record 10 minutes of live traffic
+    python tools/feed_replay.py record-mqtt -o hfp.cap --duration 600
+    python tools/feed_replay.py record-gtfsrt -o vp.cap --duration 600
+
+    # or generate synthetic HFP traffic: 2000 vehicles, one message/s each
+    python tools/feed_replay.py synthetic -o synth.cap --vehicles 2000 --duration 300
+
+    # replay into a local broker at 10x, as 3 copies of every vehicle
+    python tools/feed_replay.py replay-mqtt hfp.cap --broker localhost --speed 10 --copies 3 --retime
+
+    # serve the GTFS-RT snapshots over HTTP at 10x (point GTFS_VEHICLE_URL at it)
+    python tools/feed_replay.py serve-gtfsrt vp.cap --port 8080 --speed 10 --retime
+
+    python tools/feed_replay.py info hfp.cap
+
+A capture file is a gzip stream of records, each
+`<kind:u8><received:f64><topic length:u16><payload length:u32><topic><payload>`
+(little endian). `kind` is MQTT (topic = MQTT topic) or GTFS_RT (topic =
+URL). `received` is the Unix time the message or snapshot arrived.
+
+--copies N publishes every message N times, vehicle numbers shifted by
+multiples of 100000 in payload and topic, so copies count as distinct
+vehicles downstream. --retime moves timestamps (HFP tst/tsi, GTFS-RT
+header and vehicle timestamps) to the replay clock, so replayed rows are
+not deduplicated against earlier runs and land in current chunks.
+"""
+import argparse
+import gzip
+import hashlib
+import json
+import os
+import random
+import struct
+import sys
+import threading
+import time
+from datetime import datetime, timedelta, timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+MQTT = 0
+GTFS_RT = 1
+
+RECORD = struct.Struct("<BdHI")
+COPY_VEHICLE_OFFSET = 100000
+HFP_TOPIC = "/hfp/v2/journey/ongoing/vp/bus/#"
+GTFS_VEHICLE_URL = "https://realtime.hsl.fi/realtime/vehicle-positions/v2/hsl"
+
+
+# -- capture files --
+
+class CaptureWriter:
+    def __init__(self, path):
+        self._file = gzip.open(path, "wb", compresslevel=6)
+        self._lock = threading.Lock()
+        self.records = 0
+
+    def write(self, kind, received, topic, payload):
+        topic = topic.encode()
+        with self._lock:
+            self._file.write(RECORD.pack(kind, received, len(topic), len(payload)))
+            self._file.write(topic)
+            self._file.write(payload)
+            self.records += 1
+
+    def close(self):
+        with self._lock:
+            self._file.close()
+
+
+def read_capture(path, kinds=(MQTT, GTFS_RT)):
+    """Yield (kind, received, topic, payload) from a capture file."""
+    with gzip.open(path, "rb") as f:
+        while True:
+            header = f.read(RECORD.size)
+            if len(header) < RECORD.size:
+                return
+            kind, received, topic_len, payload_len = RECORD.unpack(header)
+            topic = f.read(topic_len).decode()
+            payload = f.read(payload_len)
+            if kind in kinds:
+                yield kind, received, topic, payload
+
+
+# -- pacing --
+
+class Pacer:
+    """
+    Maps capture time to wall time at `speed`x and sleeps until each record
+    is due. Tracks how far behind schedule the replay runs.
+    """
+
+    def __init__(self, speed):
+        self.speed = speed
+        self.origin = None
+        self.started = None
+        self.max_lag = 0.0
+
+    def wall_time(self, received):
+        """Replay wall clock time of a record received at `received`."""
+        if self.origin is None:
+            self.origin, self.started = received, time.time()
+        return self.started + (received - self.origin) / self.speed
+
+    def wait(self, received):
+        delay = self.wall_time(received) - time.time()
+        if delay > 0:
+            time.sleep(delay)
+        else:
+            self.max_lag = max(self.max_lag, -delay)
+
+
+def _loops(path, kinds, loop):
+    """Records of the capture, repeated `loop` times (0 = forever) on a continuous clock."""
+    iteration = 0
+    shift = 0.0
+    while True:
+        first = last = None
+        for kind, received, topic, payload in read_capture(path, kinds):
+            first = received if first is None else first
+            last = received
+            yield iteration, kind, received + shift, topic, payload
+        if first is None:
+            return
+        iteration += 1
+        if loop and iteration >= loop:
+            return
+        # Next pass starts one second after this one ended
+        shift += last - first + 1.0
+
+
+# -- HFP --
+
+def _parse_tst(value):
+    return datetime.fromisoformat(value.replace("Z", "+00:00"))
+
+
+def rewrite_hfp(topic, payload, copy, shift):
+    """
+    A copy of an HFP message with the vehicle number shifted by
+    `copy` * COPY_VEHICLE_OFFSET and tst/tsi moved by `shift` seconds.
+    """
+    message = json.loads(payload)
+    event = next(iter(message.values()), None)
+    if not isinstance(event, dict):
+        return topic, payload
+    if copy:
+        if event.get("veh") is not None:
+            event["veh"] = int(event["veh"]) + copy * COPY_VEHICLE_OFFSET
+        levels = topic.split("/")
+        if len(levels) > 8 and levels[8].isdigit():
+            levels[8] = f"{int(levels[8]) + copy * COPY_VEHICLE_OFFSET:05d}"
+            topic = "/".join(levels)
+    if shift:
+        if event.get("tst"):
+            tst = _parse_tst(event["tst"]) + timedelta(seconds=shift)
+            event["tst"] = tst.astimezone(timezone.utc).isoformat(timespec="milliseconds").replace("+00:00", "Z")
+        if event.get("tsi") is not None:
+            event["tsi"] = int(event["tsi"] + shift)
+    return topic, json.dumps(message, separators=(",", ":")).encode()
+
+
+def mqtt_client():
+    import paho.mqtt.client as mqtt
+    return mqtt.Client()
+
+
+def record_mqtt(args):
+    writer = CaptureWriter(args.output)
+    client = mqtt_client()
+
+    def on_connect(client, userdata, flags, rc):
+        client.subscribe(args.topic)
+        print(f"Recording {args.topic} from {args.broker}:{args.port}")
+
+    def on_message(client, userdata, msg):
+        writer.write(MQTT, time.time(), msg.topic, msg.payload)
+
+    client.on_connect = on_connect
+    client.on_message = on_message
+    client.connect(args.broker, args.port, 60)
+    client.loop_start()
+    try:
+        _wait(args.duration, lambda: f"{writer.records} messages")
+    finally:
+        client.loop_stop()
+        client.disconnect()
+        writer.close()
+    print(f"✅ {writer.records} messages written to {args.output}")
+
+
+def synthetic_messages(vehicle_count, interval, duration, seed=1):
+    """
+    Yield (received, topic, payload) of synthetic HFP traffic in arrival
+    order, ending now: every vehicle reports once per `interval` seconds.
+    """
+    rng = random.Random(seed)
+    vehicles = [
+        {
+            "oper": rng.choice([6, 12, 17, 18, 22, 47]),
+            "veh": number,
+            "route": rng.choice(["2551", "2550", "1020", "4615", "1054"]),
+            "dir": rng.choice(["1", "2"]),
+            "lat": rng.uniform(60.1, 60.4),
+            "long": rng.uniform(24.6, 25.2),
+            "odo": rng.randint(0, 40000),
+        }
+        for number in range(1, vehicle_count + 1)
+    ]
+    started = time.time() - duration
+    for step in range(int(duration / interval)):
+        messages = []
+        for vehicle in vehicles:
+            received = started + step * interval + rng.uniform(0, interval)
+            vehicle["lat"] += rng.uniform(-0.0003, 0.0003)
+            vehicle["long"] += rng.uniform(-0.0005, 0.0005)
+            vehicle["odo"] += rng.randint(0, 15)
+            tst = datetime.fromtimestamp(received, timezone.utc)
+            vp = {
+                "desi": vehicle["route"][1:], "dir": vehicle["dir"], "oper": vehicle["oper"],
+                "veh": vehicle["veh"], "tst": tst.isoformat(timespec="milliseconds").replace("+00:00", "Z"),
+                "tsi": int(received), "spd": round(rng.uniform(0, 20), 2), "hdg": rng.randint(0, 359),
+                "lat": round(vehicle["lat"], 6), "long": round(vehicle["long"], 6),
+                "acc": round(rng.uniform(-1.0, 1.0), 2), "dl": rng.randint(-120, 300),
+                "odo": vehicle["odo"], "drst": 0, "oday": tst.date().isoformat(), "jrn": 1,
+                "line": 1, "start": "10:00", "loc": "GPS", "stop": None,
+                "route": vehicle["route"], "occu": 0,
+            }
+            lat, lon = f"{vehicle['lat']:.3f}", f"{vehicle['long']:.3f}"
+            geohash = f"{lat[:2]};{lon[:2]}/" + "/".join(a + b for a, b in zip(lat[3:6], lon[3:6]))
+            topic = (f"/hfp/v2/journey/ongoing/vp/bus/{vehicle['oper']:04d}/{vehicle['veh']:05d}/"
+                     f"{vehicle['route']}/{vehicle['dir']}/Keskusta/10:00/1234567/4/{geohash}")
+            messages.append((received, topic, json.dumps({"VP": vp}, separators=(",", ":")).encode()))
+        yield from sorted(messages)
+
+
+def synthetic(args):
+    writer = CaptureWriter(args.output)
+    for received, topic, payload in synthetic_messages(args.vehicles, args.interval, args.duration, args.seed):
+        writer.write(MQTT, received, topic, payload)
+    writer.close()
+    print(f"✅ {writer.records} synthetic messages written to {args.output}")
+
+
+def replay_mqtt(args):
+    client = mqtt_client()
+    client.connect(args.broker, args.port, 60)
+    client.loop_start()
+
+    pacer = Pacer(args.speed)
+    published = reported = 0
+    last_report = time.monotonic()
+    try:
+        for iteration, _, received, topic, payload in _loops(args.capture, (MQTT,), args.loop):
+            pacer.wait(received)
+            shift = pacer.wall_time(received) - received if args.retime else 0.0
+            for copy in range(args.copies):
+                if copy or shift:
+                    out_topic, out_payload = rewrite_hfp(topic, payload, copy, shift)
+                else:
+                    out_topic, out_payload = topic, payload
+                client.publish(out_topic, out_payload, qos=0)
+                published += 1
+            now = time.monotonic()
+            if now - last_report >= 5:
+                print(f"  pass {iteration + 1}: {published} published, "
+                      f"{(published - reported) / (now - last_report):,.0f} msg/s, "
+                      f"max lag {pacer.max_lag:.2f}s")
+                reported, last_report = published, now
+    except KeyboardInterrupt:
+        pass
+    finally:
+        client.loop_stop()
+        client.disconnect()
+    elapsed = time.time() - (pacer.started or time.time())
+    print(f"✅ {published} messages published in {elapsed:.1f}s "
+          f"({published / max(elapsed, 1e-9):,.0f} msg/s, max lag {pacer.max_lag:.2f}s)")
+
+
+# -- GTFS-RT --
+
+def record_gtfsrt(args):
+    import requests
+
+    writer = CaptureWriter(args.output)
+    try:
+        for path in args.from_file or []:
+            with open(path, "rb") as f:
+                writer.write(GTFS_RT, os.path.getmtime(path), args.url, f.read())
+        if args.from_file:
+            return
+
+        session = requests.Session()
+        last_digest = None
+        deadline = time.monotonic() + args.duration if args.duration else None
+        while deadline is None or time.monotonic() < deadline:
+            started = time.monotonic()
+            try:
+                response = session.get(args.url, timeout=10)
+                response.raise_for_status()
+                digest = hashlib.sha256(response.content).digest()
+                if digest != last_digest:
+                    last_digest = digest
+                    writer.write(GTFS_RT, time.time(), args.url, response.content)
+                    print(f"  snapshot {writer.records}: {len(response.content)} bytes")
+            except Exception as e:
+                print(f"Error during fetch: {e}")
+            time.sleep(max(args.interval - (time.monotonic() - started), 0))
+    except KeyboardInterrupt:
+        pass
+    finally:
+        writer.close()
+        print(f"✅ {writer.records} snapshots written to {args.output}")
+
+
+def rewrite_feed(content, copies, shift):
+    """A GTFS-RT FeedMessage with every vehicle copied and its timestamps moved by `shift`."""
+    from google.transit import gtfs_realtime_pb2
+
+    feed = gtfs_realtime_pb2.FeedMessage()
+    feed.ParseFromString(content)
+    shift = int(shift)
+    if feed.header.timestamp:
+        feed.header.timestamp += shift
+    originals = list(feed.entity)
+    for entity in originals:
+        if entity.HasField("vehicle") and entity.vehicle.timestamp:
+            entity.vehicle.timestamp += shift
+    for copy in range(1, copies):
+        for entity in originals:
+            clone = feed.entity.add()
+            clone.CopyFrom(entity)
+            clone.id = f"{entity.id}-{copy}"
+            if clone.HasField("vehicle"):
+                clone.vehicle.vehicle.id = f"{entity.vehicle.vehicle.id}-{copy}"
+    return feed.SerializeToString()
+
+
+def serve_gtfsrt(args):
+    snapshots = [(received, payload) for _, received, _, payload in read_capture(args.capture, (GTFS_RT,))]
+    if not snapshots:
+        sys.exit(f"No GTFS-RT snapshots in {args.capture}")
+    origin, span = snapshots[0][0], snapshots[-1][0] - snapshots[0][0]
+    started = time.time()
+    cache = {}
+    lock = threading.Lock()
+
+    def current():
+        """(etag, body) of the snapshot due now on the replay clock."""
+        elapsed = (time.time() - started) * args.speed
+        iteration, offset = 0, elapsed
+        if span > 0 and args.loop:
+            iteration, offset = divmod(elapsed, span + 1.0)
+        index = max(i for i, (received, _) in enumerate(snapshots) if received - origin <= offset or i == 0)
+        key = (int(iteration), index)
+        with lock:
+            if key not in cache:
+                received, payload = snapshots[index]
+                if args.retime or args.copies > 1:
+                    shift = started + (received - origin + iteration * (span + 1.0)) / args.speed - received
+                    payload = rewrite_feed(payload, args.copies, shift if args.retime else 0)
+                cache.clear()
+                cache[key] = (f'"{key[0]}-{key[1]}"', payload)
+            return cache[key]
+
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            etag, body = current()
+            if self.headers.get("If-None-Match") == etag:
+                self.send_response(304)
+                self.send_header("ETag", etag)
+                self.end_headers()
+                return
+            self.send_response(200)
+            self.send_header("Content-Type", "application/x-protobuf")
+            self.send_header("Content-Length", str(len(body)))
+            self.send_header("ETag", etag)
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            pass
+
+    server = ThreadingHTTPServer(("", args.port), Handler)
+    print(f"Serving {len(snapshots)} snapshots ({span:.0f}s of feed) on :{args.port} at {args.speed}x")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+
+# -- misc --
+
+def info(args):
+    counts, sizes, first, last = {}, {}, None, None
+    for kind, received, topic, payload in read_capture(args.capture):
+        counts[kind] = counts.get(kind, 0) + 1
+        sizes[kind] = sizes.get(kind, 0) + len(payload)
+        first = received if first is None else min(first, received)
+        last = received if last is None else max(last, received)
+    if first is None:
+        print("Empty capture")
+        return
+    span = last - first
+    print(f"{args.capture}: {os.path.getsize(args.capture) / 1e6:.1f} MB on disk, {span:.0f}s of traffic")
+    for kind, name in ((MQTT, "MQTT messages"), (GTFS_RT, "GTFS-RT snapshots")):
+        if kind in counts:
+            # Under a second (e.g. a single snapshot) gives no meaningful rate
+            rate = f"{counts[kind] / span:,.1f}/s" if span >= 1 else "n/a"
+            print(f"  {name}: {counts[kind]} ({rate}, {sizes[kind] / 1e6:.1f} MB raw)")
+
+
+def _wait(duration, status):
+    deadline = time.monotonic() + duration if duration else None
+    try:
+        while deadline is None or time.monotonic() < deadline:
+            time.sleep(5)
+            print(f"  {status()}")
+    except KeyboardInterrupt:
+        pass
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    p = commands.add_parser("record-mqtt", help="record HFP messages")
+    p.add_argument("-o", "--output", required=True)
+    p.add_argument("--broker", default="mqtt.hsl.fi")
+    p.add_argument("--port", type=int, default=1883)
+    p.add_argument("--topic", default=HFP_TOPIC)
+    p.add_argument("--duration", type=float, default=0, help="seconds, 0 = until Ctrl-C")
+    p.set_defaults(func=record_mqtt)
+
+    p = commands.add_parser("record-gtfsrt", help="record GTFS-RT vehicle position snapshots")
+    p.add_argument("-o", "--output", required=True)
+    p.add_argument("--url", default=GTFS_VEHICLE_URL)
+    p.add_argument("--interval", type=float, default=5.0)
+    p.add_argument("--duration", type=float, default=0, help="seconds, 0 = until Ctrl-C")
+    p.add_argument("--from-file", nargs="+", help="import saved FeedMessage files instead of polling")
+    p.set_defaults(func=record_gtfsrt)
+
+    p = commands.add_parser("synthetic", help="generate a capture of synthetic HFP traffic")
+    p.add_argument("-o", "--output", required=True)
+    p.add_argument("--vehicles", type=int, default=1500)
+    p.add_argument("--interval", type=float, default=1.0, help="seconds between reports of one vehicle")
+    p.add_argument("--duration", type=float, default=300)
+    p.add_argument("--seed", type=int, default=1)
+    p.set_defaults(func=synthetic)
+
+    p = commands.add_parser("replay-mqtt", help="publish a capture's HFP messages to a broker")
+    p.add_argument("capture")
+    p.add_argument("--broker", default="localhost")
+    p.add_argument("--port", type=int, default=1883)
+    p.add_argument("--speed", type=float, default=1.0)
+    p.add_argument("--copies", type=int, default=1)
+    p.add_argument("--retime", action="store_true")
+    p.add_argument("--loop", type=int, default=1, help="passes over the capture, 0 = forever")
+    p.set_defaults(func=replay_mqtt)
+
+    p = commands.add_parser("serve-gtfsrt", help="serve a capture's GTFS-RT snapshots over HTTP")
+    p.add_argument("capture")
+    p.add_argument("--port", type=int, default=8080)
+    p.add_argument("--speed", type=float, default=1.0)
+    p.add_argument("--copies", type=int, default=1)
+    p.add_argument("--retime", action="store_true")
+    p.add_argument("--loop", action="store_true")
+    p.set_defaults(func=serve_gtfsrt)
+
+    p = commands.add_parser("info", help="summarize a capture")
+    p.add_argument("capture")
+    p.set_defaults(func=info)
+
+    args = parser.parse_args()
+    args.func(args)
+
+
+if __name__ == "__main__":
+    main()